@@ -1,16 +1,26 @@
 class AddressBookIterator:
-    def __init__(self, address_book, chunk_size=1):
+    """Iterates over an AddressBook in chunks without copying it.
+
+    After each chunk `cursor` holds the sequence number of the last record
+    returned; a new iterator created with that cursor continues from there,
+    even if records were added or deleted in the meantime.
+    """
+
+    def __init__(self, address_book, chunk_size=1, cursor=None):
         self.address_book = address_book
         self.chunk_size = chunk_size
-        self.records = list(address_book.values())
-        self.index = 0
+        self.cursor = cursor
 
     def __iter__(self):
         return self
 
     def __next__(self):
-        if self.index >= len(self.records):
+        chunk = []
+        for seq, record in self.address_book.records_after(self.cursor):
+            chunk.append(record)
+            self.cursor = seq
+            if len(chunk) == self.chunk_size:
+                break
+        if not chunk:
             raise StopIteration
-        chunk = self.records[self.index:self.index + self.chunk_size]
-        self.index += self.chunk_size
-        return chunk
\ No newline at end of file
+        return chunk
@@ -1,10 +1,62 @@
+from bisect import bisect_right
 from collections import UserDict
+from operator import itemgetter
 from classRecord import Record
 from addressBookIterator import AddressBookIterator
 
 
 class AddressBook(UserDict):
-    """A class representing an address book that stores records."""
+    """A class representing an address book that stores records.
+
+    Besides the dict of records, the book numbers the names in the order they
+    were added and keeps an append-only list of (number, name) pairs, so the
+    records can be paged with a cursor (the number of the last record shown)
+    without copying the whole book, even if it changes between the pages.
+    """
+
+    def __init__(self, *args, **kwargs):
+        # name -> sequence number, and the (sequence number, name) log in insertion order;
+        # entries of deleted names stay in the log until it is compacted
+        self._seq = {}
+        self._order = []
+        self._next_seq = 0
+        super().__init__(*args, **kwargs)
+
+    def __setitem__(self, name, record):
+        if name not in self._seq:
+            self._seq[name] = self._next_seq
+            self._order.append((self._next_seq, name))
+            self._next_seq += 1
+        self.data[name] = record
+
+    def __delitem__(self, name):
+        del self.data[name]
+        del self._seq[name]
+        if len(self._order) > 2 * len(self._seq) + 64:
+            # Mostly deleted names; cursors hold numbers, not positions, so they survive this
+            self._order = [(seq, n) for seq, n in self._order if self._seq.get(n) == seq]
+
+    def records_after(self, cursor=None):
+        """Iterate over (sequence number, record) pairs in insertion order.
+
+        Each step finds its place in the log by binary search, so records
+        added or deleted during the iteration don't break it: deleted records
+        are skipped and new ones come at the end.
+
+        Args:
+            cursor (int, optional): Start after the record with this number.
+
+        Yields:
+            tuple: (sequence number, Record) pairs.
+        """
+        seq = -1 if cursor is None else cursor
+        while True:
+            i = bisect_right(self._order, seq, key=itemgetter(0))
+            if i == len(self._order):
+                return
+            seq, name = self._order[i]
+            if self._seq.get(name) == seq:
+                yield seq, self.data[name]
 
     def add_record(self, record):
         """Add a record to the address book.
@@ -17,7 +69,7 @@ class AddressBook(UserDict):
         """
         if not isinstance(record, Record):
             record = Record(record)
-        self.data[record.name.value] = record
+        self[record.name.value] = record
 
     def find(self, name):
         """Find a record by name.
@@ -43,7 +95,7 @@ class AddressBook(UserDict):
             None
         """
         if name in self.data:
-            del self.data[name]
+            del self[name]
 
     def get_records(self):
         """Return a list of all records in the address book.
@@ -60,18 +112,15 @@ class AddressBook(UserDict):
         """
         return '\n'.join([str(r) for r in self.values()])
 
-    def iterator(self, chunk_size=1):
+    def iterator(self, chunk_size=1, cursor=None):
         """Iterate over records in the address book in chunks.
 
         Args:
             chunk_size (int): The number of records to yield in each iteration.
+            cursor (int, optional): Continue where an earlier iterator stopped
+                (its `cursor` attribute).
 
         Yields:
             list: A list of records.
         """
-        # records = list(self.values())
-        # i = 0
-        # while i < len(records):
-        #     yield records[i:i + chunk_size]
-        #     i += chunk_size
-        return AddressBookIterator(self.data, chunk_size)
\ No newline at end of file
+        return AddressBookIterator(self, chunk_size, cursor)
@@ -1,6 +1,19 @@
-from collections import UserDict
-import json
+from collections import UserDict, deque
+from contextlib import contextmanager
+import os
+import sys
+from itertools import islice
+from datetime import date
 from Classes.Record import Record
+from Classes.AddressBookSnapshot import AddressBookSnapshot, chunked
+from Utils.persistent_tree import PersistentSortedMap
+from Utils.lru_cache import LRUCache
+from Utils.collation import SORT_KEYS, is_valid_key
+from Utils.cursor import encode_cursor, decode_cursor
+from Utils.compression import dump_json, load_json
+from Utils.sharding import (is_sharded, shard_of, load_shards, save_shards, read_manifest, new_manifest,
+                            SHARDS_SUFFIX)
+from Utils.blocks import is_blocks, dump_blocks, load_blocks
 
 RED = "\033[91m"
 GREEN = "\033[92m"
@@ -10,8 +23,85 @@ PINK = "\033[95m"
 RESET = "\033[0m"
 
 
+class ChangesExpiredError(ValueError):
+    """`changes_since` was asked for changes older than the change feed keeps.
+
+    The consumer has to read the whole book again; `oldest_version` is the
+    oldest version the feed can still answer for. Also raised for a version
+    of another epoch (see `AddressBook.epoch`).
+    """
+
+    def __init__(self, version, oldest_version, message=None):
+        super().__init__(message or f"Changes since version {version} are no longer kept "
+                                    f"(the oldest version available is {oldest_version})")
+        self.version = version
+        self.oldest_version = oldest_version
+
+
 class AddressBook(UserDict):
-    """A class representing an address book that stores records."""
+    """A class representing an address book that stores records.
+
+    Besides the live dict of records, the book keeps a versioned copy of its
+    contents in persistent trees (multi-version concurrency control). Every
+    mutation publishes the new state of the changed record only, so it costs
+    O(log N), and `snapshot()` hands readers a stable version in O(1).
+    `find`, `iterator` and `save_to_file` run against such a snapshot.
+
+    Results of `find` and `upcoming_birthdays` are kept in a bounded LRU
+    cache tagged with the version they were computed for; since every
+    mutation bumps `version`, a change of the book invalidates them all.
+
+    Sorted orders of `iterator` (see Utils.collation) are persistent trees
+    keyed by collation keys. A view is built on first use and from then on
+    kept up to date by every mutation in O(log N), so a sorted page costs
+    O(log N + page) instead of sorting the whole book.
+    """
+
+    # How many query results the cache keeps
+    QUERY_CACHE_SIZE = 128
+    # Processes used to load and save a sharded book and to check a block file; None means one per CPU
+    SHARD_WORKERS = None
+    # How many steps `undo` can go back
+    UNDO_LIMIT = 1000
+    # How many changes `changes_since` can go back
+    CHANGE_FEED_LIMIT = 10_000
+
+    def __init__(self, *args, **kwargs):
+        self._names = PersistentSortedMap()
+        self._records = PersistentSortedMap()
+        self._next_seq = 0
+        self.version = 0
+        # Phone number -> owner name, or a list of names if several contacts share it
+        self._phone_index = {}
+        self._query_cache = LRUCache(self.QUERY_CACHE_SIZE)
+        # Sort name -> PersistentSortedMap of collation key -> FrozenRecord, built on demand
+        self._views = {}
+        # Manifest and directory of the sharded file the book was loaded from or saved to,
+        # and the shards changed since then
+        self._shards = None
+        self._shards_dir = None
+        self._dirty_shards = set()
+        # Damaged blocks of the block file the book was loaded from, left out of it (Utils.blocks)
+        self.quarantined = []
+        # (name, error) of the entries of the loaded file that aren't valid records, left out of the book
+        self.rejected = []
+        # Undo log: steps of (label, [(name, before, after), ...]) with frozen states,
+        # which share everything with the version trees, so a step costs only its changes
+        self._undo = deque(maxlen=self.UNDO_LIMIT)
+        self._redo = []
+        self._undo_group = None
+        self._undo_depth = 0
+        self._restoring = False
+        # (label, undo log, redo log, snapshot) from before `begin`, while a transaction is open
+        self._txn = None
+        # Change feed: (version, name, before, after) of the latest changes, and the
+        # version since which it has all of them
+        self._feed = deque()
+        self._feed_since = 0
+        # Versions count from 0 in every book object (every load of a file), so a
+        # version only means something together with the epoch of the object
+        self.epoch = os.urandom(4).hex()
+        super().__init__(*args, **kwargs)
 
     def add_record(self, record):
         """Add a record to the address book.
@@ -24,7 +114,417 @@ class AddressBook(UserDict):
         """
         if not isinstance(record, Record):
             record = Record(record)
-        self.data[record.name.value] = record
+        self._put(record.name.value, record)
+
+    def __setitem__(self, name, record):
+        self._put(name, record)
+
+    def __delitem__(self, name):
+        self._remove(name)
+
+    def _put(self, name, record):
+        """Store `record` under `name` and publish its state."""
+        old = self.data.get(name)
+        if old is not None and old is not record and old._book is self:
+            old._book = None
+        self.data[name] = record
+        record._book = self
+        self._publish(name, record.freeze())
+
+    def _remove(self, name):
+        """Delete `name` and publish the deletion."""
+        record = self.data.pop(name)
+        if record._book is self:
+            record._book = None
+        self._publish(name, None)
+
+    def _load_records(self, records):
+        """Fill an empty book with `records`.
+
+        Builds the version trees in O(N) in one go (plus a sort of the names)
+        instead of inserting the records one at a time, which makes loading
+        a big file several times faster than calling `add_record` in a loop.
+
+        Args:
+            records (iterable of Record): The records, in insertion order.
+
+        Returns:
+            None
+        """
+        for record in records:
+            self.data[record.name.value] = record
+        items = list(self.data.items())
+        states = []
+        for name, record in items:
+            record._book = self
+            state = record.freeze()
+            states.append(state)
+            self._update_indexes(name, None, state)
+        self._records = PersistentSortedMap.from_sorted(enumerate(states))
+        self._names = PersistentSortedMap.from_sorted(
+            sorted((name, seq) for seq, (name, _) in enumerate(items)))
+        self._next_seq = len(items)
+        self.version += 1
+        # The loaded records are not in the change feed
+        self._feed.clear()
+        self._feed_since = self.version
+
+    def _record_changed(self, record):
+        """Called by a Record that belongs to this book after each change."""
+        name = record.name.value
+        if self.data.get(name) is record:
+            self._publish(name, record.freeze())
+
+    def _publish(self, name, state):
+        """Make `state` (a FrozenRecord, or None for a deletion) the current version of `name`."""
+        seq = self._names.get(name)
+        before = None if seq is None else self._records[seq]
+        if state is None:
+            self._names = self._names.delete(name)
+            self._records = self._records.delete(seq)
+        else:
+            if seq is None:
+                seq = self._next_seq
+                self._next_seq += 1
+                self._names = self._names.set(name, seq)
+            self._records = self._records.set(seq, state)
+        self.version += 1
+        self._update_indexes(name, before, state)
+        self._log_change(name, before, state)
+        self._feed.append((self.version, name, before, state))
+        while len(self._feed) > self.CHANGE_FEED_LIMIT:
+            self._feed_since = self._feed.popleft()[0]
+
+    def changes_since(self, version, epoch=None, until=None):
+        """Return what changed after `version`, for consumers that poll for deltas.
+
+        Every change of the book increases `version` by one. Several changes
+        of one contact are merged into one entry relative to the state at
+        `version`, so a contact added and deleted in between, or changed and
+        changed back, is not reported.
+        The changes of an open transaction are not reported before it is
+        committed: the feed stops at the version the transaction began at.
+        The cost is O(changes since `version`).
+
+        Args:
+            version (int): The `version` the consumer saw last; 0 for a new book.
+            epoch (str, optional): The `epoch` of the book the consumer saw
+                `version` of. Consumers that keep a version beyond the life of
+                the book object (e.g. across restarts) must pass it; a version
+                of another epoch can't be answered. None means this epoch.
+            until (int, optional): Leave out the changes after this version
+                (e.g. to tell the changes of one command from the next).
+
+        Returns:
+            tuple: (current version, list of (kind, name, FrozenRecord or None))
+            with kind "add", "update" or "delete", in the order of the last
+            change of each contact. Pass the version to the next call.
+
+        Raises:
+            ChangesExpiredError: If the feed doesn't reach back to `version`
+                (see CHANGE_FEED_LIMIT), e.g. because the book was loaded after
+                it, or `epoch` is not the book's.
+            ValueError: If `version` or `until` is newer than the book.
+        """
+        if epoch is not None and epoch != self.epoch:
+            raise ChangesExpiredError(version, self._feed_since,
+                                      f"Version {version} is of another epoch ({epoch}) than the book ({self.epoch})")
+        # Not self.committed_snapshot(): a subclass may take a lock this call already holds
+        current = self._txn[3].version if self._txn is not None else self.version
+        if until is not None:
+            if until > current:
+                raise ValueError(f"Version {until} is newer than the book (version {current})")
+            current = until
+        if version > current:
+            raise ValueError(f"Version {version} is newer than the book (version {current})")
+        if version < self._feed_since:
+            raise ChangesExpiredError(version, self._feed_since)
+        first_before = {}
+        last_after = {}
+        for change_version, name, before, after in reversed(self._feed):
+            if change_version <= version:
+                break
+            if change_version > current:
+                continue
+            # Walking backwards: the earliest change of a name is seen last
+            first_before[name] = before
+            last_after.setdefault(name, after)
+        changes = []
+        for name, after in reversed(last_after.items()):
+            before = first_before[name]
+            if self._same_state(before, after):
+                continue
+            kind = "add" if before is None else "delete" if after is None else "update"
+            changes.append((kind, name, after))
+        return current, changes
+
+    @classmethod
+    def _same_state(cls, before, after):
+        """Return True if two states (FrozenRecord or None) hold the same contact data."""
+        if before is None or after is None:
+            return before is after
+        return cls._record_to_data(before) == cls._record_to_data(after)
+
+    def _log_change(self, name, before, after):
+        """Remember a change for `undo`, in the open `undoable` step or as a step of its own."""
+        if self._restoring:
+            return
+        self._redo.clear()
+        if self._undo_group is not None:
+            self._undo_group.append((name, before, after))
+        else:
+            self._undo.append((f"change {name}", [(name, before, after)]))
+
+    @contextmanager
+    def undoable(self, label):
+        """Group the changes made inside the block into one step of `undo`.
+
+        Blocks can be nested; the outermost one makes the step. A block
+        that changes nothing adds no step.
+
+        Args:
+            label (str): How `history` shows the step, e.g. the command.
+        """
+        if self._undo_depth == 0:
+            self._undo_group = []
+        self._undo_depth += 1
+        try:
+            yield
+        finally:
+            self._undo_depth -= 1
+            if self._undo_depth == 0:
+                group, self._undo_group = self._undo_group, None
+                if group:
+                    self._undo.append((label, group))
+
+    def undo(self):
+        """Revert the last step.
+
+        Returns:
+            str or None: Label of the reverted step, None if there is nothing to undo.
+        """
+        if not self._undo:
+            return None
+        label, changes = self._undo.pop()
+        self._restore((name, before) for name, before, _ in reversed(changes))
+        self._redo.append((label, changes))
+        return label
+
+    def redo(self):
+        """Apply the last undone step again.
+
+        Returns:
+            str or None: Label of the step, None if there is nothing to redo.
+        """
+        if not self._redo:
+            return None
+        label, changes = self._redo.pop()
+        self._restore((name, after) for name, _, after in changes)
+        self._undo.append((label, changes))
+        return label
+
+    def _restore(self, states):
+        """Put the given (name, FrozenRecord or None) states back without logging them."""
+        self._restoring = True
+        try:
+            for name, state in states:
+                if state is None:
+                    if name in self.data:
+                        self._remove(name)
+                else:
+                    self._put(name, state.thaw())
+        finally:
+            self._restoring = False
+
+    @property
+    def in_transaction(self):
+        return self._txn is not None
+
+    def begin(self, label="transaction"):
+        """Open a transaction: the following changes can be rolled back together.
+
+        While it is open, `undo` and `redo` work within the transaction.
+
+        Args:
+            label (str): How `history` shows the committed transaction.
+
+        Raises:
+            ValueError: If a transaction is already open.
+        """
+        if self._txn is not None:
+            raise ValueError("A transaction is already open")
+        # Not self.snapshot(): a subclass may take a lock `begin` already holds
+        self._txn = (label, self._undo, self._redo, AddressBookSnapshot(self._names, self._records, self.version))
+        # Not bounded: rollback must be able to revert every change
+        self._undo = deque()
+        self._redo = []
+
+    def commit(self):
+        """Close the transaction and keep its changes as one step of `undo`.
+
+        Returns:
+            int: Number of changes in the transaction.
+
+        Raises:
+            ValueError: If no transaction is open.
+        """
+        if self._txn is None:
+            raise ValueError("No open transaction")
+        label, undo, redo, _ = self._txn
+        steps = list(self._undo)
+        changes = [change for _, step_changes in steps for change in step_changes]
+        self._txn = None
+        self._undo, self._redo = undo, redo
+        if changes:
+            labels = [step_label for step_label, _ in steps]
+            summary = "; ".join(labels[:3]) + ("; ..." if len(labels) > 3 else "")
+            self._undo.append((f"{label}: {summary}", changes))
+            self._redo.clear()
+        return len(changes)
+
+    def rollback(self):
+        """Close the transaction and revert all its changes, in O(number of changes).
+
+        Returns:
+            int: Number of changes reverted.
+
+        Raises:
+            ValueError: If no transaction is open.
+        """
+        if self._txn is None:
+            raise ValueError("No open transaction")
+        _, undo, redo, _ = self._txn
+        changes = [change for _, step_changes in self._undo for change in step_changes]
+        self._restore((name, before) for name, before, _ in reversed(changes))
+        self._txn = None
+        self._undo, self._redo = undo, redo
+        return len(changes)
+
+    @contextmanager
+    def transaction(self, label="transaction", save_to=None):
+        """Make the changes of a block atomic: all are kept, or all rolled back on an exception.
+
+            with book.transaction(save_to="outputs/address_book.json"):
+                book.find_name("Ann").edit_phone("0501234567", "0507654321")
+                book.find_name("Ann").edit_birthday("1990-05-05")
+
+        Args:
+            label (str): How `history` shows the transaction.
+            save_to (str, optional): Save the book to this file once, after the commit.
+        """
+        self.begin(label)
+        try:
+            yield self
+        except BaseException:
+            self.rollback()
+            raise
+        self.commit()
+        if save_to:
+            self.save_to_file(save_to)
+
+    def history(self, limit=10):
+        """Return the labels of the steps `undo` and `redo` would take, the nearest first.
+
+        Args:
+            limit (int): Maximum number of labels of each kind.
+
+        Returns:
+            tuple: (list of undo labels, list of redo labels).
+        """
+        undo = [label for label, _ in islice(reversed(self._undo), limit)]
+        redo = [label for label, _ in islice(reversed(self._redo), limit)]
+        return undo, redo
+
+    def _update_indexes(self, name, before, after):
+        """Update the derived lookup structures after `name` changed from `before` to `after`.
+
+        Args:
+            name (str): The contact name.
+            before (FrozenRecord or None): Previous state, None if the record is new.
+            after (FrozenRecord or None): New state, None if the record was deleted.
+
+        Returns:
+            None
+        """
+        old_phones = set(before.get_all_phones()) if before is not None else set()
+        new_phones = set(after.get_all_phones()) if after is not None else set()
+        for phone in old_phones - new_phones:
+            self._unindex_phone(phone, name)
+        for phone in new_phones - old_phones:
+            self._index_phone(phone, name)
+        if self._shards is not None:
+            self._dirty_shards.add(shard_of(name, self._shards["shards"]))
+        for sort, view in self._views.items():
+            key = SORT_KEYS[sort]
+            if before is not None:
+                view = view.delete(key(before))
+            if after is not None:
+                view = view.set(key(after), after)
+            self._views[sort] = view
+
+    def _index_phone(self, phone, name):
+        owners = self._phone_index.get(phone)
+        if owners is None:
+            self._phone_index[phone] = name
+        elif isinstance(owners, list):
+            owners.append(name)
+        else:
+            self._phone_index[phone] = [owners, name]
+
+    def _unindex_phone(self, phone, name):
+        owners = self._phone_index.get(phone)
+        if owners == name:
+            del self._phone_index[phone]
+        elif isinstance(owners, list):
+            owners.remove(name)
+            if len(owners) == 1:
+                self._phone_index[phone] = owners[0]
+
+    def estimate_memory(self, sample=256):
+        """Estimate how many bytes the book takes, from a sample of its records.
+
+        Counts the live records, their frozen versions, the nodes of both
+        version trees and the phone index. Interned phones and birthdays are
+        shared by every book in the process, so they are not counted.
+
+        Args:
+            sample (int): How many records to measure.
+
+        Returns:
+            int: The estimate in bytes.
+        """
+        total = sys.getsizeof(self.data) + sys.getsizeof(self._phone_index)
+        records = list(islice(self.data.values(), sample))
+        if not records:
+            return total
+        snapshot = self.snapshot()
+        node = sys.getsizeof(self._records._root) if self._records else 0
+        per_record = 0
+        for record in records:
+            frozen = snapshot.find_name(record.name.value)
+            per_record += (sys.getsizeof(record) + sys.getsizeof(record.__dict__) + sys.getsizeof(record.name)
+                           + sys.getsizeof(record.name.value) + sys.getsizeof(record.phones) + 2 * node)
+            if frozen is not None:
+                per_record += sys.getsizeof(frozen) + sys.getsizeof(frozen.__dict__) + sys.getsizeof(frozen.phones)
+        return total + per_record * len(self.data) // len(records)
+
+    def snapshot(self):
+        """Return a consistent read-only version of the book.
+
+        Returns:
+            AddressBookSnapshot: The current version; O(1), nothing is copied.
+        """
+        return AddressBookSnapshot(self._names, self._records, self.version)
+
+    def committed_snapshot(self):
+        """Like `snapshot`, but without the changes of an open transaction.
+
+        Returns:
+            AddressBookSnapshot: The version the transaction began at, or the current one.
+        """
+        if self._txn is not None:
+            return self._txn[3]
+        return AddressBookSnapshot(self._names, self._records, self.version)
 
     def find_name(self, name):
         """Find a record by name.
@@ -40,6 +540,38 @@ class AddressBook(UserDict):
         else:
             return None
 
+    def lookup_phone(self, number):
+        """Find the contact that owns an exact phone number (caller ID).
+
+        The lookup uses a hash index that every change of the book keeps up
+        to date, so it is O(1) regardless of the size of the book.
+
+        Args:
+            number (str): The phone number, digits only.
+
+        Returns:
+            Record or None: The owner (the first one, if the number is shared),
+            or None if nobody has this number.
+        """
+        owners = self._phone_index.get(number)
+        if owners is None:
+            return None
+        return self.data[owners if isinstance(owners, str) else owners[0]]
+
+    def phone_owners(self, number):
+        """Return the names of all contacts that have an exact phone number.
+
+        Args:
+            number (str): The phone number, digits only.
+
+        Returns:
+            list of str: The owners, in the order they got the number.
+        """
+        owners = self._phone_index.get(number)
+        if owners is None:
+            return []
+        return [owners] if isinstance(owners, str) else list(owners)
+
     def delete(self, name):
         """Delete a record by name.
 
@@ -50,14 +582,14 @@ class AddressBook(UserDict):
             None
         """
         if name in self.data:
-            del self.data[name]
+            self._remove(name)
 
     def get_records(self):
         """Return a list of all records in the address book.
 
         Returns:
             list: A list of records."""
-        return list(self.values())
+        return list(self.data.values())
 
     def __str__(self):
         """Return a string representation of the address book.
@@ -65,86 +597,430 @@ class AddressBook(UserDict):
         Returns:
             str: A string representation of the address book.
         """
-        return '\n'.join([str(r) for r in self.values()])
+        return '\n'.join([str(r) for r in self.data.values()])
 
-    def iterator(self, chunk_size=1):
+    def iterator(self, chunk_size=1, sort=None):
         """Iterate over records in the address book in chunks.
 
+        The records come from a snapshot taken when the iterator is created,
+        so edits made while the caller consumes chunks don't affect it.
+
         Args:
             chunk_size (int): The number of records to yield in each iteration.
+            sort (str, optional): One of SORT_KEYS ("name", "birthday",
+                "next-birthday", "phone"); insertion order if omitted.
+                "next-birthday" starts with the nearest birthday from today
+                and wraps around the end of the year.
 
         Yields:
             list: A list of records.
+
+        Raises:
+            ValueError: If `sort` is not a known order.
+        """
+        if sort is None:
+            return self.snapshot().iterator(chunk_size)
+        return chunked((record for _, record in self._ordered(sort)), chunk_size)
+
+    def page(self, cursor=None, limit=20, sort=None):
+        """Return one page of records and the cursor of the next one (keyset pagination).
+
+        The cursor holds the key of the last record returned rather than an
+        offset, so a page is found in O(log N + limit) and paging stays
+        well-defined while records are added or deleted in between: nothing
+        is returned twice, deleted records are skipped and new records show
+        up if their key is after the cursor (in insertion order, always).
+
+        Args:
+            cursor (str, optional): `next_cursor` of the previous page; it
+                remembers the order, so `sort` is ignored when it is given.
+            limit (int): Maximum number of records on the page.
+            sort (str, optional): Order of the first page, see `iterator`.
+
+        Returns:
+            tuple: (list of FrozenRecord, next cursor or None after the last page).
+
+        Raises:
+            ValueError: If the cursor or the order is not valid.
         """
-        records = list(self.values())
-        i = 0
-        while i < len(records):
-            yield records[i:i + chunk_size]
-            i += chunk_size
+        after = anchor = None
+        if cursor is not None:
+            sort, after, anchor = decode_cursor(cursor)
+            # A forged or stale key would fail when compared with the keys of the view
+            if not is_valid_key(sort, after) or not (anchor is None or isinstance(anchor, str)):
+                raise ValueError(f"Invalid cursor '{cursor}'")
+        if sort == "next-birthday" and anchor is None:
+            # Pin the day the listing started on, so it doesn't shift at midnight
+            anchor = date.today().strftime("%m-%d")
+        records = []
+        last = None
+        for key, record in self._ordered(sort, after, anchor):
+            if len(records) == limit:
+                # There is at least one more record, so there is a next page
+                return records, encode_cursor(sort, last, anchor)
+            records.append(record)
+            last = key
+        return records, None
+
+    def _ordered(self, sort, after=None, anchor=None):
+        """Yield (key, record) pairs in the order `sort`, starting after the key `after`."""
+        if sort is None:
+            return self.snapshot().entries(after)
+        view = self.sorted_view(sort)
+        if sort == "next-birthday":
+            return self._from_today(view, anchor or date.today().strftime("%m-%d"), after)
+        return view.items(after, inclusive=after is None)
+
+    def sorted_view(self, sort):
+        """Return the records in the order `sort`, building the view on first use.
+
+        Args:
+            sort (str): One of SORT_KEYS.
+
+        Returns:
+            PersistentSortedMap: Collation key -> FrozenRecord. It is immutable,
+            so later edits of the book don't affect the returned view.
+
+        Raises:
+            ValueError: If `sort` is not a known order.
+        """
+        if sort not in SORT_KEYS:
+            raise ValueError(f"Unknown sort order '{sort}', use one of: {', '.join(SORT_KEYS)}")
+        view = self._views.get(sort)
+        if view is None:
+            key = SORT_KEYS[sort]
+            view = PersistentSortedMap.from_sorted(
+                sorted((key(record), record) for record in self._records.values()))
+            self._views[sort] = view
+        return view
+
+    @staticmethod
+    def _from_today(view, today, after=None):
+        """Read a "next-birthday" view from the day `today` ("MM-DD"), wrapping around the year.
+
+        Yields:
+            tuple: (key, record) pairs, starting after the key `after` if given.
+        """
+        start = (0, today)
+        # [from, to) key ranges in reading order: the rest of the year, its
+        # beginning, then the contacts without a birthday
+        ranges = [(start, (1,)), ((0,), start), ((1,), None)]
+        if after is not None:
+            ranges = ranges[0 if start <= after < (1,) else 1 if after < start else 2:]
+            ranges[0] = (after, ranges[0][1])
+        for i, (low, high) in enumerate(ranges):
+            for key, record in view.items(low, inclusive=after is None or i > 0):
+                if high is not None and key >= high:
+                    break
+                yield key, record
 
     @staticmethod
     def convert_to_serializable(address_book):
         """Converts the AddressBook object to a serializable format.
 
             Args:
-                address_book (AddressBook): The AddressBook object to convert.
+                address_book (AddressBook): The AddressBook object (or a snapshot of it) to convert.
 
             Returns:
                 dict: A dictionary containing the serialized data.
             """
         serializable_data = {}
-        for key, record in address_book.items():
-            serializable_data[key] = {
-                "name": record.name.value,
-                "phones": record.get_all_phones(),
-                "birthday": str(record.birthday) if record.birthday else None
-            }
+        for key, record in address_book.snapshot().items():
+            serializable_data[key] = AddressBook._record_to_data(record)
         return serializable_data
 
+    @staticmethod
+    def _record_to_data(record):
+        """Return one entry of the JSON file for `record`."""
+        return {
+            "name": record.name.value,
+            "phones": record.get_all_phones(),
+            "birthday": str(record.birthday) if record.birthday else None
+        }
+
     def save_to_file(self, file_name):
         """
-        Save the instance to a binary file using pickle.
+        Save the instance to a JSON file.
 
         Args:
-            file_name (str): The name of the file to save the instance.
+            file_name (str): The name of the file to save the instance. With a
+                `.gz` or `.xz` extension the file is compressed with gzip or lzma.
+                A name ending with `.shards` is a directory of shard files
+                (see Utils.sharding); only the shards with changes are rewritten.
+                A name ending with `.blocks` is written in blocks with a
+                checksum each (see Utils.blocks).
 
         Returns:
             None
         """
+        if is_sharded(file_name):
+            self._save_shards(file_name)
+            return
         data_to_serialize = AddressBook.convert_to_serializable(self)
-        with open(file_name, 'w', encoding="utf-8") as f:
-            json.dump(data_to_serialize, f)
+        if is_blocks(file_name):
+            dump_blocks(data_to_serialize, file_name)
+        else:
+            dump_json(data_to_serialize, file_name)
+
+    def _save_shards(self, directory):
+        """Save the book as a sharded file, rewriting only the shards with changed records.
+
+        The first save to a directory writes every shard; later saves write
+        the shards that `_update_indexes` marked dirty since then.
+
+        Args:
+            directory (str): The `.shards` directory.
+
+        Returns:
+            None
+        """
+        directory = os.path.abspath(directory)
+        if self._shards is not None and self._shards_dir == directory:
+            manifest = self._shards
+            dirty, snapshot = self._take_dirty_shards()
+        else:
+            try:
+                # Keep the layout of an existing book, but rewrite all of it
+                manifest = read_manifest(directory)
+            except FileNotFoundError:
+                manifest = new_manifest(extension=self._shard_extension(directory))
+            # Every shard is written, so the ones marked dirty so far are saved too
+            _, snapshot = self._take_dirty_shards()
+            dirty = set(range(manifest["shards"]))
+        if not dirty:
+            return
+        shards = {shard: {} for shard in dirty}
+        count = manifest["shards"]
+        for name, record in snapshot.items():
+            data = shards.get(shard_of(name, count))
+            if data is not None:
+                data[name] = self._record_to_data(record)
+        try:
+            manifest = save_shards(directory, manifest, shards, self.SHARD_WORKERS)
+        except BaseException:
+            self._dirty_shards |= dirty
+            raise
+        self._shards, self._shards_dir = manifest, directory
+
+    def _take_dirty_shards(self):
+        """Return the dirty shards and a snapshot they refer to, and start collecting anew."""
+        dirty, self._dirty_shards = self._dirty_shards, set()
+        return dirty, self.snapshot()
 
     @staticmethod
-    def load_from_file(file_name):
+    def _shard_extension(directory):
+        """'book.json.gz.shards' -> '.json.gz'; plain JSON shards otherwise."""
+        stem = os.path.basename(directory.rstrip("/\\"))[:-len(SHARDS_SUFFIX)]
+        for extension in (".json.gz", ".json.xz", ".json"):
+            if stem.endswith(extension):
+                return extension
+        return ".json"
+
+    @staticmethod
+    def _read_data(file_name, workers=None):
+        """Read a plain, block or sharded file.
+
+        Returns:
+            tuple: (dict in the save_to_file format, manifest or None for an unsharded file).
+
+        Raises:
+            DamagedBlocksError: If a block of a block file is damaged.
+        """
+        if is_blocks(file_name):
+            return load_blocks(file_name, workers)[0], None
+        if not is_sharded(file_name):
+            return load_json(file_name), None
+        manifest, shards = load_shards(file_name, workers)
+        data = {}
+        for shard in shards:
+            data.update(shard)
+        return data, manifest
+
+    @classmethod
+    def load_from_file(cls, file_name):
         """
         Load an instance from a JSON file.
 
         Args:
-            file_name (str): The name of the file to load the instance from.
+            file_name (str): The name of the file to load the instance from;
+                gzip and lzma compressed files are recognised by their content.
+                A `.shards` directory is loaded shard by shard in parallel.
+                The blocks of a `.blocks` file are checked and decoded in
+                parallel; damaged blocks are copied to the quarantine
+                directory and left out (listed in `quarantined`).
+                Entries that aren't valid records (e.g. a malformed phone)
+                are left out and listed in `rejected`.
 
         Returns:
-            AddressBook: The loaded instance.
+            AddressBook: The loaded instance; an empty one if the file doesn't exist.
+
+        Raises:
+            ValueError: If the file can't be parsed (e.g. it is cut short or
+                still being written); nothing of it is loaded then.
         """
+        damaged = []
         try:
-            with open(file_name, 'r', encoding="utf-8") as f:
-                data = json.load(f)
-                address_book = AddressBook()
-                for name, record_data in data.items():
-                    new_record = Record(record_data['name'])
-                    phones = record_data['phones']
-                    birthday = record_data['birthday']
-                    if birthday == 'null':
-                        birthday = None
-                    for phone in phones:
-                        new_record.add_phone(phone)
-                    if birthday is not None:
-                        new_record.add_birthday(birthday)
-                    address_book.add_record(new_record)
-                return address_book
-        except (FileNotFoundError, EOFError):
-            # Handle the case where the file is not found or empty
-            return AddressBook()
+            if is_blocks(file_name):
+                data, damaged = load_blocks(file_name, cls.SHARD_WORKERS, keep_damaged=True)
+                manifest = None
+            else:
+                data, manifest = cls._read_data(file_name, cls.SHARD_WORKERS)
+        except FileNotFoundError:
+            return cls()
+        records, rejected = [], []
+        for name, record_data in data.items():
+            try:
+                records.append(cls._record_from_data(record_data))
+            except (ValueError, KeyError, TypeError) as e:
+                rejected.append((name, str(e)))
+        address_book = cls()
+        address_book._load_records(records)
+        address_book.quarantined = damaged
+        address_book.rejected = rejected
+        if manifest is not None:
+            address_book._shards = manifest
+            address_book._shards_dir = os.path.abspath(file_name)
+        return address_book
+
+    @staticmethod
+    def _record_from_data(record_data):
+        """Build a Record from one entry of the JSON file.
+
+        Args:
+            record_data (dict): {"name": ..., "phones": [...], "birthday": ...}.
+
+        Returns:
+            Record: The new record.
+
+        Raises:
+            ValueError: If a field is not valid.
+            KeyError: If a field is missing.
+        """
+        new_record = Record(record_data['name'])
+        phones = record_data['phones']
+        birthday = record_data['birthday']
+        if birthday == 'null':
+            birthday = None
+        for phone in phones:
+            new_record.add_phone(phone)
+        if birthday is not None:
+            new_record.add_birthday(birthday)
+        return new_record
+
+    def reload_from_file(self, file_name):
+        """Bring the book in line with `file_name` after another program changed it.
+
+        Instead of rebuilding the book, the file is compared with the records
+        in memory and only the records that were added, changed or deleted
+        are touched, so snapshots and indexes are updated incrementally.
+
+        Args:
+            file_name (str): The file to reload.
+
+        Returns:
+            tuple: Numbers of (added, updated, removed) records.
+
+        Raises:
+            FileNotFoundError: If the file doesn't exist.
+            ValueError: If the file is not valid JSON or compressed data (e.g. it is
+                half written) or an entry is not a valid record; nothing of it is
+                applied then.
+        """
+        data, manifest = self._read_data(file_name, self.SHARD_WORKERS)
+        with self.undoable("reload from file"):
+            return self._apply_file_data(file_name, data, manifest)
+
+    def _apply_file_data(self, file_name, data, manifest):
+        """Make the records match `data` read by `reload_from_file`; see there.
+
+        Every entry is turned into a Record before the book is touched, so an
+        invalid entry leaves the book as it was.
+
+        Raises:
+            ValueError: If an entry is not a valid record.
+        """
+        records = []
+        for key, record_data in data.items():
+            try:
+                records.append(self._record_from_data(record_data))
+            except (ValueError, KeyError, TypeError) as e:
+                raise ValueError(f"Invalid record {key}: {e}") from e
+        added = updated = 0
+        for new_record in records:
+            name = new_record.name.value
+            record = self.data.get(name)
+            if record is not None and self._record_to_data(record) == self._record_to_data(new_record):
+                continue
+            if record is None:
+                added += 1
+            else:
+                updated += 1
+            self._put(name, new_record)
+        names = {record.name.value for record in records}
+        removed = [name for name in self.data if name not in names]
+        for name in removed:
+            self._remove(name)
+        if manifest is not None:
+            # The book now matches the file, so nothing is left to save
+            self._shards, self._shards_dir = manifest, os.path.abspath(file_name)
+            self._dirty_shards = set()
+        return added, updated, len(removed)
+
+    def replace_data(self, data, label="replace records"):
+        """Make the book match `data`, as one undoable step (e.g. the result of a merge).
+
+        Args:
+            data (dict): The records in the save_to_file format.
+            label (str): Name of the step in the undo history.
+
+        Returns:
+            tuple: Numbers of (added, updated, removed) records.
+        """
+        with self.undoable(label):
+            return self._apply_file_data(None, data, None)
+
+    def apply_snapshot(self, data):
+        """Make the book match a primary's snapshot (see Utils.replication).
+
+        Like `reload_from_file`, only the records that differ are touched. The
+        change is not undoable: a replica follows its primary.
+
+        Args:
+            data (dict): The records in the save_to_file format.
+
+        Returns:
+            tuple: Numbers of (added, updated, removed) records.
+        """
+        with self._replicating():
+            return self._apply_file_data(None, data, None)
+
+    def apply_changes(self, changes):
+        """Apply changes shipped by a primary (see Utils.replication); not undoable.
+
+        Args:
+            changes (list): (kind, name, entry) triples as returned by
+                `changes_since`, with the entries in the save_to_file format.
+
+        Returns:
+            None
+        """
+        with self._replicating():
+            for kind, name, record_data in changes:
+                if kind == "delete":
+                    if name in self.data:
+                        self._remove(name)
+                else:
+                    self._put(name, self._record_from_data(record_data))
+
+    @contextmanager
+    def _replicating(self):
+        # Changes applied for the primary are not logged for undo, just like undo itself
+        restoring, self._restoring = self._restoring, True
+        try:
+            yield
+        finally:
+            self._restoring = restoring
+
     def find(self, param):
         """
         Find records that match the given parameter.
@@ -157,19 +1033,42 @@ class AddressBook(UserDict):
 
         Note:
             If the search parameter is less than 3 characters, it returns an error message.
+            The search runs against a snapshot, so it never blocks writers.
+            Repeated searches are answered from the query cache until the book changes.
         """
-        if len(param) < 1:
-            return "Sorry, search parameter must be more than 1 characters"
-        result = []
-        for record in self.values():
-            if param.isdigit():
-                matching_phones = [phone for phone in record.get_all_phones() if param in phone]
-                if matching_phones:
-                    result.append(str(record))
-            if record.birthday and param in str(record.birthday):
-                result.append(str(record))
-            elif param.isalpha() and param in record.name.value:
-                result.append(str(record))
-        if not result:
-            return "No records found for the given parameter."
-        return '\n'.join(result)
+        return self._cached(("find", param), lambda snapshot: snapshot.find(param))
+
+    def upcoming_birthdays(self, days=7):
+        """Find the contacts whose birthday is within the next `days` days.
+
+        Args:
+            days (int): How many days ahead to look; 0 means today only.
+
+        Returns:
+            tuple: (days left, FrozenRecord) pairs, soonest first.
+        """
+        today = date.today()
+        # The answer depends on the date too, so it is part of the key
+        return self._cached(("birthdays", days, today),
+                            lambda snapshot: tuple(snapshot.upcoming_birthdays(days, today)))
+
+    def _cached(self, key, query):
+        """Return `query(snapshot)` from the query cache or compute and cache it.
+
+        The generation of the entry is the version of the snapshot the result
+        was computed on, so a result is never tagged newer than its data.
+        """
+        snapshot = self.snapshot()
+        found, result = self._query_cache.get(key, snapshot.version)
+        if not found:
+            result = query(snapshot)
+            self._query_cache.put(key, snapshot.version, result)
+        return result
+
+    def cache_info(self):
+        """Return hit/miss counters of the query cache (see LRUCache.info)."""
+        return self._query_cache.info()
+
+    def cache_clear(self):
+        """Empty the query cache, e.g. to time queries that are not cached yet."""
+        self._query_cache.clear()
@@ -0,0 +1,152 @@
+from collections.abc import Mapping
+from datetime import date
+
+from Classes.Birthday import parse_birthday
+from Classes.Record import Record
+
+
+def chunked(records, chunk_size):
+    """Group `records` into lists of `chunk_size` (the last one may be shorter).
+
+    Yields:
+        list: A list of records.
+    """
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class AddressBookSnapshot(Mapping):
+    """A read-only, consistent version of an AddressBook.
+
+    A snapshot pins the persistent trees of the book at the moment it was
+    taken. Later edits of the book build new trees that share every
+    unchanged node with this one, so taking a snapshot is O(1) and never
+    blocks writers, and reading it is never affected by them.
+
+    Records are FrozenRecord objects and are yielded in insertion order.
+    """
+
+    def __init__(self, names, records, version):
+        """
+        Args:
+            names (PersistentSortedMap): Contact name -> insertion sequence number.
+            records (PersistentSortedMap): Insertion sequence number -> FrozenRecord.
+            version (int): The book version this snapshot represents.
+        """
+        self._names = names
+        self._records = records
+        self.version = version
+
+    def snapshot(self):
+        return self
+
+    def __len__(self):
+        return len(self._records)
+
+    def __iter__(self):
+        for record in self._records.values():
+            yield record.name.value
+
+    def __getitem__(self, name):
+        return self._records[self._names[name]]
+
+    def __contains__(self, name):
+        return name in self._names
+
+    def values(self):
+        return self._records.values()
+
+    def items(self):
+        for record in self._records.values():
+            yield record.name.value, record
+
+    def entries(self, after=None):
+        """Iterate over (insertion sequence number, record) pairs in insertion order.
+
+        Args:
+            after (int, optional): Start after this sequence number; finding
+                the start costs O(log N).
+
+        Yields:
+            tuple: (seq, FrozenRecord) pairs.
+        """
+        return self._records.items(after, inclusive=after is None)
+
+    def find_name(self, name):
+        """Find a record by name.
+
+        Args:
+            name (str): The name to search for.
+
+        Returns:
+            FrozenRecord or None: The record if found, or None if not found.
+        """
+        seq = self._names.get(name)
+        return None if seq is None else self._records[seq]
+
+    def iterator(self, chunk_size=1):
+        """Iterate over records in chunks without copying the whole book.
+
+        Args:
+            chunk_size (int): The number of records to yield in each iteration.
+
+        Yields:
+            list: A list of records.
+        """
+        return chunked(self._records.values(), chunk_size)
+
+    def find(self, param):
+        """Find records that match the given parameter.
+
+        Args:
+            param (str): The search parameter.
+
+        Returns:
+            str: A string containing the matching records, separated by newline.
+        """
+        if len(param) < 1:
+            return "Sorry, search parameter must be more than 1 characters"
+        result = []
+        for record in self._records.values():
+            if param.isdigit():
+                matching_phones = [phone for phone in record.get_all_phones() if param in phone]
+                if matching_phones:
+                    result.append(str(record))
+            if record.birthday and param in str(record.birthday):
+                result.append(str(record))
+            elif param.isalpha() and param in record.name.value:
+                result.append(str(record))
+        if not result:
+            return "No records found for the given parameter."
+        return '\n'.join(result)
+
+    def upcoming_birthdays(self, days, today=None):
+        """Find the contacts whose birthday is within the next `days` days.
+
+        Args:
+            days (int): How many days ahead to look; 0 means today only.
+            today (date, optional): The day to count from, today by default.
+
+        Returns:
+            list: (days left, FrozenRecord) pairs, soonest first.
+        """
+        today = today or date.today()
+        result = []
+        for record in self._records.values():
+            if not record.birthday:
+                continue
+            born = parse_birthday(str(record.birthday)).date()
+            birthday = Record._birthday_in_year(born, today.year)
+            if birthday < today:
+                birthday = Record._birthday_in_year(born, today.year + 1)
+            left = (birthday - today).days
+            if left <= days:
+                result.append((left, record))
+        result.sort(key=lambda item: (item[0], item[1].name.value))
+        return result
@@ -3,26 +3,38 @@ from Classes.Field import Field
 RED = "\033[91m"
 RESET = "\033[0m"
 
+
+def parse_birthday(value):
+    """Parse a '%Y-%m-%d' date string.
+
+    Zero-padded dates take the fast C path (datetime.fromisoformat); only
+    unusual forms such as '1978-1-1' fall back to the much slower strptime.
+
+    Raises:
+        ValueError: If the value is not a valid date.
+    """
+    if len(value) == 10 and value[4] == '-' and value[7] == '-' and value.isascii():
+        return datetime.fromisoformat(value)
+    return datetime.strptime(value, '%Y-%m-%d')
+
+
 def is_valid_birthday(value):
     try:
-        datetime.strptime(value, '%Y-%m-%d')
+        parse_birthday(value)
         return True
     except ValueError:
         return False
 
 
 class Birthday(Field):
-    def __init__(self, value):
+    __slots__ = ()
+    interned = True
+
+    @classmethod
+    def validate(cls, value):
         if not is_valid_birthday(value):
             print(f"{RED}The birthday date don't added to record{RESET}")
             raise ValueError("Not valid birthday date")
-        super().__init__(value)
-
-    def __set__(self, new_value):
-        if not is_valid_birthday(new_value):
-            raise ValueError("Not valid birthday date")
-        # self.value = new_value
-        super().__set__(new_value)
 
     def __str__(self):
         return self.value
@@ -0,0 +1,231 @@
+import gc
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from Classes.AddressBook import AddressBook
+from Classes.Birthday import Birthday
+from Classes.Phone import Phone
+
+TENANTS_DIR = 'outputs/tenants'
+# Tenant ids become file names, so only a safe subset of characters is allowed
+TENANT_ID = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+
+class BookManager:
+    """Opens one address book per tenant and keeps only the most recently used ones in memory.
+
+    At most `max_books` books are resident. Opening another one evicts the
+    least recently used book: it is saved if it changed since it was loaded
+    or saved, and dropped; a book with an open transaction is kept until
+    the transaction ends. Phones and birthdays are interned process-wide
+    (see Field), so books that share values share the objects too; every
+    `purge_every` evictions the intern tables are purged of values only the
+    evicted books used.
+    """
+
+    def __init__(self, directory=TENANTS_DIR, max_books=8, extension=".json", book_cls=AddressBook,
+                 purge_every=16):
+        """
+        Args:
+            directory (str): Where the tenant books are stored.
+            max_books (int): How many books to keep in memory.
+            extension (str): File extension of new books, e.g. ".json.gz" or ".shards".
+            book_cls (type): AddressBook class to load the books with.
+            purge_every (int): Evictions between two purges of the intern
+                tables; a purge runs a full garbage collection.
+        """
+        self.directory = directory
+        self.max_books = max_books
+        self.extension = extension
+        self.book_cls = book_cls
+        self.purge_every = purge_every
+        self._lock = threading.Lock()
+        # tenant -> lock held while its book is read from or written to disk, outside the manager's lock
+        self._tenant_locks = {}
+        # tenant -> book, least recently used first
+        self._books = OrderedDict()
+        # tenant -> book version that is on disk
+        self._saved_versions = {}
+        self.opens = 0
+        self.hits = 0
+        self.evictions = 0
+
+    def book_file(self, tenant):
+        """Return the path of a tenant's book.
+
+        Raises:
+            ValueError: If the tenant id is not 1-64 letters, digits, '_' or '-'.
+        """
+        if not TENANT_ID.fullmatch(tenant):
+            raise ValueError(f"Invalid tenant id '{tenant}'")
+        return os.path.join(self.directory, tenant + self.extension)
+
+    def get(self, tenant):
+        """Return the book of `tenant`, loading it (and evicting a cold book) if needed.
+
+        Args:
+            tenant (str): The tenant id.
+
+        Returns:
+            AddressBook: The book; an empty one for a new tenant.
+        """
+        file_name = self.book_file(tenant)
+        with self._lock:
+            book = self._resident(tenant)
+            if book is not None:
+                return book
+            tenant_lock = self._tenant_lock(tenant)
+        # Other tenants stay available while this one is read
+        with tenant_lock:
+            with self._lock:
+                book = self._resident(tenant)
+            if book is not None:
+                # Loaded by another thread meanwhile
+                return book
+            book = self.book_cls.load_from_file(file_name)
+            with self._lock:
+                self.opens += 1
+                self._books[tenant] = book
+                self._saved_versions[tenant] = book.version
+                taken = self._take_cold()
+                purge = taken and self.evictions % self.purge_every < len(taken)
+        try:
+            for cold, cold_book, saved, _ in taken:
+                self._write_if_changed(cold, cold_book, saved)
+        finally:
+            for *_, cold_lock in taken:
+                cold_lock.release()
+        if purge:
+            self._purge_interned()
+        return book
+
+    def _resident(self, tenant):
+        book = self._books.get(tenant)
+        if book is not None:
+            self._books.move_to_end(tenant)
+            self.hits += 1
+        return book
+
+    def _tenant_lock(self, tenant):
+        # Taken without holding self._lock (or with a non-blocking acquire), so the two can't deadlock
+        return self._tenant_locks.setdefault(tenant, threading.Lock())
+
+    def save(self, tenant, book=None):
+        """Save a resident book if it changed since it was loaded or saved.
+
+        Args:
+            tenant (str): The tenant id.
+            book (AddressBook, optional): The book the caller changed. If it
+                was evicted since (and not loaded again), it is written as
+                it is, so changes made after the eviction aren't lost.
+        """
+        with self._lock:
+            tenant_lock = self._tenant_lock(tenant)
+        with tenant_lock:
+            with self._lock:
+                resident = self._books.get(tenant)
+                if resident is not None:
+                    if book is not None and book is not resident:
+                        # A book the caller kept from before an eviction; the resident one is newer
+                        return
+                    book = resident
+                elif book is None:
+                    return
+                saved = self._saved_versions.get(tenant)
+            version = self._write_if_changed(tenant, book, saved)
+            with self._lock:
+                if self._books.get(tenant) is book:
+                    self._saved_versions[tenant] = version
+
+    def evict(self, tenant):
+        """Save and drop a resident book; the next `get` loads it again.
+
+        A book with an open transaction is not evicted: saving it would write
+        half of the transaction.
+        """
+        if self._evict(tenant):
+            with self._lock:
+                purge = self.evictions % self.purge_every == 0
+            if purge:
+                self._purge_interned()
+
+    def close(self):
+        """Save every changed book and drop them all, except books with an open transaction."""
+        with self._lock:
+            tenants = list(self._books)
+        for tenant in tenants:
+            self._evict(tenant)
+        self._purge_interned()
+
+    def _evict(self, tenant):
+        """Evict one book, writing it after releasing the manager's lock; return True if it was evicted."""
+        with self._lock:
+            tenant_lock = self._tenant_lock(tenant)
+        with tenant_lock:
+            with self._lock:
+                book = self._books.get(tenant)
+                if book is None or book.in_transaction:
+                    return False
+                saved = self._take(tenant)
+            self._write_if_changed(tenant, book, saved)
+        return True
+
+    def _take_cold(self):
+        """Take the least recently used books out until at most `max_books` are resident.
+
+        Runs under self._lock. Books with an open transaction, or being
+        saved, stay for now, even if that leaves more than `max_books`.
+
+        Returns:
+            list: (tenant, book, saved version, tenant lock) of the books to
+            write once self._lock is released; each tenant lock is held, so
+            the book isn't loaded again from the file before it is written.
+        """
+        taken = []
+        for tenant, book in list(self._books.items()):
+            if len(self._books) <= self.max_books:
+                break
+            if book.in_transaction:
+                continue
+            tenant_lock = self._tenant_lock(tenant)
+            if not tenant_lock.acquire(blocking=False):
+                continue
+            taken.append((tenant, book, self._take(tenant), tenant_lock))
+        return taken
+
+    def _take(self, tenant):
+        """Drop a book from the resident ones (under self._lock); return the version of it on disk."""
+        del self._books[tenant]
+        self.evictions += 1
+        return self._saved_versions.pop(tenant)
+
+    def _write_if_changed(self, tenant, book, saved):
+        """Write `book` unless version `saved` of it is on disk; return the version on disk now."""
+        version = book.version
+        if version != saved:
+            os.makedirs(self.directory, exist_ok=True)
+            book.save_to_file(self.book_file(tenant))
+        return version
+
+    @staticmethod
+    def _purge_interned():
+        # Records point back to their book, so a dropped book is a reference
+        # cycle; collect it first, or its values still look referenced
+        gc.collect()
+        Phone.purge_interned()
+        Birthday.purge_interned()
+
+    def stats(self):
+        """Return open/hit/evict counters and the estimated memory of each resident book.
+
+        Returns:
+            dict: {"opens", "hits", "evictions", "resident", "books": {tenant: bytes}}.
+        """
+        with self._lock:
+            books = list(self._books.items())
+            counters = {"opens": self.opens, "hits": self.hits, "evictions": self.evictions}
+        counters["resident"] = len(books)
+        counters["books"] = {tenant: book.estimate_memory() for tenant, book in books}
+        return counters
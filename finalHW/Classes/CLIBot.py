@@ -1,7 +1,20 @@
+from datetime import datetime, timedelta
+
 from Classes.Record import Record
 from Classes.AddressBook import AddressBook
 from decorators.input_errors import input_errors
+from decorators.instrumented import instrumented
 from Utils.sanitize_phone_nr import sanitize_phone_number
+from Utils.metrics import registry
+from Utils.profiling import profile_call
+from Utils.book_registry import get_book
+from Utils.file_watcher import FileWatcher
+from Utils.sharding import watched_file
+from Utils.collation import SORT_KEYS
+from Utils.table_renderer import TableRenderer
+from Utils.crdt import CrdtBook, crdt_file, merge_into
+from Utils.audit_log import AuditLog, audit_dir
+from Utils.blocks import DamagedBlocksError, is_blocks, quarantine_dir, quarantine_file, verify_blocks
 
 # I'm applying the decorator directly, overwriting the function
 sanitize_phone_number = input_errors(sanitize_phone_number)
@@ -13,25 +26,92 @@ YELLOW = "\033[43m"
 PINK = "\033[95m"
 RESET = "\033[0m"
 
+ADDRESS_BOOK_FILE = 'outputs/address_book.json'
+# Commands that change the book; a read-only replica refuses them
+WRITE_COMMANDS = ("add", "change", "add-birthday", "edit-birthday", "undo", "redo",
+                  "begin", "commit", "rollback", "merge")
 
 #  ================================
 
 class Bot:
-    def __init__(self):
+    def __init__(self, book_file=ADDRESS_BOOK_FILE, book=None, manager=None, tenant=None,
+                 read_only=False, replication=None):
         self.__known_commands = (
             "add", "change", "phone", "find",
-            "show", "hello", "days-to-birthday", "add-birthday", "edit-birthday")
+            "show", "hello", "days-to-birthday", "add-birthday", "edit-birthday", "stats",
+            "profile", "who", "birthdays", "page", "undo", "redo", "history",
+            "begin", "commit", "rollback", "changes", "merge", "diff", "combine", "audit",
+            "verify")
         self.__exit_commands = ("goodbye", "close", "exit", ".")
-        self.book = self.load_address_book()
+        self._profiling = False
+        self.book_file = book_file
+        self.book = book if book is not None else self.load_address_book(book_file)
+        self._report_load_problems()
+        # Set when the book belongs to a BookManager (see for_tenant)
+        self._manager = manager
+        self._tenant = tenant
+        self._watcher = FileWatcher(watched_file(book_file))
+        # Why the file, changed by another program, couldn't be reloaded; no saves until it can be
+        self._unreadable = None
+        # A replica's book follows its primary (Utils.replication): no writes, no file
+        self.read_only = read_only
+        # ReplicationServer or Replica whose state `stats` shows
+        self._replication = replication
+        # Who changed which contact: the changes of every command go to the audit log
+        self._audit = None if read_only else AuditLog(audit_dir(book_file))
+        # Who runs the bot, looked up on the first audited change
+        self._user = None
+        # (version before, version after, command) of the commands of the open transaction,
+        # audited when it is committed
+        self._txn_commands = []
+        # Commands being executed; `profile <command>` runs one inside another
+        self._depth = 0
+        # Replicated state for `merge` (Utils.crdt), kept up to date on every save once it exists
+        try:
+            self._crdt = CrdtBook.load(crdt_file(book_file))
+        except (FileNotFoundError, ValueError):
+            self._crdt = None
+
+    @classmethod
+    def for_tenant(cls, manager, tenant):
+        """Create a Bot working on one tenant's book of a BookManager.
+
+        Args:
+            manager (BookManager): The manager holding the books.
+            tenant (str): The tenant id.
+
+        Returns:
+            Bot: The new bot.
+        """
+        return cls(manager.book_file(tenant), manager.get(tenant), manager, tenant)
 
     @staticmethod
-    def load_address_book():
+    def load_address_book(book_file=ADDRESS_BOOK_FILE):
         try:
-            return AddressBook.load_from_file('outputs/address_book.json')
-        except (FileNotFoundError, EOFError) as e:
-            print(f"{RED}Error loading address book: {e}{RESET}")
-            print(f"{YELLOW}Creating a new address book.{RESET}")
-            return AddressBook()  # Creating a new instance
+            # Loaded once per process and shared by every Bot using the same file
+            return get_book(book_file)
+        except ValueError as e:
+            # The file may be damaged or still being written; an empty book saved over it would lose it
+            print(f"{RED}Error loading address book {book_file}: {e}{RESET}")
+            print(f"{RED}Not starting, so the file isn't overwritten; repair it or start with another --book{RESET}")
+            raise SystemExit(1)
+
+    def _report_load_problems(self):
+        """Tell about the records the loaded book had to leave out, once per book."""
+        book = self.book
+        if book.rejected:
+            # The next save drops them from the file, so keep the file as it is now
+            kept = quarantine_file(self.book_file)
+            for name, error in book.rejected:
+                print(f"{RED}Skipped {name}: {error}{RESET}")
+            print(f"{RED}{len(book.rejected)} invalid records of {self.book_file} were left out; "
+                  f"the file was copied to {kept}{RESET}")
+            book.rejected = []
+        if book.quarantined:
+            lost = sum(records or 0 for _, _, _, records, _ in book.quarantined)
+            print(f"{RED}{len(book.quarantined)} damaged blocks of {self.book_file} (about {lost} contacts) "
+                  f"were left out and copied to {quarantine_dir(self.book_file)}{RESET}")
+            book.quarantined = []
 
     @staticmethod
     def greeting():
@@ -51,7 +131,81 @@ class Bot:
         """
         return "Good bye!"
 
+    @property
+    def user(self):
+        if self._user is None:
+            self._user = self._current_user()
+        return self._user
+
+    @staticmethod
+    def _current_user():
+        # Imported here: getpass costs several milliseconds of every start
+        import getpass
+        try:
+            return getpass.getuser()
+        except (OSError, KeyError, ImportError):
+            return "unknown"
+
+    def save_book(self):
+        """Save the address book to its file, unless a transaction is open ('commit' saves it)."""
+        if self.book.in_transaction or self.read_only:
+            return
+        if self._unreadable is not None:
+            print(f"{RED}Not saved: {self.book_file} was changed by another program and can't be read "
+                  f"({self._unreadable}); saving would overwrite it. Fix the file and it is reloaded{RESET}")
+            return
+        self._write_book()
+
+    @instrumented("save_to_file")
+    def _write_book(self):
+        """Write the address book to its file, timing the write."""
+        if self._manager is not None:
+            # Lets the manager know the book on disk is up to date
+            self._manager.save(self._tenant, self.book)
+        else:
+            self.book.save_to_file(self.book_file)
+        # Our own write must not look like an outside change
+        self._watcher.mark()
+        if self._crdt is not None:
+            self._crdt.observe(self.book)
+            self._crdt.save(crdt_file(self.book_file))
+
+    def reload_if_changed(self):
+        """Pick up changes other programs made to the address book file.
+
+        Only the records that differ from the file are replaced or deleted.
+
+        Returns:
+            str or None: A message about the reload, or None if the file didn't change.
+        """
+        if self.book.in_transaction or self.read_only or not self._watcher.changed():
+            # An open transaction works on the state it started from; the commit overwrites the file
+            return None
+        try:
+            added, updated, removed = self.book.reload_from_file(self.book_file)
+        except FileNotFoundError:
+            self._watcher.mark()
+            self._unreadable = None
+            return None
+        except DamagedBlocksError as e:
+            # Block files are written atomically, so this is no half-written file: keep the book in memory
+            self._watcher.mark()
+            return f"{RED}Address book file changed on disk, but it is damaged: {e}{RESET}"
+        except (ValueError, KeyError, TypeError) as e:
+            # A half-written file changes again when the write ends, so it is tried once more then
+            self._watcher.mark()
+            self._unreadable = str(e)
+            return (f"{RED}Address book file changed on disk, but it can't be read: {e}; "
+                    f"changes are not saved until it is fixed{RESET}")
+        self._watcher.mark()
+        self._unreadable = None
+        if not (added or updated or removed):
+            return None
+        return (f"{YELLOW}Address book file changed on disk: {added} added, "
+                f"{updated} updated, {removed} removed{RESET}")
+
     @input_errors
+    @instrumented("add")
     def add_contact(self, name, *phones):
         """Add a contact to the address book.
 
@@ -72,10 +226,11 @@ class Bot:
                 contact.add_phone(sanitized_phone)
             else:
                 return f"{RED}Phone {phone} is not valid and not added to {name}{RESET}"
-        self.book.save_to_file('outputs/address_book.json')
+        self.save_book()
         return f"{GREEN}Contact {name} was added successfully!{RESET}"
 
     @input_errors
+    @instrumented("change")
     def change_contact(self, name, old_phone, phone):
         """Change the phone number associated with a contact.
 
@@ -92,7 +247,7 @@ class Bot:
             if old_phone in record.get_all_phones():
                 record.edit_phone(old_phone, phone)
                 # Save the address book to a file after making the change
-                self.book.save_to_file('outputs/address_book.json')
+                self.save_book()
                 return (f"{GREEN} Contact {name}: {old_phone} was successfully changed!\n "
                         f"New data: {name}: {phone}{RESET}")
             else:
@@ -101,32 +256,68 @@ class Bot:
             return f"{RED}There is no {name} contact!{RESET}"
 
     @input_errors
-    def showall(self, chunk_size=1):
+    @instrumented("show")
+    def showall(self, chunk_size=1, sort=None):
         """Display all contacts in the address book.
 
+            Args:
+                chunk_size (int): How many contacts to show before waiting for Enter.
+                sort (str, optional): "name", "birthday", "next-birthday" or "phone";
+                    the order the contacts were added in if omitted.
+
             Returns:
                 None
             """
-        print(f"{BLUE}{'NAME':^15}{RESET} | {BLUE}{'PHONES':^15}{RESET} | {BLUE}{'BIRTHDAY':^15}{RESET}")
-        print("_" * 48)
-
-        records = list(self.book.values())
-        num_records = len(records)
-        i = 0
-        while i < num_records:
-            chunk = records[i:i + chunk_size]
-            for record in chunk:
-                name = record.name.value
-                phones = "; ".join([str(phone) for phone in record.phones])
-                birthday = str(record.birthday) if record.birthday else "N/A"
-                print(f"{BLUE}{name:<15}{RESET} | {BLUE}{phones:^15}{RESET} | {BLUE}{birthday:^15}{RESET}")
-            i += chunk_size
-
-            if i < num_records:
+        renderer = TableRenderer()
+        if not renderer.interactive:
+            # Nobody to press Enter: stream the book in big pages instead
+            chunk_size = renderer.STREAM_PAGE_SIZE
+        # The iterator reads a snapshot, so edits can't disturb the listing
+        chunks = self.book.iterator(chunk_size, sort)
+
+        first = True
+        for chunk in chunks:
+            if not first and renderer.interactive:
+                renderer.flush()
                 # Wait for Enter keypress to continue
                 input(f"{PINK}Press Enter to show the next chunk...{RESET}")
+            # Column widths can grow from page to page, so a terminal gets the titles again
+            renderer.write(chunk, header=first or renderer.interactive)
+            first = False
+        if first:
+            # Empty book: just the titles
+            renderer.write([])
+        renderer.flush()
+
+    @input_errors
+    @instrumented("page")
+    def show_page(self, size, position=None):
+        """Show one page of contacts and how to get the next one.
+
+        Unlike `show`, nothing waits for Enter: the page ends with a cursor
+        that can be passed to another `page` command (or another Bot) later,
+        even after the book was changed in between.
+
+        Args:
+            size (int): Maximum number of contacts on the page.
+            position (str, optional): An order for the first page ("name",
+                "birthday", "next-birthday", "phone") or the cursor printed
+                by the previous page.
+
+        Returns:
+            str: The page.
+        """
+        sort, cursor = (position, None) if position in SORT_KEYS else (None, position)
+        records, next_cursor = self.book.page(cursor, size, sort)
+        lines = [TableRenderer().render(records).rstrip("\n")]
+        if next_cursor:
+            lines.append(f"{PINK}Next page: page {size} {next_cursor}{RESET}")
+        else:
+            lines.append(f"{PINK}End of the address book{RESET}")
+        return "\n".join(lines)
 
     @input_errors
+    @instrumented("phone")
     def get_phone(self, name):
         """Retrieve the phone numbers associated with a contact.
 
@@ -143,6 +334,7 @@ class Bot:
             return f"{RED}There is no contact with this name!{RESET}"
 
     @input_errors
+    @instrumented("days-to-birthday")
     def days_to_birthday(self, name):
         """Calculate the number of days to the next birthday for a contact.
 
@@ -172,6 +364,7 @@ class Bot:
             return f"{RED}{name} has no birthday set{RESET}"
 
     @input_errors
+    @instrumented("add-birthday")
     def add_birthday(self, name, date):
         contact = self.book.find_name(name)
 
@@ -182,10 +375,11 @@ class Bot:
         else:
             contact.add_birthday(date)
             # Save the address book to a file after adding the birthday
-            self.book.save_to_file('outputs/address_book.json')
+            self.save_book()
             return f"{GREEN} Was update {name}'s birthday date{RESET}"
 
     @input_errors
+    @instrumented("edit-birthday")
     def edit_birthday(self, name, date):
         contact = self.book.find_name(name)
 
@@ -194,91 +388,650 @@ class Bot:
         else:
             contact.edit_birthday(date)
             # Save the address book to a file after editing the birthday
-            self.book.save_to_file('outputs/address_book.json')
+            self.save_book()
             return f"{GREEN} Was update {name}'s birthday date{RESET}"
 
+    @input_errors
+    @instrumented("who")
+    def who_has_phone(self, phone):
+        """Caller ID: find who owns an exact phone number.
+
+        Args:
+            phone (str): The phone number in any common format.
+
+        Returns:
+            str: The owners of the number or an error message.
+        """
+        number = sanitize_phone_number(phone)
+        owners = self.book.phone_owners(number)
+        if not owners:
+            return f"{RED}Nobody has the number {phone}{RESET}"
+        return f"{GREEN}{number} belongs to {', '.join(owners)}{RESET}"
+
+    @input_errors
+    @instrumented("find")
+    def find_contacts(self, param):
+        """Find contacts matching a part of a name, phone or birthday.
+
+        Args:
+            param (str): The search parameter.
+
+        Returns:
+            str: The matching records.
+        """
+        return f"{GREEN}Matching records:\n{self.book.find(param)}{RESET}"
+
+    @input_errors
+    @instrumented("birthdays")
+    def upcoming_birthdays(self, days=7):
+        """List the contacts whose birthday is within the next `days` days.
+
+        Args:
+            days (int): How many days ahead to look.
+
+        Returns:
+            str: The contacts, soonest birthday first.
+        """
+        upcoming = self.book.upcoming_birthdays(days)
+        if not upcoming:
+            return f"{YELLOW}No birthdays in the next {days} days{RESET}"
+        lines = [f"{GREEN}Birthdays in the next {days} days:{RESET}"]
+        for left, record in upcoming:
+            when = "today" if left == 0 else f"in {left} days"
+            lines.append(f"{BLUE}{record.name.value:<15}{RESET} | {record.birthday} | {when}")
+        return "\n".join(lines)
+
+    @input_errors
+    @instrumented("undo")
+    def undo(self):
+        """Revert the last command that changed the address book.
+
+        Returns:
+            str: What was undone.
+        """
+        label = self.book.undo()
+        if label is None:
+            return f"{YELLOW}Nothing to undo{RESET}"
+        self.save_book()
+        return f"{GREEN}Undone: {label}{RESET}"
+
+    @input_errors
+    @instrumented("redo")
+    def redo(self):
+        """Apply the last undone command again.
+
+        Returns:
+            str: What was redone.
+        """
+        label = self.book.redo()
+        if label is None:
+            return f"{YELLOW}Nothing to redo{RESET}"
+        self.save_book()
+        return f"{GREEN}Redone: {label}{RESET}"
+
+    @input_errors
+    @instrumented("begin")
+    def begin(self):
+        """Start a transaction: the next commands are saved together on 'commit'.
+
+        Returns:
+            str: A message indicating the result of the operation.
+        """
+        self.book.begin()
+        return f"{GREEN}Transaction started: 'commit' saves the changes, 'rollback' reverts them{RESET}"
+
+    @input_errors
+    @instrumented("commit")
+    def commit(self):
+        """Keep the changes of the transaction and save the book once.
+
+        Returns:
+            str: A message indicating the result of the operation.
+        """
+        changes = self.book.commit()
+        if changes:
+            self.save_book()
+        commands, self._txn_commands = self._txn_commands, []
+        for before, after, command in commands:
+            self._audit_changes(before, command, after)
+        return f"{GREEN}Transaction committed: {changes} changes saved{RESET}"
+
+    @input_errors
+    @instrumented("rollback")
+    def rollback(self):
+        """Revert every change of the transaction; nothing of it was saved.
+
+        Returns:
+            str: A message indicating the result of the operation.
+        """
+        changes = self.book.rollback()
+        self._txn_commands = []
+        return f"{YELLOW}Transaction rolled back: {changes} changes reverted{RESET}"
+
+    def show_history(self, limit=10):
+        """List the commands `undo` and `redo` would revert or repeat.
+
+        Args:
+            limit (int): How many commands of each kind to list.
+
+        Returns:
+            str: The history, the most recent command first.
+        """
+        undo, redo = self.book.history(limit)
+        lines = [f"{BLUE}Undo:{RESET}"] + [f"  {i}. {label}" for i, label in enumerate(undo, 1)]
+        if redo:
+            lines += [f"{BLUE}Redo:{RESET}"] + [f"  {i}. {label}" for i, label in enumerate(redo, 1)]
+        if not undo and not redo:
+            return f"{YELLOW}No changes yet{RESET}"
+        return "\n".join(lines)
+
+    @input_errors
+    @instrumented("merge")
+    def merge_book(self, file_name):
+        """Merge a copy of the address book that was edited apart from this one.
+
+        Concurrent edits don't conflict: the later birthday wins, a phone
+        added on either copy is kept unless that copy removed it, and a
+        deleted contact stays deleted unless it was changed after the
+        deletion (see Utils.crdt). From then on this book keeps its
+        replicated state next to its file, for the next merges.
+
+        Args:
+            file_name (str): The book file of the other copy.
+
+        Returns:
+            str: A message indicating the result of the operation.
+        """
+        if self.book.in_transaction:
+            return f"{RED}Commit or roll back the transaction first{RESET}"
+        if self._crdt is None:
+            self._crdt = CrdtBook()
+        try:
+            self._crdt, (added, updated, removed) = merge_into(self.book, self._crdt, file_name)
+        except FileNotFoundError:
+            return f"{RED}No address book {file_name}{RESET}"
+        self.save_book()
+        return f"{GREEN}Merged {file_name}: {added} added, {updated} updated, {removed} removed{RESET}"
+
+    @input_errors
+    @instrumented("diff")
+    def show_diff(self, old_file, new_file):
+        """Print what changed between two address book files, one contact per line.
+
+        The files are streamed in name order instead of being loaded (see
+        Utils.snapshot_diff), so they may be bigger than the memory.
+
+        Args:
+            old_file (str): The earlier file.
+            new_file (str): The later file.
+
+        Returns:
+            str: How many contacts were added, removed and modified.
+        """
+        # Imported here, like the other modules only one command needs
+        from Utils.snapshot_diff import diff_snapshots
+        counts = {"added": 0, "removed": 0, "modified": 0}
+        try:
+            for kind, name, details in diff_snapshots(old_file, new_file):
+                counts[kind] += 1
+                if kind == "added":
+                    print(f"{GREEN}+ {name}{RESET}: {'; '.join(details.get('phones') or [])}"
+                          f"{', birthday ' + details['birthday'] if details.get('birthday') else ''}")
+                elif kind == "removed":
+                    print(f"{RED}- {name}{RESET}")
+                else:
+                    fields = []
+                    if "phones" in details:
+                        added, removed = details["phones"]
+                        fields.append("phones " + " ".join([f"+{phone}" for phone in added]
+                                                           + [f"-{phone}" for phone in removed]))
+                    if "birthday" in details:
+                        fields.append("birthday {} -> {}".format(*details["birthday"]))
+                    print(f"{BLUE}~ {name}{RESET}: {', '.join(fields)}")
+        except FileNotFoundError as e:
+            return f"{RED}No address book {e.filename}{RESET}"
+        return (f"{YELLOW}{counts['added']} added, {counts['removed']} removed, "
+                f"{counts['modified']} modified{RESET}")
+
+    @input_errors
+    @instrumented("combine")
+    def combine_books(self, policy, out_file, *files):
+        """Merge address book files into a new one without loading them (see Utils.snapshot_merge).
+
+        Args:
+            policy (str): For contacts found in several files: "union" (all
+                phones, birthday of the latest file), "latest" or "first" file wins.
+            out_file (str): The merged file.
+            *files (str): The files to merge, oldest first.
+
+        Returns:
+            str: A message indicating the result of the operation.
+        """
+        from Utils.snapshot_merge import merge_snapshots
+        try:
+            written, conflicts = merge_snapshots(files, out_file, policy)
+        except FileNotFoundError as e:
+            return f"{RED}No address book {e.filename}{RESET}"
+        return (f"{GREEN}{len(files)} files merged into {out_file}: {written} contacts, "
+                f"{conflicts} found in several files{RESET}")
+
+    @input_errors
+    @instrumented("verify")
+    def verify_file(self, file_name=None):
+        """Check an address book file for damage, printing every damaged block.
+
+        The blocks of a `.blocks` file are checked against their checksums
+        in parallel processes (see Utils.blocks); other files can only be
+        read through as a whole.
+
+        Args:
+            file_name (str, optional): The file; the book's own file by default.
+
+        Returns:
+            str: A message indicating the result of the check.
+        """
+        file_name = file_name or self.book_file
+        try:
+            if not is_blocks(file_name):
+                from Utils.snapshot_stream import iter_entries
+                count = sum(1 for _ in iter_entries(file_name))
+                return f"{GREEN}{file_name} is fine: {count} contacts{RESET}"
+            blocks, damaged = verify_blocks(file_name, AddressBook.SHARD_WORKERS)
+        except FileNotFoundError:
+            return f"{RED}No address book {file_name}{RESET}"
+        for number, offset, size, records, reason in damaged:
+            where = "" if number is None else f"block {number} "
+            contacts = "" if records is None else f", {records} contacts"
+            print(f"{RED}{where}at byte {offset} ({size} bytes{contacts}): {reason}{RESET}")
+        if not damaged:
+            return f"{GREEN}{file_name} is fine: {blocks} blocks{RESET}"
+        return f"{RED}{file_name}: {len(damaged)} damaged, {blocks} blocks found{RESET}"
+
+    @staticmethod
+    def _parse_time(value, end=False):
+        """'YYYY-MM-DD' or 'YYYY-MM-DDTHH:MM[:SS]' (local time) -> ns since the epoch.
+
+        A date alone as the `end` of a range means the whole day.
+
+        Raises:
+            ValueError: If the value is not such a date.
+        """
+        moment = datetime.fromisoformat(value)
+        if end and len(value) == 10:
+            return int((moment + timedelta(days=1)).timestamp() * 1e9) - 1
+        return int(moment.timestamp() * 1e9)
+
+    @input_errors
+    @instrumented("audit")
+    def show_audit(self, start, end, name=None):
+        """Print who changed which contact between two moments, one change per line.
+
+        Args:
+            start (str): 'YYYY-MM-DD' or 'YYYY-MM-DDTHH:MM[:SS]'.
+            end (str): Same; a date alone includes that whole day.
+            name (str, optional): Only the changes of this contact.
+
+        Returns:
+            str: How many changes were found.
+        """
+        if self._audit is None:
+            return f"{YELLOW}A read-only replica has no audit log{RESET}"
+        count = 0
+        for stamp, kind, user, contact, command in self._audit.query(
+                self._parse_time(start), self._parse_time(end, end=True), name):
+            count += 1
+            when = datetime.fromtimestamp(stamp / 1e9).strftime("%Y-%m-%d %H:%M:%S")
+            print(f"{when} | {user:<12} | {kind:<6} | {contact or '*':<15} | {command}")
+        return f"{YELLOW}{count} changes{RESET}"
+
+    def _replication_stats(self):
+        """Return the lines `stats` shows about replication."""
+        stats = self._replication.stats()
+        if "replicas" in stats:
+            lines = [f"{PINK}Primary at version {stats['version']}: {len(stats['replicas'])} replicas, "
+                     f"{stats['snapshots']} snapshots sent{RESET}"]
+            lines += [f"  {peer:<21} {'syncing' if behind is None else f'{behind} versions behind'}"
+                      for peer, behind in stats["replicas"].items()]
+            return lines
+        state = "connected" if stats["connected"] else "disconnected"
+        silence = "never" if stats["silence"] is None else f"{stats['silence']:.1f} s ago"
+        return [f"{PINK}Replica {state}: version {stats['version']} of {stats['primary_version']}, "
+                f"{stats['changes']} changes and {stats['snapshots']} snapshots applied, "
+                f"lag avg {stats['lag_avg'] * 1000:.1f} ms / max {stats['lag_max'] * 1000:.1f} ms, "
+                f"primary heard {silence}{RESET}"]
+
+    def show_changes(self, version, epoch=None):
+        """List the contacts added, updated or deleted since a version of the book.
+
+        Args:
+            version (int): The book version to compare with.
+            epoch (str, optional): The epoch of that version; this book's if omitted.
+
+        Returns:
+            str: The changes and the "<epoch>:<version>" to ask for next time.
+        """
+        current, changes = self.book.changes_since(version, epoch)
+        lines = [f"{BLUE}Version {self.book.epoch}:{current}: {len(changes)} changes since version {version}{RESET}"]
+        colors = {"add": GREEN, "update": YELLOW, "delete": RED}
+        lines += [f"  {colors[kind]}{kind:<6}{RESET} {name}" for kind, name, _ in changes]
+        return "\n".join(lines)
+
+    def show_stats(self, export_file=None):
+        """Display per-command call counts, errors and latencies.
+
+        Args:
+            export_file (str, optional): Also write the statistics to this file
+                in the Prometheus text format.
+
+        Returns:
+            str: A table with the statistics.
+        """
+        lines = [
+            f"{BLUE}{'COMMAND':<18} | {'CALLS':>7} | {'ERRORS':>6} | {'AVG ms':>8} | "
+            f"{'P95 ms':>8} | {'MAX ms':>8}{RESET}",
+            "_" * 70,
+        ]
+        for command, stats in registry.items():
+            latency = stats.latency
+            avg = latency.sum / latency.count * 1000 if latency.count else 0.0
+            lines.append(f"{command:<18} | {stats.calls:>7} | {stats.errors:>6} | {avg:>8.2f} | "
+                         f"{latency.quantile(0.95) * 1000:>8.2f} | {latency.max * 1000:>8.2f}")
+        cache = self.book.cache_info()
+        lines.append(f"{PINK}Query cache: {cache['hits']} hits, {cache['misses']} misses "
+                     f"({cache['hit_rate']:.0%}), {cache['size']}/{cache['maxsize']} entries, "
+                     f"{cache['evictions']} evictions{RESET}")
+        if self._manager is not None:
+            books = self._manager.stats()
+            lines.append(f"{PINK}Books: {books['opens']} opened, {books['hits']} hits, "
+                         f"{books['evictions']} evicted, {books['resident']} in memory{RESET}")
+            for tenant, size in books["books"].items():
+                lines.append(f"  {tenant:<16} ~{size / 1024 / 1024:.1f} MB")
+        if self._replication is not None:
+            lines.extend(self._replication_stats())
+        if export_file:
+            try:
+                registry.export(export_file)
+                lines.append(f"{GREEN}Statistics exported to {export_file}{RESET}")
+            except OSError as e:
+                lines.append(f"{RED}Can't export statistics: {e}{RESET}")
+        return "\n".join(lines)
+
     known_commands = (
         "add", "change", "phone",
         "show", "hello", "find",
-        "edit-birthday", "add-birthday", "days-to-birthday",)
+        "edit-birthday", "add-birthday", "days-to-birthday", "stats",
+        "profile", "who", "birthdays", "page", "undo", "redo", "history",
+        "begin", "commit", "rollback", "changes", "merge", "diff", "combine", "audit",
+        "verify",)
     exit_commands = ("goodbye", "close", "exit", ".")
 
+    def profile_command(self, args, top=20):
+        """Run one command under cProfile and report where its time went.
+
+        Args:
+            args (list of str): `[--dump <file.pstats>] <command> [arguments...]`.
+            top (int): How many functions to list.
+
+        Returns:
+            str: The profile report, sorted by cumulative time.
+        """
+        dump_file = None
+        if args[:1] == ["--dump"]:
+            if len(args) < 2:
+                return f"{RED}You have to provide a file name after '--dump'.{RESET}"
+            dump_file, args = args[1], args[2:]
+        if not args:
+            return f"{RED}Example: \nprofile [--dump <file.pstats>] <command ...>{RESET}"
+        if self._profiling:
+            return f"{RED}Profiler is already running{RESET}"
+        if args[0].lower() in self.__exit_commands:
+            return f"{RED}Can't profile '{args[0]}'{RESET}"
+        self._profiling = True
+        try:
+            _, report = profile_call(self.execute, " ".join(args), top=top, dump_file=dump_file)
+        except OSError as e:
+            return f"{RED}Can't save profile: {e}{RESET}"
+        finally:
+            self._profiling = False
+        if dump_file:
+            report += f"{GREEN}Profile saved to {dump_file}{RESET}"
+        return report
+
+    def execute(self, user_input):
+        """Handle one line of user input.
+
+        Args:
+            user_input (str): The command line, e.g. "add <name> <phone>".
+
+        Returns:
+            bool: False if the user asked to exit, True otherwise.
+        """
+        if self._manager is not None and not self.book.in_transaction:
+            # The manager may have evicted our book to open another tenant's
+            self.book = self._manager.get(self._tenant)
+        reloaded = self.reload_if_changed()
+        if reloaded:
+            print(reloaded)
+        if user_input == "":
+            print(f"{RED}Empty input !!!{RESET}")
+            return True
+        input_data = user_input.split()
+        input_command = input_data[0].lower()
+        if input_command in self.__exit_commands:
+            if self.book.in_transaction:
+                print(self.rollback())
+            print(f"{RED}{self.good_bye()}{RESET}")
+            return False
+        elif self.read_only and input_command in WRITE_COMMANDS:
+            print(f"{RED}This is a read-only replica, make changes on the primary{RESET}")
+        elif input_command in self.__known_commands:
+            version = self.book.version
+            in_transaction = self.book.in_transaction
+            self._depth += 1
+            try:
+                # All the changes one command makes are undone together
+                with self.book.undoable(user_input):
+                    self._dispatch(input_command, input_data)
+            finally:
+                self._depth -= 1
+            if self._depth == 0:
+                if self.book.in_transaction:
+                    # Audited under this command when the transaction is committed
+                    if self.book.version != version:
+                        self._txn_commands.append((version, self.book.version, user_input))
+                elif not in_transaction:
+                    # A commit audits the commands of the transaction itself; a rollback, nothing
+                    self._audit_changes(version, user_input)
+        else:
+            print(f"{RED}Don't know this command{RESET}")
+        return True
+
+    def _audit_changes(self, version, command, until=None):
+        """Write the contacts `command` changed since `version` (up to `until`) to the audit log."""
+        if self._audit is None or (until if until is not None else self.book.version) == version:
+            return
+        try:
+            _, changes = self.book.changes_since(version, until=until)
+        except ValueError:
+            # More changes than the change feed keeps (e.g. a big merge): the command is recorded
+            self._audit.append("bulk", self.user, "", command)
+        else:
+            for kind, name, _ in changes:
+                self._audit.append(kind, self.user, name, command)
+        self._audit.flush()
+
+    def _dispatch(self, input_command, input_data):
+        """Run a known command; see `execute`."""
+        match input_command:
+            case 'hello':
+                print(f"{BLUE}{self.greeting()} {RESET}")
+            case 'add':
+                try:
+                    print(self.add_contact(input_data[1], input_data[2]))
+                except IndexError:
+                    print(f"{RED}You have to put name and phone after add. Example: \n"
+                          f"add <name> <phone>{RESET}")
+            case "change":
+                if len(input_data) < 4:
+                    print(
+                        f"{RED}You have to put name, old phone, and new phone after change. "
+                        f"Example: \nchange <name> "
+                        f"<old_phone> <new_phone>{RESET}")
+                else:
+                    print(self.change_contact(input_data[1], input_data[2], input_data[3]))
+            case "show":
+                try:
+                    error = self.showall(int(input_data[1]), input_data[2] if len(input_data) > 2 else None)
+                    if error:
+                        print(error)
+                except (IndexError, ValueError):
+                    print(f"{RED}You have to put correct chunk size. Example: \n"
+                          f"show <chunk size> [name|birthday|next-birthday|phone]{RESET}")
+
+            case "phone":
+                print(self.get_phone(input_data[1]))
+            case "days-to-birthday":
+                if len(input_data) < 2:
+                    print(
+                        f"{RED}You need to provide a name after 'days-to-birthday'. "
+                        f"Example: days-to-birthday <name>{RESET}"
+                    )
+                else:
+                    print(self.days_to_birthday(input_data[1]))
+            case "add-birthday":
+                if len(input_data) < 3:
+                    print(f"{RED}You need to provide a name and birthday date after 'add-birthday'.{RESET}")
+                    print(f"{RED}Example: \nadd-birthday <name> <YYYY-MM-DD>{RESET}")
+                else:
+                    self.add_birthday(input_data[1], input_data[2])
+            case "edit-birthday":
+                if len(input_data) < 3:
+                    print(f"{RED}You need to provide a name and birthday date after 'add-birthday'.{RESET}")
+                    print(f"{RED}Example: \nedit-birthday <name> <YYYY-MM-DD>{RESET}")
+                else:
+                    self.edit_birthday(input_data[1], input_data[2])
+            case "find":
+                if len(input_data) < 2:
+                    print(f"{RED}You have to provide a search parameter after 'find'.{RESET}")
+                else:
+                    print(self.find_contacts(input_data[1]))
+            case "stats":
+                if len(input_data) > 1 and input_data[1] != "export":
+                    print(f"{RED}Example: \nstats\nstats export <file>{RESET}")
+                elif len(input_data) == 2:
+                    print(f"{RED}You have to provide a file name after 'stats export'.{RESET}")
+                else:
+                    print(self.show_stats(input_data[2] if len(input_data) > 2 else None))
+            case "profile":
+                print(self.profile_command(input_data[1:]))
+            case "who":
+                if len(input_data) < 2:
+                    print(f"{RED}You have to provide a phone number after 'who'. Example: \nwho <phone>{RESET}")
+                else:
+                    print(self.who_has_phone(" ".join(input_data[1:])))
+            case "page":
+                try:
+                    size = int(input_data[1])
+                    if size < 1:
+                        raise ValueError
+                except (IndexError, ValueError):
+                    print(f"{RED}You have to put correct page size. Example: \n"
+                          f"page <size> [name|birthday|next-birthday|phone|<cursor>]{RESET}")
+                else:
+                    print(self.show_page(size, input_data[2] if len(input_data) > 2 else None))
+            case "begin":
+                print(self.begin())
+            case "commit":
+                print(self.commit())
+            case "rollback":
+                print(self.rollback())
+            case "undo":
+                print(self.undo())
+            case "redo":
+                print(self.redo())
+            case "history":
+                try:
+                    print(self.show_history(int(input_data[1]) if len(input_data) > 1 else 10))
+                except ValueError:
+                    print(f"{RED}Example: \nhistory [<number of commands>]{RESET}")
+            case "merge":
+                try:
+                    print(self.merge_book(input_data[1]))
+                except IndexError:
+                    print(f"{RED}Example: \nmerge <address book file>{RESET}")
+            case "diff":
+                if len(input_data) < 3:
+                    print(f"{RED}Example: \ndiff <old address book file> <new address book file>{RESET}")
+                else:
+                    print(self.show_diff(input_data[1], input_data[2]))
+            case "combine":
+                if len(input_data) < 4:
+                    from Utils.snapshot_merge import POLICIES
+                    print(f"{RED}Example: \ncombine <{'|'.join(POLICIES)}> <output file> "
+                          f"<address book file> [<address book file> ...]{RESET}")
+                else:
+                    print(self.combine_books(*input_data[1:]))
+            case "audit":
+                if len(input_data) < 3:
+                    print(f"{RED}Example: \naudit <from YYYY-MM-DD[THH:MM]> <to YYYY-MM-DD[THH:MM]> [<name>]{RESET}")
+                else:
+                    print(self.show_audit(*input_data[1:4]))
+            case "verify":
+                print(self.verify_file(*input_data[1:2]))
+            case "changes":
+                try:
+                    epoch, _, version = input_data[1].rpartition(":")
+                    version = int(version)
+                except (ValueError, IndexError):
+                    print(f"{RED}Example: \nchanges [<epoch>:]<version>{RESET}")
+                else:
+                    try:
+                        print(self.show_changes(version, epoch or None))
+                    except ValueError as e:
+                        # Also ChangesExpiredError: the feed doesn't reach back that far
+                        print(f"{RED}{e}{RESET}")
+            case "birthdays":
+                try:
+                    print(self.upcoming_birthdays(int(input_data[1]) if len(input_data) > 1 else 7))
+                except ValueError:
+                    print(f"{RED}Number of days must be a number. Example: \nbirthdays <days>{RESET}")
+
     def run(self):
         """Main function for user interaction.
 
                Returns:
                    None
                """
-        try:
-            book = AddressBook.load_from_file('outputs/address_book.json')
-        except (FileNotFoundError, EOFError) as e:
-            print(f"{RED}Error loading address book: {e}{RESET}")
-            print(f"{YELLOW}Creating a new address book.{RESET}")
-            book = AddressBook()  # Creating a new instance
-
         while True:
             user_input = input("... ")
-            if user_input == "":
-                print(f"{RED}Empty input !!!{RESET}")
-                continue
-            input_data = user_input.split()
-            input_command = input_data[0].lower()
-            if input_command in self.__exit_commands:
-                print(f"{RED}{self.good_bye()}{RESET}")
+            if not self.execute(user_input):
                 break
-            elif input_command in self.__known_commands:
-                match input_command:
-                    case 'hello':
-                        print(f"{BLUE}{self.greeting()} {RESET}")
-                    case 'add':
-                        try:
-                            print(self.add_contact(input_data[1], input_data[2]))
-                        except IndexError:
-                            print(f"{RED}You have to put name and phone after add. Example: \n"
-                                  f"add <name> <phone>{RESET}")
-                    case "change":
-                        if len(input_data) < 4:
-                            print(
-                                f"{RED}You have to put name, old phone, and new phone after change. "
-                                f"Example: \nchange <name> "
-                                f"<old_phone> <new_phone>{RESET}")
-                        else:
-                            print(self.change_contact(input_data[1], input_data[2], input_data[3]))
-                    case "show":
-                        try:
-                            self.showall(int(input_data[1]))
-                        except IndexError:
-                            print(f"{RED}You have to put correct chunk size. Example: \nshow <chunk size>{RESET}")
-
-                    case "phone":
-                        print(self.get_phone(input_data[1]))
-                    case "days-to-birthday":
-                        if len(input_data) < 2:
-                            print(
-                                f"{RED}You need to provide a name after 'days-to-birthday'. "
-                                f"Example: days-to-birthday <name>{RESET}"
-                            )
-                        else:
-                            print(self.days_to_birthday(input_data[1]))
-                    case "add-birthday":
-                        if len(input_data) < 3:
-                            print(f"{RED}You need to provide a name and birthday date after 'add-birthday'.{RESET}")
-                            print(f"{RED}Example: \nadd-birthday <name> <YYYY-MM-DD>{RESET}")
-                        else:
-                            self.add_birthday(input_data[1], input_data[2])
-                    case "edit-birthday":
-                        if len(input_data) < 3:
-                            print(f"{RED}You need to provide a name and birthday date after 'add-birthday'.{RESET}")
-                            print(f"{RED}Example: \nedit-birthday <name> <YYYY-MM-DD>{RESET}")
-                        else:
-                            self.edit_birthday(input_data[1], input_data[2])
-                    case "find":
-                        try:
-                            search_param = input_data[1]
-                            result = book.find(search_param)
-                            print(f"{GREEN}Matching records:\n{result}{RESET}")
-                        except IndexError:
-                            print(f"{RED}You have to provide a search parameter after 'find'.{RESET}")
 
-            else:
-                print(f"{RED}Don't know this command{RESET}")
+    def run_batch(self, lines, profile_file=None):
+        """Execute commands non-interactively, one per line.
+
+        Empty lines and lines starting with '#' are skipped.
+
+        Args:
+            lines (iterable of str): The commands, e.g. an open file.
+            profile_file (str, optional): Profile the whole batch, print the
+                top functions and save the raw stats to this `.pstats` file.
+
+        Returns:
+            None
+        """
+        if profile_file:
+            self._profiling = True
+            try:
+                _, report = profile_call(self.run_batch, lines, top=30, dump_file=profile_file)
+            finally:
+                self._profiling = False
+            print(report)
+            return
+        for line in lines:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            print(f"... {line}")
+            if not self.execute(line):
+                break
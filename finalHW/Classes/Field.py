@@ -1,15 +1,99 @@
+import sys
+
+
 class Field:
-    """Initialize a new Field instance with the given value.
+    """An immutable, hashable value object holding a single value.
+
+    Subclasses with `interned = True` are interned: constructing a field
+    with a value that is already in use returns the existing object, so
+    contacts sharing a number (or a birthday) share one Phone (or Birthday).
+    Values nobody uses any more are dropped from the intern table by
+    `purge_interned`, which runs automatically whenever the table has doubled
+    since the last purge (so its cost is amortized O(1) per new value).
+
+    Subclasses check the value in `validate`, which runs only when a new
+    object is created.
+
+    Args:
+        value: The value to store in the field.
+    """
+
+    __slots__ = ("_value",)
+    interned = False
+    # Minimal intern table size that triggers a purge
+    _PURGE_THRESHOLD = 1024
 
-        Args:
-            value: The initial value to store in the field.
+    def __new__(cls, value):
+        if not cls.interned:
+            cls.validate(value)
+            return cls._create(value)
+        table = cls.__dict__.get("_interned")
+        if table is None:
+            table = {}
+            setattr(cls, "_interned", table)
+            setattr(cls, "_purge_at", cls._PURGE_THRESHOLD)
+        field = table.get(value)
+        if field is None:
+            cls.validate(value)
+            field = table[value] = cls._create(value)
+            if len(table) >= cls._purge_at:
+                cls.purge_interned()
+        return field
+
+    @classmethod
+    def _create(cls, value):
+        field = super().__new__(cls)
+        object.__setattr__(field, "_value", value)
+        return field
+
+    @classmethod
+    def purge_interned(cls):
+        """Drop interned values that are no longer referenced outside the intern table.
 
         Returns:
-            None
+            int: How many values were dropped.
         """
+        table = cls.__dict__.get("_interned")
+        if not table:
+            return 0
+        # Two references: the table itself and the getrefcount argument
+        unused = [value for value in list(table) if sys.getrefcount(table[value]) <= 2]
+        for value in unused:
+            del table[value]
+        setattr(cls, "_purge_at", max(cls._PURGE_THRESHOLD, 2 * len(table)))
+        return len(unused)
+
+    @classmethod
+    def validate(cls, value):
+        """Raise ValueError if `value` is not valid for this field."""
+
+    @property
+    def value(self):
+        """The stored value (read-only)."""
+        return self._value
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
 
-    def __init__(self, value):
-        self.value = value
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if type(other) is not type(self):
+            return NotImplemented
+        return self._value == other._value
+
+    def __hash__(self):
+        return hash(self._value)
+
+    def __reduce__(self):
+        # Unpickling goes through __new__, so the value is validated (and interned) again
+        return type(self), (self._value,)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self._value!r})"
 
     def __str__(self):
         """Return a string representation of the field's value.
@@ -17,7 +101,7 @@ class Field:
                 Returns:
                     str: A string representation of the stored value.
                 """
-        return str(self.value)
+        return str(self._value)
 
     def __get__(self):
         """Get the current value stored in the field.
@@ -25,17 +109,4 @@ class Field:
                 Returns:
                     The current value stored in the field.
                 """
-        return self.value
-
-    def __set__(self, new_value):
-        """Set a new value in the field.
-
-                Args:
-                    new_value: The new value to store in the field.
-
-                Returns:
-                    None
-                """
-        self.value = new_value
-
-
+        return self._value
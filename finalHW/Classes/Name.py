@@ -4,10 +4,12 @@ from Classes.Field import Field
 class Name(Field):
     """class for validate name field"""
 
-    def __init__(self, value):
-        if not self.is_valid_name(value):
+    __slots__ = ()
+
+    @classmethod
+    def validate(cls, value):
+        if not cls.is_valid_name(value):
             raise ValueError("Name must be at least one character long")
-        super().__init__(value)
 
     @staticmethod
     def is_valid_name(value):
@@ -4,17 +4,15 @@ from Classes.Field import Field
 class Phone(Field):
     """class for validate phone number"""
 
+    __slots__ = ()
+    interned = True
+
     @staticmethod
     def is_valid_phone(value):
         """return boolean from check"""
         return value.isdigit() and len(value) == 10
 
-    def __init__(self, value):
+    @classmethod
+    def validate(cls, value):
         if not Phone.is_valid_phone(value):
             raise ValueError("Phone number must be a ten digit string of digits")
-        super().__init__(value)
-
-    def __set__(self, instance, new_value):
-        if not Phone.is_valid_phone(new_value):
-            raise ValueError("Phone number must be a ten digit string of digits")
-        super().__set__(instance, new_value)
@@ -1,6 +1,6 @@
 from Classes.Name import Name
 from Classes.Phone import Phone
-from Classes.Birthday import Birthday
+from Classes.Birthday import Birthday, parse_birthday
 
 from datetime import datetime
 
@@ -10,7 +10,8 @@ class Record:
 
     Attributes:
         self.name (Name): Ім'я контакту.
-        self.phones (list of Phone): Список телефонних номерів контакту.
+        self.phones (dict of Phone): Впорядкована множина телефонних номерів контакту
+            (dict з ключами Phone і значеннями None: порядок додавання, без дублікатів, пошук за O(1)).
         self.birthday (Birthday): Дата народження контакту.
 
     Methods:
@@ -22,12 +23,16 @@ class Record:
         edit_phone(old_phone, new_phone): Редагує існуючий телефонний номер контакту.
         find_phone(phone): Знаходить телефонний номер контакту за значенням номера.
         get_all_phones(): Повертає список всіх телефонних номерів контакту.
+        freeze(): Повертає незмінну копію поточного стану запису.
     """
 
+    # Адресна книга, якій належить запис; вона отримує повідомлення про кожну зміну.
+    _book = None
+
     def __init__(self, name, birthday=None):
         """Ініціалізує новий об'єкт Record з ім'ям та датою народження (за бажанням)."""
         self.name = Name(name)
-        self.phones = []
+        self.phones = {}
         self.birthday = Birthday(birthday) if birthday else None
 
     def days_to_birthday(self):
@@ -41,10 +46,11 @@ class Record:
             # print(today)
             # print("1", self.birthday)
             # print( datetime.strptime(self.birthday, '%Y-%m-%d').replace(year=today.year))
-            birthday = datetime.strptime(str(self.birthday), '%Y-%m-%d').replace(year=today.year)
+            born = parse_birthday(str(self.birthday))
+            birthday = self._birthday_in_year(born, today.year)
 
             if today > birthday:
-                birthday = birthday.replace(year=today.year + 1)
+                birthday = self._birthday_in_year(born, today.year + 1)
 
             delta = birthday - today
             # print("d", delta.days)
@@ -52,6 +58,14 @@ class Record:
         else:
             return None
 
+    @staticmethod
+    def _birthday_in_year(born, year):
+        """Переносить дату народження на рік year; 29 лютого у невисокосний рік стає 28 лютого."""
+        try:
+            return born.replace(year=year)
+        except ValueError:
+            return born.replace(year=year, day=28)
+
     def add_birthday(self, value):
         """Додає дату народження контакту.
 
@@ -59,6 +73,7 @@ class Record:
                    value (str): Рядок з датою народження у форматі '%Y-%m-%d'.
                """
         self.birthday = Birthday(value)
+        self._changed()
 
     def edit_birthday(self, new_value):
         """Редагує дату народження контакту.
@@ -70,6 +85,7 @@ class Record:
             self.birthday = None
         else:
             self.birthday = Birthday(new_value)
+        self._changed()
 
     def add_phone(self, phone):
         """Додає телефонний номер контакту.
@@ -79,7 +95,10 @@ class Record:
         """
         if not isinstance(phone, Phone):
             phone = Phone(phone)
-        self.phones.append(phone)
+        if phone in self.phones:
+            return
+        self.phones[phone] = None
+        self._changed()
 
     def remove_phone(self, phone):
         """Видаляє телефонний номер контакту.
@@ -87,8 +106,10 @@ class Record:
         Args:
             phone (str): Телефонний номер для видалення.
         """
-        if phone in [p.value for p in self.phones]:
-            self.phones = [p for p in self.phones if p.value != phone]
+        phone = self._as_phone(phone)
+        if phone in self.phones:
+            del self.phones[phone]
+            self._changed()
 
     def edit_phone(self, old_phone, new_phone):
         """Редагує існуючий телефонний номер контакту.
@@ -100,13 +121,13 @@ class Record:
         Raises:
             ValueError: Якщо старий телефонний номер не знайдено.
         """
-        is_found_old_phone = False
-        for i, p in enumerate(self.phones):
-            if p.value == old_phone:
-                self.phones[i] = Phone(new_phone)
-                is_found_old_phone = True
-        if not is_found_old_phone:
+        old_phone = self._as_phone(old_phone)
+        if old_phone not in self.phones:
             raise ValueError('Phone not found')
+        new_phone = Phone(new_phone)
+        # Перебудова зберігає позицію номера; телефонів у записі лише кілька
+        self.phones = {new_phone if p == old_phone else p: None for p in self.phones}
+        self._changed()
 
     def find_phone(self, phone):
         """Знаходить телефонний номер контакту за значенням номера.
@@ -117,9 +138,17 @@ class Record:
         Returns:
             Phone or None: Знайдений телефоний номер або None, якщо не знайдено.
         """
-        for p in self.phones:
-            if p.value == phone:
-                return p
+        phone = self._as_phone(phone)
+        if phone in self.phones:
+            return phone
+        return None
+
+    @staticmethod
+    def _as_phone(phone):
+        """Перетворює рядок на Phone для пошуку; None, якщо такого номера не може бути."""
+        if isinstance(phone, Phone):
+            return phone
+        return Phone(phone) if Phone.is_valid_phone(phone) else None
 
     def get_all_phones(self):
         """Повертає список всіх телефонних номерів контакту.
@@ -130,6 +159,56 @@ class Record:
         result = [p.value for p in self.phones]
         return result
 
+    def freeze(self):
+        """Повертає незмінну копію поточного стану запису.
+
+        Поля (Name, Phone, Birthday) не копіюються, а використовуються спільно,
+        тому вартість копії пропорційна лише кількості телефонів.
+
+        Returns:
+            FrozenRecord: Знімок запису.
+        """
+        return FrozenRecord(self)
+
+    def _changed(self):
+        """Повідомляє адресну книгу про зміну запису."""
+        if self._book is not None:
+            self._book._record_changed(self)
+
     def __str__(self):
         return f"Contact name: {self.name.value}, phones: {'; '.join(p.value for p in self.phones)}, " \
                f"birthday: {self.birthday}"
+
+
+class FrozenRecord(Record):
+    """Незмінний знімок стану Record, який зберігають версії адресної книги.
+
+    Має той самий інтерфейс для читання, що й Record, але методи, які
+    змінюють запис, викликають TypeError.
+    """
+
+    def __init__(self, record):
+        self.name = record.name
+        self.phones = tuple(record.phones)
+        self.birthday = record.birthday
+
+    def freeze(self):
+        return self
+
+    def thaw(self):
+        """Повертає новий змінний Record з тим самим станом (наприклад, для скасування змін).
+
+        Returns:
+            Record: Запис, який ще не належить жодній адресній книзі.
+        """
+        record = Record.__new__(Record)
+        record.name = self.name
+        record.phones = dict.fromkeys(self.phones)
+        record.birthday = self.birthday
+        return record
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("Snapshot records are read-only")
+
+    add_birthday = edit_birthday = _read_only
+    add_phone = remove_phone = edit_phone = _read_only
@@ -0,0 +1,155 @@
+from Classes.AddressBook import AddressBook
+from Utils.rw_lock import RWLock
+
+
+class ThreadSafeAddressBook(AddressBook):
+    """An AddressBook that can be shared between threads.
+
+    Lookups take a shared read lock and run in parallel, while `add_record`
+    and `delete` take the lock exclusively. Scans (`find`, `iterator`,
+    `save_to_file`) only hold the read lock for the O(1) `snapshot()` call and
+    then run against the snapshot, so they never block writers.
+
+    Views such as `keys()`, `values()` and `items()` return lists copied under
+    the read lock, so iterating them never fails with "dictionary changed size
+    during iteration".
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._lock = RWLock()
+        super().__init__(*args, **kwargs)
+
+    def add_record(self, record):
+        with self._lock.write_locked():
+            super().add_record(record)
+
+    def delete(self, name):
+        with self._lock.write_locked():
+            super().delete(name)
+
+    def reload_from_file(self, file_name):
+        with self._lock.write_locked():
+            return super().reload_from_file(file_name)
+
+    def replace_data(self, data, label="replace records"):
+        with self._lock.write_locked():
+            return super().replace_data(data, label)
+
+    def apply_snapshot(self, data):
+        with self._lock.write_locked():
+            return super().apply_snapshot(data)
+
+    def apply_changes(self, changes):
+        with self._lock.write_locked():
+            super().apply_changes(changes)
+
+    def undo(self):
+        with self._lock.write_locked():
+            return super().undo()
+
+    def redo(self):
+        with self._lock.write_locked():
+            return super().redo()
+
+    def begin(self, label="transaction"):
+        with self._lock.write_locked():
+            super().begin(label)
+
+    def commit(self):
+        with self._lock.write_locked():
+            return super().commit()
+
+    def rollback(self):
+        with self._lock.write_locked():
+            return super().rollback()
+
+    def changes_since(self, version, epoch=None, until=None):
+        with self._lock.read_locked():
+            return super().changes_since(version, epoch, until)
+
+    def history(self, limit=10):
+        with self._lock.read_locked():
+            return super().history(limit)
+
+    def find_name(self, name):
+        with self._lock.read_locked():
+            return super().find_name(name)
+
+    def lookup_phone(self, number):
+        with self._lock.read_locked():
+            return super().lookup_phone(number)
+
+    def phone_owners(self, number):
+        with self._lock.read_locked():
+            return super().phone_owners(number)
+
+    def get_records(self):
+        with self._lock.read_locked():
+            return super().get_records()
+
+    def snapshot(self):
+        with self._lock.read_locked():
+            return super().snapshot()
+
+    def committed_snapshot(self):
+        with self._lock.read_locked():
+            return super().committed_snapshot()
+
+    def sorted_view(self, sort):
+        with self._lock.read_locked():
+            view = self._views.get(sort)
+        if view is not None:
+            return view
+        # Building a view changes the book's state, so it needs the lock exclusively
+        with self._lock.write_locked():
+            return super().sorted_view(sort)
+
+    def _take_dirty_shards(self):
+        # No change may slip in between taking the dirty set and the snapshot
+        with self._lock.write_locked():
+            dirty, self._dirty_shards = self._dirty_shards, set()
+            # AddressBook.snapshot doesn't lock; self.snapshot() would deadlock here
+            return dirty, AddressBook.snapshot(self)
+
+    def _record_changed(self, record):
+        with self._lock.write_locked():
+            super()._record_changed(record)
+
+    def __str__(self):
+        with self._lock.read_locked():
+            return super().__str__()
+
+    def __getitem__(self, key):
+        with self._lock.read_locked():
+            return super().__getitem__(key)
+
+    def __setitem__(self, key, item):
+        with self._lock.write_locked():
+            super().__setitem__(key, item)
+
+    def __delitem__(self, key):
+        with self._lock.write_locked():
+            super().__delitem__(key)
+
+    def __contains__(self, key):
+        with self._lock.read_locked():
+            return super().__contains__(key)
+
+    def __len__(self):
+        with self._lock.read_locked():
+            return super().__len__()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        with self._lock.read_locked():
+            return list(self.data.keys())
+
+    def values(self):
+        with self._lock.read_locked():
+            return list(self.data.values())
+
+    def items(self):
+        with self._lock.read_locked():
+            return list(self.data.items())
@@ -0,0 +1,245 @@
+"""A compact, append-only binary log of who changed which contact and when.
+
+The log is a directory of segment files, `audit-<first timestamp>.log`,
+each with a sparse time index `audit-<first timestamp>.idx`. A record is
+
+    crc32 (I) | time in ns (q) | kind (B) | user, name, command lengths (3 x H) | user | name | command
+
+with the strings in UTF-8 and the crc32 over everything after it. Every
+`INDEX_INTERVAL` bytes of log, the time and offset of the next record go
+to the index (16 bytes), so a time-range query picks the segments by
+their names, bisects their index and reads only the records in range.
+A segment is closed after `SEGMENT_SIZE` bytes, and the oldest segments
+are deleted beyond `max_segments` or `retention` seconds.
+
+One process appends at a time; times are kept non-decreasing within it.
+A record cut short by a crash ends the segment and is dropped when the
+segment is opened for appending again.
+"""
+import os
+import struct
+import time
+import zlib
+from bisect import bisect_left
+
+RECORD = struct.Struct("<IqBHHH")
+INDEX_ENTRY = struct.Struct("<qQ")
+KINDS = ("add", "update", "delete", "bulk")
+SEGMENT_SIZE = 4 * 1024 * 1024
+INDEX_INTERVAL = 4096
+MAX_SEGMENTS = 16
+SEGMENT_PREFIX = "audit-"
+LOG_SUFFIX = ".log"
+INDEX_SUFFIX = ".idx"
+# Longest user, name or command kept, in bytes (a length must fit in H)
+MAX_FIELD = 0xFFFF
+
+
+def audit_dir(book_file):
+    """Return the directory of the audit log of a book file."""
+    return book_file.rstrip("/\\") + ".audit"
+
+
+def _encode(value):
+    data = value.encode("utf-8")
+    if len(data) > MAX_FIELD:
+        data = data[:MAX_FIELD].decode("utf-8", "ignore").encode("utf-8")
+    return data
+
+
+def _read_records(f, end_time=None):
+    """Yield (offset, time, kind, user, name, command) from the position of `f` on.
+
+    Stops at the end of the segment, at a damaged or cut-short record, or
+    after `end_time`.
+    """
+    offset = f.tell()
+    while True:
+        header = f.read(RECORD.size)
+        if len(header) < RECORD.size:
+            return
+        crc, stamp, kind, user_len, name_len, command_len = RECORD.unpack(header)
+        if end_time is not None and stamp > end_time:
+            return
+        body = f.read(user_len + name_len + command_len)
+        if len(body) < user_len + name_len + command_len or kind >= len(KINDS) \
+                or zlib.crc32(header[4:] + body) != crc:
+            return
+        user = body[:user_len].decode("utf-8")
+        name = body[user_len:user_len + name_len].decode("utf-8")
+        command = body[user_len + name_len:].decode("utf-8")
+        yield offset, stamp, KINDS[kind], user, name, command
+        offset += RECORD.size + len(body)
+
+
+class AuditLog:
+    """Appends audit records to a log directory and answers time-range queries."""
+
+    def __init__(self, directory, segment_size=SEGMENT_SIZE, max_segments=MAX_SEGMENTS, retention=None):
+        """
+        Args:
+            directory (str): The log directory; created on the first append.
+            segment_size (int): Bytes after which a new segment is started.
+            max_segments (int): How many segments are kept.
+            retention (float, optional): Segments whose records are all older
+                than this many seconds are deleted.
+        """
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        self.retention = retention
+        self._log = self._index = None
+        self._size = 0
+        self._next_index = 0
+        self._last_time = 0
+
+    def _segments(self):
+        """Return the first timestamps of the segments, oldest first."""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(int(name[len(SEGMENT_PREFIX):-len(LOG_SUFFIX)]) for name in names
+                      if name.startswith(SEGMENT_PREFIX) and name.endswith(LOG_SUFFIX))
+
+    def _path(self, first, suffix):
+        return os.path.join(self.directory, f"{SEGMENT_PREFIX}{first:020d}{suffix}")
+
+    def _read_index(self, first):
+        try:
+            with open(self._path(first, INDEX_SUFFIX), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return []
+        # A cut-short last entry is ignored
+        return list(INDEX_ENTRY.iter_unpack(data[:len(data) - len(data) % INDEX_ENTRY.size]))
+
+    def _open_segment(self, now):
+        """Open the newest segment for appending, or start one."""
+        os.makedirs(self.directory, exist_ok=True)
+        segments = self._segments()
+        if segments and os.path.getsize(self._path(segments[-1], LOG_SUFFIX)) < self.segment_size:
+            first = segments[-1]
+            path = self._path(first, LOG_SUFFIX)
+            size = os.path.getsize(path)
+            index = self._read_index(first)
+            with open(path, 'rb') as f:
+                # Find the end of the last whole record, starting from the last indexed one
+                inside = [entry for entry in index if entry[1] < size]
+                f.seek(inside[-1][1] if inside else 0)
+                end, last = f.tell(), self._last_time
+                for _, stamp, *_ in _read_records(f):
+                    end, last = f.tell(), stamp
+            self._log = open(path, 'r+b')
+            self._log.truncate(end)
+            self._log.seek(end)
+            valid = [entry for entry in index if entry[1] < end]
+            if len(valid) != len(index):
+                # Entries of records that didn't make it to the log
+                with open(self._path(first, INDEX_SUFFIX), 'wb') as f:
+                    f.writelines(INDEX_ENTRY.pack(*entry) for entry in valid)
+            self._size = end
+            self._next_index = valid[-1][1] + INDEX_INTERVAL if valid else 0
+            self._last_time = max(self._last_time, last)
+        else:
+            first = now
+            self._log = open(self._path(first, LOG_SUFFIX), 'wb')
+            self._size = self._next_index = 0
+        self._index = open(self._path(first, INDEX_SUFFIX), 'ab')
+        self._enforce_retention(now)
+
+    def _enforce_retention(self, now):
+        segments = self._segments()
+        # Never the segment being written, which is the newest
+        old = segments[:-1]
+        drop = max(len(segments) - self.max_segments, 0)
+        if self.retention is not None:
+            # A segment ends where the next one starts
+            limit = now - int(self.retention * 1e9)
+            drop = max(drop, sum(1 for end in segments[1:] if end < limit))
+        for first in old[:drop]:
+            for suffix in (LOG_SUFFIX, INDEX_SUFFIX):
+                try:
+                    os.remove(self._path(first, suffix))
+                except FileNotFoundError:
+                    pass
+
+    def append(self, kind, user, name, command, stamp=None):
+        """Append one record.
+
+        Args:
+            kind (str): One of KINDS ("bulk" is a command whose single
+                changes were too many to list).
+            user (str): Who made the change.
+            name (str): The contact.
+            command (str): The command line that made the change.
+            stamp (int, optional): Time in ns since the epoch; now by default.
+
+        Returns:
+            None
+        """
+        now = time.time_ns() if stamp is None else stamp
+        # Keep the times of the log in order, so the index can be bisected
+        now = self._last_time = max(now, self._last_time)
+        if self._log is None:
+            self._open_segment(now)
+        elif self._size >= self.segment_size:
+            self.close()
+            self._open_segment(now)
+        user, name, command = _encode(user), _encode(name), _encode(command)
+        header = RECORD.pack(0, now, KINDS.index(kind), len(user), len(name), len(command))
+        body = user + name + command
+        record = struct.pack("<I", zlib.crc32(header[4:] + body)) + header[4:] + body
+        self._log.write(record)
+        if self._size >= self._next_index:
+            self._index.write(INDEX_ENTRY.pack(now, self._size))
+            self._next_index = self._size + INDEX_INTERVAL
+        self._size += len(record)
+
+    def flush(self):
+        """Push the appended records to the operating system."""
+        if self._log is not None:
+            # The log first, so the index never points past its end
+            self._log.flush()
+            self._index.flush()
+
+    def close(self):
+        if self._log is not None:
+            self.flush()
+            self._log.close()
+            self._index.close()
+            self._log = self._index = None
+
+    def query(self, start, end, name=None):
+        """Yield the records from `start` to `end` (inclusive), optionally of one contact only.
+
+        Only the segments overlapping the range are opened, and each is read
+        from the last index entry before `start`.
+
+        Args:
+            start (int): Time in ns since the epoch.
+            end (int): Time in ns since the epoch.
+            name (str, optional): Only the records of this contact.
+
+        Yields:
+            tuple: (time in ns, kind, user, name, command), oldest first.
+        """
+        self.flush()
+        segments = self._segments()
+        for i, first in enumerate(segments):
+            if first > end:
+                return
+            if i + 1 < len(segments) and segments[i + 1] < start:
+                continue
+            index = self._read_index(first)
+            position = bisect_left(index, (start,)) - 1
+            try:
+                f = open(self._path(first, LOG_SUFFIX), 'rb')
+            except FileNotFoundError:
+                # Deleted by retention meanwhile
+                continue
+            with f:
+                f.seek(index[position][1] if position >= 0 else 0)
+                for _, stamp, kind, user, record_name, command in _read_records(f, end):
+                    if stamp >= start and (name is None or record_name == name):
+                        yield stamp, kind, user, record_name, command
@@ -0,0 +1,326 @@
+"""Address book snapshots with a checksum per block of records.
+
+A book file whose name ends with `.blocks` is
+
+    FILE_MAGIC
+    block, block, ...   header (BLOCK_MAGIC, number, records, length, crc32 of the data) + data
+    index               (offset, length, records, crc32) of every block
+    trailer             (offset of the index, number of blocks, crc32 of the index, END_MAGIC)
+
+where the data of a block is up to BLOCK_RECORDS entries in the
+save_to_file format ({name: entry, ...}), compressed with zlib. Every
+block is compressed and checked on its own, so a damaged byte costs the
+records of one block instead of the whole book (in a gzip stream,
+everything after it), and blocks can be checked and decoded in parallel
+processes: the index lets every worker seek straight to its blocks. If the
+index or the trailer is damaged, the blocks are found by scanning the file
+for their headers instead.
+"""
+import json
+import os
+import shutil
+import struct
+import time
+import zlib
+from itertools import islice
+
+from Utils.sharding import parallel_map
+
+BLOCKS_SUFFIX = ".blocks"
+QUARANTINE_SUFFIX = ".quarantine"
+FILE_MAGIC = b"ABBLOCK1"
+BLOCK_MAGIC = b"BLK1"
+END_MAGIC = b"END1"
+BLOCK_HEADER = struct.Struct("<4sIIII")
+INDEX_ENTRY = struct.Struct("<QIII")
+TRAILER = struct.Struct("<QII4s")
+BLOCK_RECORDS = 1000
+ZLIB_LEVEL = 6
+# Fewer blocks per worker process don't pay for sending the job
+MIN_BLOCKS_PER_JOB = 16
+# Bytes read at a time while looking for the next block header
+SCAN_SIZE = 1 << 20
+
+
+class DamagedBlocksError(ValueError):
+    """Blocks of a `.blocks` file failed their checksum; `damaged` lists them (see `verify_blocks`)."""
+
+    def __init__(self, file_name, damaged):
+        super().__init__(f"{file_name} has {len(damaged)} damaged block(s), first at byte {damaged[0][1]}; "
+                         f"run 'verify {file_name}' for the list")
+        self.file_name = file_name
+        self.damaged = damaged
+
+
+def is_blocks(file_name):
+    """Return True if `file_name` names a block file."""
+    return file_name.endswith(BLOCKS_SUFFIX)
+
+
+def quarantine_dir(file_name):
+    """Return the directory where the damaged parts of a book file are kept."""
+    return file_name.rstrip("/\\") + QUARANTINE_SUFFIX
+
+
+def dump_blocks(data, file_name, block_records=BLOCK_RECORDS):
+    """Write `data` (the save_to_file format) as a block file.
+
+    The file is written under a temporary name and renamed, so a crash
+    never leaves half of it.
+    """
+    tmp = file_name + ".tmp"
+    index = []
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(FILE_MAGIC)
+            items = iter(data.items())
+            while True:
+                chunk = dict(islice(items, block_records))
+                if not chunk:
+                    break
+                payload = zlib.compress(json.dumps(chunk).encode("utf-8"), ZLIB_LEVEL)
+                crc = zlib.crc32(payload)
+                f.write(BLOCK_HEADER.pack(BLOCK_MAGIC, len(index), len(chunk), len(payload), crc))
+                index.append((f.tell() - BLOCK_HEADER.size, len(payload), len(chunk), crc))
+                f.write(payload)
+            index_offset = f.tell()
+            table = b"".join(INDEX_ENTRY.pack(*entry) for entry in index)
+            f.write(table)
+            f.write(TRAILER.pack(index_offset, len(index), zlib.crc32(table), END_MAGIC))
+        os.replace(tmp, file_name)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def _read_index(f, size):
+    """Return the blocks listed in the index, or None if the index or trailer is damaged."""
+    if size < len(FILE_MAGIC) + TRAILER.size:
+        return None
+    f.seek(size - TRAILER.size)
+    index_offset, count, crc, magic = TRAILER.unpack(f.read(TRAILER.size))
+    if magic != END_MAGIC or index_offset + count * INDEX_ENTRY.size != size - TRAILER.size:
+        return None
+    f.seek(index_offset)
+    table = f.read(count * INDEX_ENTRY.size)
+    if zlib.crc32(table) != crc:
+        return None
+    return [(number, *entry) for number, entry in enumerate(INDEX_ENTRY.iter_unpack(table))]
+
+
+def _find(f, pattern, start, end):
+    """Return the offset of the next `pattern` in the file from `start` on, or `end`."""
+    position = start
+    while position < end:
+        f.seek(position)
+        chunk = f.read(min(SCAN_SIZE, end - position))
+        found = chunk.find(pattern)
+        if found >= 0:
+            return position + found
+        # A pattern may start at the end of this chunk
+        position += max(len(chunk) - len(pattern) + 1, 1)
+    return end
+
+
+def _scan(f, size):
+    """Find the blocks by their headers; return (blocks, damaged regions in between)."""
+    blocks, damaged = [], []
+    offset = len(FILE_MAGIC)
+    while offset < size:
+        f.seek(offset)
+        header = f.read(BLOCK_HEADER.size)
+        if len(header) == BLOCK_HEADER.size and header.startswith(BLOCK_MAGIC):
+            _, number, records, length, crc = BLOCK_HEADER.unpack(header)
+            if offset + BLOCK_HEADER.size + length <= size:
+                blocks.append((number, offset, length, records, crc))
+                offset += BLOCK_HEADER.size + length
+                continue
+            # Its data runs past the end of the file: the last block, cut short, or a damaged length
+            found = _find(f, BLOCK_MAGIC, offset + 1, size)
+            damaged.append((number, offset, found - offset, records,
+                            "cut short" if found == size else "damaged header"))
+        else:
+            found = _find(f, BLOCK_MAGIC, offset + 1, size)
+            # What follows the last block is the (damaged) index
+            damaged.append((None, offset, found - offset, None,
+                            "no block here" if found < size else "damaged index"))
+        offset = found
+    if not damaged or damaged[-1][4] != "damaged index":
+        damaged.append((None, size, 0, None, "damaged index"))
+    return blocks, damaged
+
+
+def locate_blocks(file_name):
+    """Return where the blocks of a block file are.
+
+    Returns:
+        tuple: (blocks as (number, offset, length of the data, records,
+        crc32), damaged regions as in `verify_blocks`); the regions are
+        only found when the index is damaged.
+
+    Raises:
+        FileNotFoundError: If the file doesn't exist.
+        ValueError: If it is not a block file.
+    """
+    with open(file_name, 'rb') as f:
+        size = f.seek(0, os.SEEK_END)
+        blocks = _read_index(f, size)
+        if blocks is not None:
+            return blocks, []
+        f.seek(0)
+        if f.read(len(FILE_MAGIC)) != FILE_MAGIC:
+            raise ValueError(f"{file_name} is not a block address book")
+        return _scan(f, size)
+
+
+def _check_blocks(job):
+    """Check (and decode) some blocks of a file; runs in a worker process.
+
+    Returns:
+        tuple: (decoded blocks, damaged blocks).
+    """
+    file_name, blocks, decode = job
+    decoded, damaged = [], []
+    with open(file_name, 'rb') as f:
+        for number, offset, length, records, crc in blocks:
+            f.seek(offset + BLOCK_HEADER.size)
+            payload = f.read(length)
+            if len(payload) < length:
+                reason = "cut short"
+            elif zlib.crc32(payload) != crc:
+                reason = "checksum mismatch"
+            elif not decode:
+                continue
+            else:
+                try:
+                    data = json.loads(zlib.decompress(payload))
+                except (zlib.error, ValueError) as e:
+                    reason = f"can't be decoded: {e}"
+                else:
+                    decoded.append(data)
+                    continue
+            damaged.append((number, offset, BLOCK_HEADER.size + length, records, reason))
+    return decoded, damaged
+
+
+def _check_all(file_name, blocks, decode, workers):
+    """Run `_check_blocks` over all blocks, split in contiguous runs between the workers."""
+    cpus = workers if workers is not None else os.cpu_count() or 1
+    per_job = max(MIN_BLOCKS_PER_JOB, -(-len(blocks) // cpus))
+    jobs = [(file_name, blocks[i:i + per_job], decode) for i in range(0, len(blocks), per_job)]
+    decoded, damaged = [], []
+    for job_decoded, job_damaged in parallel_map(_check_blocks, jobs, workers):
+        decoded.extend(job_decoded)
+        damaged.extend(job_damaged)
+    return decoded, damaged
+
+
+def verify_blocks(file_name, workers=None):
+    """Check every block of a block file against its checksum, in parallel processes.
+
+    Args:
+        file_name (str): The block file.
+        workers (int, optional): Number of processes, one per CPU by default.
+
+    Returns:
+        tuple: (number of blocks found, damaged regions as (block number or
+        None, offset, size in bytes, records or None, reason), in file order).
+
+    Raises:
+        FileNotFoundError: If the file doesn't exist.
+        ValueError: If it is not a block file.
+    """
+    blocks, damaged = locate_blocks(file_name)
+    _, bad = _check_all(file_name, blocks, False, workers)
+    return len(blocks), sorted(damaged + bad, key=lambda region: region[1])
+
+
+def _lost(damaged):
+    """The damaged regions that may have held records (a damaged index alone loses none)."""
+    return [region for region in damaged if region[4] != "damaged index"]
+
+
+def quarantine(file_name, damaged):
+    """Copy the bytes of damaged regions to `quarantine_dir(file_name)`, one file each.
+
+    Returns:
+        str: The quarantine directory.
+    """
+    directory = quarantine_dir(file_name)
+    os.makedirs(directory, exist_ok=True)
+    with open(file_name, 'rb') as f:
+        for number, offset, size, _, _ in damaged:
+            f.seek(offset)
+            label = "region" if number is None else f"block-{number:06d}"
+            with open(os.path.join(directory, f"{label}-at-{offset}.bin"), 'wb') as out:
+                out.write(f.read(size))
+    return directory
+
+
+def quarantine_file(file_name):
+    """Copy a whole book file (or `.shards` directory) into its quarantine directory.
+
+    Used before a save would drop entries that couldn't be loaded from it.
+
+    Returns:
+        str: Where the copy is.
+    """
+    directory = quarantine_dir(file_name)
+    os.makedirs(directory, exist_ok=True)
+    kept = os.path.join(directory, time.strftime("%Y%m%d-%H%M%S-") + os.path.basename(file_name.rstrip("/\\")))
+    if os.path.isdir(file_name):
+        shutil.copytree(file_name, kept)
+    else:
+        shutil.copy2(file_name, kept)
+    return kept
+
+
+def load_blocks(file_name, workers=None, keep_damaged=False):
+    """Read a block file, checking and decoding its blocks in parallel processes.
+
+    Args:
+        file_name (str): The block file.
+        workers (int, optional): Number of processes, one per CPU by default.
+        keep_damaged (bool): What to do with damaged blocks: False raises
+            DamagedBlocksError; True copies them to the quarantine directory
+            and leaves their records out.
+
+    Returns:
+        tuple: (dict in the save_to_file format, damaged regions left out, see `verify_blocks`).
+
+    Raises:
+        FileNotFoundError: If the file doesn't exist.
+        ValueError: If it is not a block file.
+        DamagedBlocksError: If a block is damaged and `keep_damaged` is False.
+    """
+    blocks, damaged = locate_blocks(file_name)
+    decoded, bad = _check_all(file_name, blocks, True, workers)
+    damaged = sorted(_lost(damaged) + bad, key=lambda region: region[1])
+    if damaged:
+        if not keep_damaged:
+            raise DamagedBlocksError(file_name, damaged)
+        quarantine(file_name, damaged)
+    data = {}
+    for block in decoded:
+        data.update(block)
+    return data, damaged
+
+
+def iter_blocks(file_name):
+    """Yield the decoded blocks of a block file in order, reading one block at a time.
+
+    Raises:
+        FileNotFoundError: If the file doesn't exist.
+        ValueError: If it is not a block file.
+        DamagedBlocksError: At a damaged block.
+    """
+    blocks, damaged = locate_blocks(file_name)
+    damaged = _lost(damaged)
+    if damaged:
+        raise DamagedBlocksError(file_name, damaged)
+    for block in blocks:
+        decoded, bad = _check_blocks((file_name, [block], True))
+        if bad:
+            raise DamagedBlocksError(file_name, bad)
+        yield decoded[0]
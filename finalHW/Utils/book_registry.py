@@ -0,0 +1,41 @@
+import os
+
+from Classes.AddressBook import AddressBook
+
+# Absolute file path -> loaded AddressBook, shared by the whole process.
+_books = {}
+
+
+def get_book(file_name, book_cls=AddressBook):
+    """Return the address book stored in `file_name`, loading it only once per process.
+
+    Every caller asking for the same file gets the same AddressBook object,
+    so there is a single in-memory copy that all of them read and update.
+
+    Args:
+        file_name (str): Path of the address book file.
+        book_cls (type): AddressBook class used if the book has to be loaded.
+
+    Returns:
+        AddressBook: The shared book; an empty one if the file doesn't exist yet.
+    """
+    key = os.path.abspath(file_name)
+    book = _books.get(key)
+    if book is None:
+        book = _books[key] = book_cls.load_from_file(file_name)
+    return book
+
+
+def forget(file_name=None):
+    """Drop a book (or all books) from the registry, so the next get_book reloads it.
+
+    Args:
+        file_name (str, optional): The book to forget; all books if omitted.
+
+    Returns:
+        None
+    """
+    if file_name is None:
+        _books.clear()
+    else:
+        _books.pop(os.path.abspath(file_name), None)
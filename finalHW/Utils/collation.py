@@ -0,0 +1,68 @@
+"""Collation keys of the sorted `show` orders.
+
+Each function maps a record to a tuple that sorts the records in one order
+and is unique per contact (the name is the last element), so it can be the
+key of a PersistentSortedMap. Records that lack the sorted field get a
+leading 1 and go after all the others.
+"""
+from Classes.Birthday import parse_birthday
+
+
+def _name(record):
+    name = record.name.value
+    return name.casefold(), name
+
+
+def _iso_birthday(record):
+    # Normalises forms such as '1978-1-1' so dates compare as strings
+    return parse_birthday(str(record.birthday)).date().isoformat()
+
+
+def by_name(record):
+    return _name(record)
+
+
+def by_birthday(record):
+    if not record.birthday:
+        return (1, "") + _name(record)
+    return (0, _iso_birthday(record)) + _name(record)
+
+
+def by_next_birthday(record):
+    """Order by month and day, so the view can be read starting from today's date."""
+    if not record.birthday:
+        return (1, "") + _name(record)
+    return (0, _iso_birthday(record)[5:]) + _name(record)
+
+
+def by_phone(record):
+    phones = record.get_all_phones()
+    if not phones:
+        return (1, "") + _name(record)
+    return (0, min(phones)) + _name(record)
+
+
+# Sort name accepted by `show` -> collation key function
+SORT_KEYS = {
+    "name": by_name,
+    "birthday": by_birthday,
+    "next-birthday": by_next_birthday,
+    "phone": by_phone,
+}
+
+# Types of the elements of the keys of each order, to check the keys that come back in a cursor
+KEY_TYPES = {
+    "name": (str, str),
+    "birthday": (int, str, str, str),
+    "next-birthday": (int, str, str, str),
+    "phone": (int, str, str, str),
+}
+
+
+def is_valid_key(sort, key):
+    """Return True if `key` has the shape of the keys of the order `sort` (an int for insertion order)."""
+    if sort is None:
+        return type(key) is int
+    types = KEY_TYPES.get(sort)
+    return types is not None and isinstance(key, tuple) and len(key) == len(types) \
+        and all(type(value) is kind for value, kind in zip(key, types))
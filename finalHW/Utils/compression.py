@@ -0,0 +1,116 @@
+"""Reading and writing address book snapshots, optionally compressed.
+
+The format is chosen by the file extension when writing (`.gz` for gzip,
+`.xz` for lzma, anything else is plain JSON) and by the magic bytes at the
+start of the file when reading, so a renamed file still loads. Both ways
+stream through the (de)compressor: the compressed bytes are never held in
+memory next to the JSON text.
+"""
+import json
+from contextlib import contextmanager
+
+GZIP_MAGIC = b"\x1f\x8b"
+XZ_MAGIC = b"\xfd7zXZ\x00"
+# gzip's default of 9 is several times slower than 6 for a few percent in size
+GZIP_LEVEL = 6
+XZ_PRESET = 6
+
+
+def format_from_name(file_name):
+    """Return "gzip", "xz" or None (plain JSON) for a file name."""
+    if file_name.endswith(".gz"):
+        return "gzip"
+    if file_name.endswith(".xz"):
+        return "xz"
+    return None
+
+
+def format_from_magic(file_name):
+    """Return "gzip", "xz" or None by looking at the first bytes of a file.
+
+    Raises:
+        FileNotFoundError: If the file doesn't exist.
+    """
+    with open(file_name, 'rb') as f:
+        head = f.read(len(XZ_MAGIC))
+    if head.startswith(GZIP_MAGIC):
+        return "gzip"
+    if head.startswith(XZ_MAGIC):
+        return "xz"
+    return None
+
+
+def open_snapshot(file_name, mode='r'):
+    """Open a snapshot as a text stream, (de)compressing on the fly.
+
+    Args:
+        file_name (str): The file.
+        mode (str): 'r' to read (format from the magic bytes) or 'w' to write
+            (format from the extension).
+
+    Returns:
+        file: A text stream; use it as a context manager.
+    """
+    compression = format_from_magic(file_name) if mode == 'r' else format_from_name(file_name)
+    return _open(file_name, mode, compression)
+
+
+def _open(file_name, mode, compression):
+    # Imported here, so starting the bot doesn't pay for modules a plain JSON book never needs
+    if compression == "gzip":
+        import gzip
+        return gzip.open(file_name, mode + 't', encoding="utf-8", compresslevel=GZIP_LEVEL)
+    if compression == "xz":
+        import lzma
+        return lzma.open(file_name, mode + 't', encoding="utf-8", preset=None if mode == 'r' else XZ_PRESET)
+    return open(file_name, mode, encoding="utf-8")
+
+
+def _stream_errors(compression):
+    """Exceptions the decompressor raises on corrupt or truncated data."""
+    if compression == "gzip":
+        import gzip
+        import zlib
+        return EOFError, gzip.BadGzipFile, zlib.error
+    if compression == "xz":
+        import lzma
+        return EOFError, lzma.LZMAError
+    return ()
+
+
+def dump_json(data, file_name):
+    """Write `data` as JSON to `file_name`, compressed according to its extension.
+
+    `json.dump` encodes piece by piece, so the whole JSON text is never built.
+    """
+    with open_snapshot(file_name, 'w') as f:
+        json.dump(data, f)
+
+
+@contextmanager
+def reading_snapshot(file_name):
+    """Open a snapshot for reading like `open_snapshot`, for code that reads it piece by piece.
+
+    Corrupt or truncated compressed data, found while reading inside the
+    `with` block, raises ValueError.
+
+    Raises:
+        FileNotFoundError: If the file doesn't exist.
+    """
+    compression = format_from_magic(file_name)
+    try:
+        with _open(file_name, 'r', compression) as f:
+            yield f
+    except _stream_errors(compression) as e:
+        raise ValueError(f"Corrupted snapshot {file_name}: {e}") from e
+
+
+def load_json(file_name):
+    """Read the JSON snapshot `file_name`, whatever its compression.
+
+    Raises:
+        FileNotFoundError: If the file doesn't exist.
+        ValueError: If it is not valid JSON, or the compressed data is corrupt or truncated.
+    """
+    with reading_snapshot(file_name) as f:
+        return json.load(f)
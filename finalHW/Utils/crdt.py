@@ -0,0 +1,277 @@
+"""Conflict-free merging of address books edited apart from each other (CRDTs).
+
+Every copy of a book keeps, next to its file, the replicated state of its
+records in `<book file>.crdt`:
+
+- the birthday is a last-writer-wins register: (stamp, value);
+- the phones are an add-wins set: every addition gets a unique tag, a
+  removal tombstones the tags it has seen, so a phone added on one copy
+  while another copy removed it survives the merge;
+- a deleted record keeps a tombstone (the stamp of the deletion); the
+  record is shown again if it is changed after that, on any copy.
+
+A stamp is "<nanoseconds in 16 hex digits>.<replica id>": a wall clock
+that never goes backwards on one copy, and the replica id breaks ties, so
+stamps are unique and totally ordered (as strings). A phone added in a
+change is tagged with the stamp of the change. Merging takes the union of
+the tags and the later of every stamp, so it is commutative, associative
+and idempotent: copies that saw the same edits show the same book,
+whatever the order of the merges. Tombstones are never dropped, since a copy that hasn't seen
+the deletion yet could bring the record back.
+
+The state learns about edits from the change feed of the book
+(`AddressBook.changes_since`), in O(changes); a file without a state (or
+a book whose feed doesn't reach back far enough) is compared record by
+record.
+"""
+import json
+import os
+import time
+
+from Classes.AddressBook import AddressBook
+
+CRDT_SUFFIX = ".crdt"
+CRDT_FORMAT = "address-book-crdt"
+
+
+def crdt_file(book_file):
+    """Return the name of the file with the replicated state of a book file."""
+    return book_file.rstrip("/\\") + CRDT_SUFFIX
+
+
+def _later(a, b):
+    """The later of two stamps (or stamped values), either of which may be None."""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return max(a, b)
+
+
+class RecordState:
+    """Replicated state of one contact; see the module docstring."""
+
+    __slots__ = ("birthday", "phones", "removed", "updated", "deleted")
+
+    def __init__(self):
+        # [stamp, "YYYY-MM-DD" or None], or None if never set
+        self.birthday = None
+        # phone -> set of the tags of its additions
+        self.phones = {}
+        # Tags of removed additions
+        self.removed = set()
+        # Stamps of the last change and of the last deletion
+        self.updated = None
+        self.deleted = None
+
+    @property
+    def visible(self):
+        return self.updated is not None and (self.deleted is None or self.updated > self.deleted)
+
+    def live_phones(self):
+        """The phones with an addition nobody removed, oldest addition first."""
+        live = [(min(tags - self.removed), phone) for phone, tags in self.phones.items()
+                if not tags <= self.removed]
+        return [phone for _, phone in sorted(live)]
+
+    def merge(self, other):
+        merged = RecordState()
+        merged.birthday = _later(self.birthday, other.birthday)
+        merged.phones = {phone: set(tags) for phone, tags in self.phones.items()}
+        for phone, tags in other.phones.items():
+            merged.phones.setdefault(phone, set()).update(tags)
+        merged.removed = self.removed | other.removed
+        merged.updated = _later(self.updated, other.updated)
+        merged.deleted = _later(self.deleted, other.deleted)
+        return merged
+
+    def to_data(self, name):
+        """Return the entry of the book file for this contact."""
+        return {"name": name, "phones": self.live_phones(),
+                "birthday": self.birthday[1] if self.birthday else None}
+
+    def to_json(self):
+        # A list rather than a dict: the field names would take a third of the file
+        return [self.updated, self.deleted, self.birthday,
+                {phone: sorted(tags) for phone, tags in self.phones.items()}, sorted(self.removed)]
+
+    @classmethod
+    def from_json(cls, data):
+        state = cls()
+        state.updated, state.deleted, state.birthday, phones, removed = data
+        state.phones = {phone: set(tags) for phone, tags in phones.items()}
+        state.removed = set(removed)
+        return state
+
+
+class CrdtBook:
+    """Replicated state of a whole book (name -> RecordState) on one copy."""
+
+    def __init__(self, replica=None, records=None, clock=0):
+        self.replica = replica or self._new_replica_id()
+        self.records = records if records is not None else {}
+        # Last time stamp handed out (or seen in a merge), in nanoseconds
+        self.clock = clock
+        # The book and version `observe` saw last; only meaningful in this process
+        self._book = None
+        self._version = None
+
+    @staticmethod
+    def _new_replica_id():
+        # Imported here: only `merge` makes a new state, and uuid would slow down every start
+        import uuid
+        return uuid.uuid4().hex[:12]
+
+    def _stamp(self):
+        now = time.time_ns()
+        self.clock = now if now > self.clock else self.clock + 1
+        return f"{self.clock:016x}.{self.replica}"
+
+    def observe(self, book):
+        """Record the edits of `book` since the last call as new stamps and tags.
+
+        Args:
+            book (AddressBook): The book this state belongs to.
+
+        Returns:
+            int: Number of contacts that changed.
+        """
+        try:
+            if self._book is not book:
+                raise ValueError("another book")
+            version, changes = book.changes_since(self._version)
+            entries = [(name, record and AddressBook._record_to_data(record)) for _, name, record in changes]
+        except ValueError:
+            # First look at the book, or the change feed doesn't reach back that far
+            snapshot = book.snapshot()
+            version = snapshot.version
+            entries = self._difference(AddressBook.convert_to_serializable(snapshot))
+        changed = sum(self._observe(name, entry) for name, entry in entries)
+        self._book, self._version = book, version
+        return changed
+
+    def observe_data(self, data):
+        """Like `observe`, for the records read from a file (the save_to_file format)."""
+        return sum(self._observe(name, entry) for name, entry in self._difference(data))
+
+    def _difference(self, data):
+        """(name, entry or None) for every record of `data` and every visible record missing from it."""
+        return list(data.items()) + [(name, None) for name, state in self.records.items()
+                                     if state.visible and name not in data]
+
+    def _observe(self, name, entry):
+        """Bring the state of `name` in line with its entry (None: deleted); return True if it changed."""
+        state = self.records.get(name)
+        if entry is None:
+            if state is None or not state.visible:
+                return False
+            state.deleted = self._stamp()
+            for tags in state.phones.values():
+                state.removed |= tags
+            return True
+        if state is None:
+            state = self.records[name] = RecordState()
+        live = state.live_phones()
+        birthday = entry["birthday"]
+        if state.visible and set(live) == set(entry["phones"]) \
+                and (state.birthday[1] if state.birthday else None) == birthday:
+            return False
+        stamp = state.updated = self._stamp()
+        for phone in entry["phones"]:
+            if phone not in live:
+                state.phones.setdefault(phone, set()).add(stamp)
+        for phone in set(live) - set(entry["phones"]):
+            state.removed |= state.phones[phone]
+        if (state.birthday[1] if state.birthday else None) != birthday:
+            state.birthday = [stamp, birthday]
+        return True
+
+    def merge(self, other):
+        """Return the merge of this state and `other`, keeping this replica id.
+
+        Both sides are walked in name order at the same time, so the merge
+        is linear in the number of contacts (the sort finds the records
+        already in order when they come from a file).
+
+        Returns:
+            CrdtBook: The merged state.
+        """
+        mine = sorted(self.records.items())
+        theirs = sorted(other.records.items())
+        records = {}
+        i = j = 0
+        while i < len(mine) and j < len(theirs):
+            (name, state), (other_name, other_state) = mine[i], theirs[j]
+            if name == other_name:
+                records[name] = state.merge(other_state)
+                i += 1
+                j += 1
+            elif name < other_name:
+                records[name] = state
+                i += 1
+            else:
+                records[other_name] = other_state
+                j += 1
+        records.update(mine[i:])
+        records.update(theirs[j:])
+        # Stamps handed out later must be later than everything merged in
+        return CrdtBook(self.replica, records, max(self.clock, other.clock))
+
+    def to_data(self):
+        """Return the visible records in the save_to_file format."""
+        return {name: state.to_data(name) for name, state in self.records.items() if state.visible}
+
+    def save(self, file_name):
+        data = {"format": CRDT_FORMAT, "replica": self.replica, "clock": self.clock,
+                "records": [[name, state.to_json()] for name, state in sorted(self.records.items())]}
+        tmp = file_name + ".tmp"
+        with open(tmp, 'w', encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, file_name)
+
+    @classmethod
+    def load(cls, file_name):
+        """Load a saved state.
+
+        Raises:
+            FileNotFoundError: If there is no state.
+            ValueError: If the file is not a saved state.
+        """
+        with open(file_name, 'r', encoding="utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data, dict) or data.get("format") != CRDT_FORMAT:
+            raise ValueError(f"{file_name} is not a replicated address book state")
+        records = {name: RecordState.from_json(state) for name, state in data["records"]}
+        return cls(data["replica"], records, data["clock"])
+
+
+def merge_into(book, state, file_name):
+    """Merge another copy of the book, edited apart from this one, into `book`.
+
+    Args:
+        book (AddressBook): This copy.
+        state (CrdtBook): The replicated state of `book`.
+        file_name (str): The book file of the other copy; its state is read
+            from `crdt_file(file_name)` if it has one, otherwise every
+            record in it counts as edited now.
+
+    Returns:
+        tuple: (merged state, numbers of (added, updated, removed) records of `book`).
+
+    Raises:
+        FileNotFoundError: If the other book doesn't exist.
+        ValueError: If a file is not valid.
+    """
+    data, _ = AddressBook._read_data(file_name)
+    try:
+        theirs = CrdtBook.load(crdt_file(file_name))
+    except FileNotFoundError:
+        theirs = CrdtBook()
+    # Edits made after their state was last saved
+    theirs.observe_data(data)
+    state.observe(book)
+    merged = state.merge(theirs)
+    counts = book.replace_data(merged.to_data(), f"merge {file_name}")
+    # The book now shows the merged state; that is not a new edit
+    merged._book, merged._version = book, book.version
+    return merged, counts
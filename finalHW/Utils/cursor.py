@@ -0,0 +1,36 @@
+import base64
+import binascii
+import json
+
+
+def encode_cursor(sort, key, anchor=None):
+    """Pack the position after which the next page starts into an opaque string.
+
+    Args:
+        sort (str or None): The order being paged, None for insertion order.
+        key: Key of the last record returned (an int or a tuple of str/int).
+        anchor (str, optional): Extra state of the order, e.g. the day a
+            "next-birthday" listing started from.
+
+    Returns:
+        str: URL-safe cursor.
+    """
+    data = json.dumps([sort, key, anchor], separators=(",", ":"))
+    return base64.urlsafe_b64encode(data.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Reverse `encode_cursor`.
+
+    Returns:
+        tuple: (sort, key, anchor); a list key is turned back into a tuple.
+
+    Raises:
+        ValueError: If the cursor is not one made by `encode_cursor`.
+    """
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        sort, key, anchor = json.loads(data)
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor '{cursor}'") from e
+    return sort, tuple(key) if isinstance(key, list) else key, anchor
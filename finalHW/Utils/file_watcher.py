@@ -0,0 +1,29 @@
+import os
+
+
+class FileWatcher:
+    """Detects changes of a file by polling its metadata.
+
+    `changed()` costs one os.stat call, so it is cheap enough to run before
+    every command. The (mtime, size, inode) triple also catches tools that
+    replace the file atomically with a rename.
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self._stamp = self._current()
+
+    def _current(self):
+        try:
+            st = os.stat(self.file_name)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def changed(self):
+        """Return True if the file changed since the last `mark()` (or creation)."""
+        return self._current() != self._stamp
+
+    def mark(self):
+        """Accept the current state of the file, e.g. right after writing it ourselves."""
+        self._stamp = self._current()
@@ -0,0 +1,145 @@
+import threading
+from bisect import bisect_left
+
+# Upper bounds (seconds) of the latency histogram buckets, Prometheus style.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """A fixed-bucket latency histogram.
+
+    Recording a value is O(log buckets) and the memory use is constant no
+    matter how many values are recorded.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        # One extra slot for values above the last bound (the +Inf bucket)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        """Record one value."""
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """Estimate the q-quantile as the upper bound of the bucket that contains it.
+
+        Args:
+            q (float): Quantile between 0 and 1.
+
+        Returns:
+            float: The estimate, or 0.0 if nothing was recorded.
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def cumulative(self):
+        """Return (upper bound, cumulative count) pairs, ending with +Inf."""
+        result = []
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            seen += count
+            result.append((bound, seen))
+        return result
+
+
+class CommandStats:
+    """Call count, error count and latency histogram of one command."""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.latency = Histogram()
+
+
+class MetricsRegistry:
+    """Collects per-command statistics of the Bot."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._commands = {}
+
+    def observe(self, command, seconds, error=False):
+        """Record one call of `command`.
+
+        Args:
+            command (str): Command (or operation) name.
+            seconds (float): How long the call took.
+            error (bool): Whether the call raised an exception.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            stats = self._commands.get(command)
+            if stats is None:
+                stats = self._commands[command] = CommandStats()
+            stats.calls += 1
+            if error:
+                stats.errors += 1
+            stats.latency.observe(seconds)
+
+    def reset(self):
+        """Forget everything recorded so far."""
+        with self._lock:
+            self._commands.clear()
+
+    def items(self):
+        """Return (command, CommandStats) pairs sorted by command name."""
+        with self._lock:
+            return sorted(self._commands.items())
+
+    def to_prometheus(self, prefix="bot"):
+        """Render the statistics in the Prometheus text exposition format.
+
+        Args:
+            prefix (str): Prefix of every metric name.
+
+        Returns:
+            str: The exposition text.
+        """
+        items = self.items()
+        lines = [
+            f"# HELP {prefix}_command_calls_total Number of handled commands.",
+            f"# TYPE {prefix}_command_calls_total counter",
+        ]
+        lines += [f'{prefix}_command_calls_total{{command="{c}"}} {s.calls}' for c, s in items]
+        lines += [
+            f"# HELP {prefix}_command_errors_total Number of commands that raised an error.",
+            f"# TYPE {prefix}_command_errors_total counter",
+        ]
+        lines += [f'{prefix}_command_errors_total{{command="{c}"}} {s.errors}' for c, s in items]
+        lines += [
+            f"# HELP {prefix}_command_duration_seconds Command latency.",
+            f"# TYPE {prefix}_command_duration_seconds histogram",
+        ]
+        for command, stats in items:
+            for bound, count in stats.latency.cumulative():
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{prefix}_command_duration_seconds_bucket{{command="{command}",le="{le}"}} {count}')
+            lines.append(f'{prefix}_command_duration_seconds_sum{{command="{command}"}} {stats.latency.sum}')
+            lines.append(f'{prefix}_command_duration_seconds_count{{command="{command}"}} {stats.latency.count}')
+        return "\n".join(lines) + "\n"
+
+    def export(self, file_name, prefix="bot"):
+        """Write `to_prometheus()` to `file_name` (e.g. for the node exporter textfile collector)."""
+        with open(file_name, 'w', encoding="utf-8") as f:
+            f.write(self.to_prometheus(prefix))
+
+
+# The registry the Bot reports to.
+registry = MetricsRegistry()
@@ -0,0 +1,210 @@
+class _Node:
+    __slots__ = ("key", "value", "left", "right", "height", "size")
+
+    def __init__(self, key, value, left, right):
+        self.key = key
+        self.value = value
+        self.left = left
+        self.right = right
+        # Inlined instead of max()/_height(): node creation is the hot path of every write
+        if left is None:
+            if right is None:
+                self.height = self.size = 1
+            else:
+                self.height = right.height + 1
+                self.size = right.size + 1
+        elif right is None:
+            self.height = left.height + 1
+            self.size = left.size + 1
+        else:
+            self.height = (left.height if left.height > right.height else right.height) + 1
+            self.size = left.size + right.size + 1
+
+
+def _height(node):
+    return node.height if node else 0
+
+
+def _size(node):
+    return node.size if node else 0
+
+
+def _balance(key, value, left, right):
+    """Build a node from its parts, rotating once or twice if it is unbalanced."""
+    hl, hr = _height(left), _height(right)
+    if hl > hr + 1:
+        if _height(left.left) >= _height(left.right):
+            return _Node(left.key, left.value, left.left, _Node(key, value, left.right, right))
+        lr = left.right
+        return _Node(lr.key, lr.value,
+                     _Node(left.key, left.value, left.left, lr.left),
+                     _Node(key, value, lr.right, right))
+    if hr > hl + 1:
+        if _height(right.right) >= _height(right.left):
+            return _Node(right.key, right.value, _Node(key, value, left, right.left), right.right)
+        rl = right.left
+        return _Node(rl.key, rl.value,
+                     _Node(key, value, left, rl.left),
+                     _Node(right.key, right.value, rl.right, right.right))
+    return _Node(key, value, left, right)
+
+
+def _insert(node, key, value):
+    if node is None:
+        return _Node(key, value, None, None)
+    if key < node.key:
+        return _balance(node.key, node.value, _insert(node.left, key, value), node.right)
+    if node.key < key:
+        return _balance(node.key, node.value, node.left, _insert(node.right, key, value))
+    return _Node(key, value, node.left, node.right)
+
+
+def _pop_min(node):
+    if node.left is None:
+        return node.key, node.value, node.right
+    key, value, left = _pop_min(node.left)
+    return key, value, _balance(node.key, node.value, left, node.right)
+
+
+def _remove(node, key):
+    if key < node.key:
+        if node.left is None:
+            raise KeyError(key)
+        return _balance(node.key, node.value, _remove(node.left, key), node.right)
+    if node.key < key:
+        if node.right is None:
+            raise KeyError(key)
+        return _balance(node.key, node.value, node.left, _remove(node.right, key))
+    if node.left is None:
+        return node.right
+    if node.right is None:
+        return node.left
+    min_key, min_value, right = _pop_min(node.right)
+    return _balance(min_key, min_value, node.left, right)
+
+
+def _build(items, lo, hi):
+    if lo >= hi:
+        return None
+    mid = (lo + hi) // 2
+    key, value = items[mid]
+    return _Node(key, value, _build(items, lo, mid), _build(items, mid + 1, hi))
+
+
+def _walk(stack):
+    """Yield nodes in key order, starting with the nodes already on `stack`."""
+    while stack:
+        node = stack.pop()
+        yield node
+        node = node.right
+        while node is not None:
+            stack.append(node)
+            node = node.left
+
+
+class PersistentSortedMap:
+    """An immutable sorted mapping with structural sharing.
+
+    Every "modifying" method returns a new map and leaves the original
+    untouched. The two maps share all nodes except the O(log N) nodes on the
+    path to the changed key, so keeping many versions around costs memory
+    proportional to the changes, not to the size of the map.
+
+    The map is an AVL tree whose nodes also store their subtree size, so
+    `len` is O(1).
+    Keys must be mutually comparable.
+    """
+
+    __slots__ = ("_root",)
+
+    def __init__(self, root=None):
+        self._root = root
+
+    @classmethod
+    def from_sorted(cls, items):
+        """Build a map in O(N) from (key, value) pairs already sorted by unique key.
+
+        Args:
+            items (iterable): Pairs in strictly increasing key order.
+
+        Returns:
+            PersistentSortedMap: The new map.
+        """
+        items = list(items)
+        return cls(_build(items, 0, len(items)))
+
+    def __len__(self):
+        return _size(self._root)
+
+    def __bool__(self):
+        return self._root is not None
+
+    def _find(self, key):
+        node = self._root
+        while node is not None:
+            if key < node.key:
+                node = node.left
+            elif node.key < key:
+                node = node.right
+            else:
+                return node
+        return None
+
+    def __contains__(self, key):
+        return self._find(key) is not None
+
+    def __getitem__(self, key):
+        node = self._find(key)
+        if node is None:
+            raise KeyError(key)
+        return node.value
+
+    def get(self, key, default=None):
+        node = self._find(key)
+        return default if node is None else node.value
+
+    def set(self, key, value):
+        """Return a new map where `key` is bound to `value`."""
+        return PersistentSortedMap(_insert(self._root, key, value))
+
+    def delete(self, key):
+        """Return a new map without `key`; the same map if `key` is absent."""
+        if self._root is None or key not in self:
+            return self
+        return PersistentSortedMap(_remove(self._root, key))
+
+    def __iter__(self):
+        for node in self._iter_nodes():
+            yield node.key
+
+    def keys(self):
+        return iter(self)
+
+    def values(self):
+        for node in self._iter_nodes():
+            yield node.value
+
+    def items(self, start=None, inclusive=True):
+        """Iterate over (key, value) pairs in key order.
+
+        Args:
+            start: If given, begin at the first key greater than (or equal to,
+                when `inclusive`) `start`. Finding the start costs O(log N).
+            inclusive (bool): Whether a key equal to `start` is included.
+
+        Yields:
+            tuple: (key, value) pairs.
+        """
+        for node in self._iter_nodes(start, inclusive):
+            yield node.key, node.value
+
+    def _iter_nodes(self, start=None, inclusive=True):
+        stack = []
+        node = self._root
+        while node is not None:
+            if start is None or start < node.key or (inclusive and not node.key < start):
+                stack.append(node)
+                node = node.left
+            else:
+                node = node.right
+        return _walk(stack)
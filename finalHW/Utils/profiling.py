@@ -0,0 +1,27 @@
+def profile_call(func, *args, top=20, sort="cumulative", dump_file=None, **kwargs):
+    """Run `func(*args, **kwargs)` under cProfile.
+
+    cProfile and pstats are imported here, not at module level, so they
+    don't slow down the start of the Bot.
+
+    Args:
+        func (callable): The function to profile.
+        top (int): How many functions to include in the report.
+        sort (str): pstats sort key of the report.
+        dump_file (str, optional): Also save the raw stats here; open them
+            later with `python -m pstats <file>` or snakeviz.
+
+    Returns:
+        tuple: (result of the call, report text).
+    """
+    import cProfile
+    import io
+    import pstats
+
+    profiler = cProfile.Profile()
+    result = profiler.runcall(func, *args, **kwargs)
+    if dump_file:
+        profiler.dump_stats(dump_file)
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).strip_dirs().sort_stats(sort).print_stats(top)
+    return result, stream.getvalue()
@@ -0,0 +1,269 @@
+"""Primary -> replica replication of an address book over a socket (log shipping).
+
+The primary ships its change feed (`AddressBook.changes_since`) to every
+connected replica; the replica applies it and serves reads only. Messages
+are JSON objects, one per line:
+
+    replica -> primary  {"primary": id or null, "since": version or null}
+    primary -> replica  {"type": "snapshot", "primary": id, "version": v, "time": t, "records": {...}}
+                        {"type": "changes", "version": v, "time": t, "changes": [[kind, name, entry or null], ...]}
+                        {"type": "heartbeat", "version": v, "time": t}
+
+`records` and the entries are in the save_to_file format; kind is "add",
+"update" or "delete". A replica catches up from the version it applied
+last if the primary's feed still reaches back to it, and from a full
+snapshot otherwise (first connection, primary restarted, feed expired).
+Versions are only meaningful for one primary process, so every primary
+has a random id and a replica of another primary always gets a snapshot.
+"""
+import json
+import socket
+import threading
+import time
+import uuid
+
+from Classes.AddressBook import AddressBook
+from Utils.metrics import Histogram
+
+# How often the primary looks for new changes (seconds)
+POLL_INTERVAL = 0.05
+# A primary with nothing to ship still sends a heartbeat this often (seconds)
+HEARTBEAT_INTERVAL = 1.0
+# How long a replica waits before connecting again after losing the primary (seconds)
+RECONNECT_DELAY = 1.0
+# A replica that hears nothing for this long drops the connection (seconds)
+PRIMARY_TIMEOUT = 5 * HEARTBEAT_INTERVAL
+
+
+def parse_address(value):
+    """'host:port' -> (host, port); ':7070' and '7070' mean localhost.
+
+    Raises:
+        ValueError: If the port is not a number.
+    """
+    host, _, port = value.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def _send(stream, message):
+    stream.write(json.dumps(message, ensure_ascii=False) + "\n")
+    stream.flush()
+
+
+def _hang_up(connection):
+    """Close a connection another thread is reading through makefile().
+
+    close() alone would leave the socket open until the file objects are closed.
+    """
+    try:
+        connection.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+class ReplicationServer:
+    """Ships the changes of a primary book to the replicas that connect to it.
+
+    Every replica gets its own thread, which polls the change feed of the
+    book, so the book must be a ThreadSafeAddressBook.
+    """
+
+    def __init__(self, book, host="127.0.0.1", port=0):
+        self.book = book
+        self.id = uuid.uuid4().hex
+        self._listener = socket.create_server((host, port))
+        self._closed = threading.Event()
+        self._lock = threading.Lock()
+        self._replicas = {}
+        self.snapshots = 0
+
+    @property
+    def address(self):
+        """(host, port) the server listens on; useful with port 0."""
+        return self._listener.getsockname()[:2]
+
+    def start(self):
+        threading.Thread(target=self._accept, name="replication-accept", daemon=True).start()
+        return self
+
+    def close(self):
+        self._closed.set()
+        # Also wakes up the thread blocked in accept()
+        _hang_up(self._listener)
+        self._listener.close()
+        with self._lock:
+            for connection in self._replicas:
+                _hang_up(connection)
+
+    def _accept(self):
+        while not self._closed.is_set():
+            try:
+                connection, peer = self._listener.accept()
+            except OSError:
+                return
+            with self._lock:
+                self._replicas[connection] = {"peer": f"{peer[0]}:{peer[1]}", "version": None}
+            threading.Thread(target=self._serve, args=(connection,), daemon=True).start()
+
+    def _serve(self, connection):
+        """Send one replica a snapshot or the missing changes, then keep it up to date."""
+        try:
+            with connection, connection.makefile("r", encoding="utf-8") as reader, \
+                    connection.makefile("w", encoding="utf-8") as writer:
+                hello = json.loads(reader.readline() or "null")
+                if not isinstance(hello, dict):
+                    return
+                version = hello.get("since") if hello.get("primary") == self.id else None
+                last_sent = 0.0
+                while not self._closed.is_set():
+                    if version is None:
+                        version = self._send_snapshot(writer)
+                        last_sent = time.monotonic()
+                    try:
+                        current, changes = self.book.changes_since(version)
+                    except ValueError:
+                        # ChangesExpiredError, or a version this book never had
+                        version = None
+                        continue
+                    if changes:
+                        _send(writer, {"type": "changes", "version": current, "time": time.time(),
+                                       "changes": [[kind, name, record and AddressBook._record_to_data(record)]
+                                                   for kind, name, record in changes]})
+                    elif current == version and time.monotonic() - last_sent < HEARTBEAT_INTERVAL:
+                        self._closed.wait(POLL_INTERVAL)
+                        continue
+                    else:
+                        _send(writer, {"type": "heartbeat", "version": current, "time": time.time()})
+                    version, last_sent = current, time.monotonic()
+                    with self._lock:
+                        self._replicas[connection]["version"] = version
+        except (OSError, ValueError):
+            # The replica went away (or sent garbage); it reconnects on its own
+            pass
+        finally:
+            with self._lock:
+                self._replicas.pop(connection, None)
+
+    def _send_snapshot(self, writer):
+        # An open transaction may still be rolled back, so replicas don't see it yet
+        snapshot = self.book.committed_snapshot()
+        _send(writer, {"type": "snapshot", "primary": self.id, "version": snapshot.version,
+                       "time": time.time(), "records": AddressBook.convert_to_serializable(snapshot)})
+        with self._lock:
+            self.snapshots += 1
+        return snapshot.version
+
+    def stats(self):
+        """Return the connected replicas and how far behind each one is.
+
+        Returns:
+            dict: {"version": primary version, "snapshots": snapshots sent,
+            "replicas": {peer: versions behind}}.
+        """
+        version = self.book.committed_snapshot().version
+        with self._lock:
+            replicas = {replica["peer"]: max(version - replica["version"], 0) if replica["version"] is not None else None
+                        for replica in self._replicas.values()}
+            return {"version": version, "snapshots": self.snapshots, "replicas": replicas}
+
+
+class Replica:
+    """Keeps a book in line with a primary's, connecting again whenever the connection drops.
+
+    The book should be a ThreadSafeAddressBook that nothing else changes.
+    """
+
+    def __init__(self, book, host, port):
+        self.book = book
+        self.host = host
+        self.port = port
+        self.primary = None
+        # The primary's version the book matches, and the newest one we heard of
+        self.version = None
+        self.primary_version = None
+        self.connected = False
+        self.snapshots = 0
+        self.changes_applied = 0
+        self.last_message = None
+        # Seconds between the primary sending a change and the replica applying it
+        self.lag = Histogram()
+        self._closed = threading.Event()
+        self._synced = threading.Event()
+        self._socket = None
+
+    def start(self):
+        threading.Thread(target=self._run, name="replica", daemon=True).start()
+        return self
+
+    def wait_synced(self, timeout=None):
+        """Wait until the first snapshot has been applied.
+
+        Returns:
+            bool: False if it didn't arrive within `timeout` seconds.
+        """
+        return self._synced.wait(timeout)
+
+    def close(self):
+        self._closed.set()
+        if self._socket is not None:
+            _hang_up(self._socket)
+
+    def _run(self):
+        while not self._closed.is_set():
+            try:
+                self._follow()
+            except (OSError, ValueError, KeyError, TypeError):
+                pass
+            self.connected = False
+            self._closed.wait(RECONNECT_DELAY)
+
+    def _follow(self):
+        """Connect to the primary and apply what it sends until the connection drops."""
+        with socket.create_connection((self.host, self.port), timeout=PRIMARY_TIMEOUT) as self._socket, \
+                self._socket.makefile("r", encoding="utf-8") as reader, \
+                self._socket.makefile("w", encoding="utf-8") as writer:
+            _send(writer, {"primary": self.primary, "since": self.version})
+            self.connected = True
+            for line in reader:
+                self._apply(json.loads(line))
+                if self._closed.is_set():
+                    return
+
+    def _apply(self, message):
+        kind = message["type"]
+        if kind == "snapshot":
+            self.book.apply_snapshot(message["records"])
+            self.primary = message["primary"]
+            self.snapshots += 1
+            self._synced.set()
+        elif kind == "changes":
+            self.book.apply_changes(message["changes"])
+            self.changes_applied += len(message["changes"])
+            self.lag.observe(max(time.time() - message["time"], 0.0))
+        if kind != "heartbeat":
+            self.version = message["version"]
+        self.primary_version = message["version"]
+        self.last_message = time.monotonic()
+
+    def stats(self):
+        """Return the replication state and lag of this replica.
+
+        Returns:
+            dict: connected, primary version, applied version, versions
+            behind, seconds since the primary was last heard of, and the
+            average and maximum lag of applied changes in seconds.
+        """
+        behind = None
+        if self.version is not None and self.primary_version is not None:
+            behind = self.primary_version - self.version
+        return {
+            "connected": self.connected,
+            "primary_version": self.primary_version,
+            "version": self.version,
+            "behind": behind,
+            "silence": time.monotonic() - self.last_message if self.last_message is not None else None,
+            "snapshots": self.snapshots,
+            "changes": self.changes_applied,
+            "lag_avg": self.lag.sum / self.lag.count if self.lag.count else 0.0,
+            "lag_max": self.lag.max,
+        }
@@ -0,0 +1,68 @@
+import threading
+from contextlib import contextmanager
+
+
+class RWLock:
+    """A reader-writer lock.
+
+    Any number of readers may hold the lock at the same time, while a writer
+    gets exclusive access. Waiting writers block new readers, so a steady
+    stream of `find` calls cannot starve `add_record`/`delete`.
+
+    The lock is not reentrant: a thread holding it must not acquire it again.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    def acquire_read(self):
+        """Block until the lock can be shared with other readers."""
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+
+    def release_read(self):
+        """Release a shared hold of the lock."""
+        with self._cond:
+            self._readers -= 1
+            if self._readers == 0:
+                self._cond.notify_all()
+
+    def acquire_write(self):
+        """Block until the lock is held exclusively."""
+        with self._cond:
+            self._waiting_writers += 1
+            try:
+                while self._writer or self._readers:
+                    self._cond.wait()
+            finally:
+                self._waiting_writers -= 1
+            self._writer = True
+
+    def release_write(self):
+        """Release an exclusive hold of the lock."""
+        with self._cond:
+            self._writer = False
+            self._cond.notify_all()
+
+    @contextmanager
+    def read_locked(self):
+        """Context manager holding the lock in shared mode."""
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write_locked(self):
+        """Context manager holding the lock in exclusive mode."""
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
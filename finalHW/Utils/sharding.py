@@ -0,0 +1,166 @@
+"""Address books split into several shard files.
+
+A sharded book is a directory whose name ends with `.shards`:
+
+    address_book.shards/
+        manifest.json       {"format": ..., "shards": 16, "extension": ".json", "generation": 7}
+        shard-000.json      records whose crc32(name) % 16 == 0, in the save_to_file format
+        shard-001.json
+        ...
+
+The shards are parsed in parallel worker processes, and a save only
+rewrites the shards that contain changed records. Every shard is replaced
+atomically (written to a temporary file, then renamed), so a reader never
+sees half of a shard; but the shards of one save are renamed one after the
+other, so a reader running meanwhile may see some shards of the new save
+and some of the old one. The manifest is written last: a reader that
+watches it (see `watched_file`) reads the book again after the save and
+then sees all of it.
+"""
+import json
+import os
+import zlib
+
+from Utils.compression import dump_json, load_json
+
+SHARDS_SUFFIX = ".shards"
+MANIFEST = "manifest.json"
+MANIFEST_FORMAT = "address-book-shards"
+DEFAULT_SHARDS = 16
+
+
+def is_sharded(file_name):
+    """Return True if `file_name` names a sharded book (a `.shards` directory)."""
+    return file_name.rstrip("/\\").endswith(SHARDS_SUFFIX)
+
+
+def manifest_path(directory):
+    return os.path.join(directory, MANIFEST)
+
+
+def shard_of(name, shards):
+    """Return the shard number of a contact name.
+
+    crc32 is used instead of hash(), which is randomised per process.
+    """
+    return zlib.crc32(name.encode("utf-8")) % shards
+
+
+def shard_path(directory, shard, extension):
+    return os.path.join(directory, f"shard-{shard:03d}{extension}")
+
+
+def read_manifest(directory):
+    """Read the manifest of a sharded book.
+
+    Returns:
+        dict: The manifest.
+
+    Raises:
+        FileNotFoundError: If the book doesn't exist.
+        ValueError: If the manifest is not one of a sharded book.
+    """
+    with open(manifest_path(directory), 'r', encoding="utf-8") as f:
+        manifest = json.load(f)
+    if not isinstance(manifest, dict) or manifest.get("format") != MANIFEST_FORMAT:
+        raise ValueError(f"{directory} is not a sharded address book")
+    return manifest
+
+
+def write_manifest(directory, manifest):
+    _replace(manifest_path(directory), lambda tmp: _dump_text(manifest, tmp))
+
+
+def _dump_text(data, file_name):
+    with open(file_name, 'w', encoding="utf-8") as f:
+        json.dump(data, f)
+
+
+def _replace(file_name, write):
+    """Write a file through a temporary file and rename it over `file_name`."""
+    tmp = file_name + ".tmp"
+    write(tmp)
+    os.replace(tmp, file_name)
+
+
+def _write_shard(job):
+    file_name, data = job
+    # The temporary name must keep the extension that selects the compression
+    root, extension = os.path.splitext(file_name)
+    tmp = f"{root}.tmp{extension}"
+    dump_json(data, tmp)
+    os.replace(tmp, file_name)
+
+
+def _load_shard(file_name):
+    try:
+        return load_json(file_name)
+    except FileNotFoundError:
+        # A shard that never had a record may not have been written
+        return {}
+
+
+def parallel_map(func, items, workers):
+    """map() over `items` in up to `workers` processes (in this process if workers <= 1)."""
+    items = list(items)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(items))
+    if workers <= 1:
+        return [func(item) for item in items]
+    # Imported here: it pulls in multiprocessing, which a start with a small book never needs
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(workers) as pool:
+        return list(pool.map(func, items))
+
+
+def load_shards(directory, workers=None):
+    """Parse every shard of a sharded book in parallel.
+
+    Args:
+        directory (str): The `.shards` directory.
+        workers (int, optional): Number of processes, one per CPU by default.
+
+    Returns:
+        tuple: (manifest, list of the parsed shards, each a dict in the save_to_file format).
+
+    Raises:
+        FileNotFoundError: If the book doesn't exist.
+        ValueError: If the manifest or a shard is not valid.
+    """
+    manifest = read_manifest(directory)
+    files = [shard_path(directory, shard, manifest["extension"]) for shard in range(manifest["shards"])]
+    return manifest, parallel_map(_load_shard, files, workers)
+
+
+def save_shards(directory, manifest, shards, workers=None):
+    """Write some shards of a sharded book, then its manifest.
+
+    Args:
+        directory (str): The `.shards` directory; created if needed.
+        manifest (dict): The manifest to write; its generation is increased.
+        shards (dict): Shard number -> dict in the save_to_file format.
+        workers (int, optional): Number of processes, one per CPU by default.
+
+    Returns:
+        dict: The manifest as written.
+    """
+    os.makedirs(directory, exist_ok=True)
+    jobs = [(shard_path(directory, shard, manifest["extension"]), data) for shard, data in shards.items()]
+    # Starting processes and sending them the data only pays off for bigger saves
+    parallel_map(_write_shard, jobs, workers if len(jobs) > 1 else 1)
+    manifest = dict(manifest, generation=manifest.get("generation", 0) + 1)
+    write_manifest(directory, manifest)
+    return manifest
+
+
+def watched_file(file_name):
+    """Return the file whose changes mean the book changed: the manifest of a sharded book.
+
+    Every save rewrites the manifest last, so it changes after every save.
+    """
+    return manifest_path(file_name) if is_sharded(file_name) else file_name
+
+
+def new_manifest(shards=DEFAULT_SHARDS, extension=".json"):
+    return {"format": MANIFEST_FORMAT, "shards": shards, "extension": extension, "generation": 0}
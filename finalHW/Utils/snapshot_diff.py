@@ -0,0 +1,64 @@
+"""What changed between two address book snapshots.
+
+Both files are streamed in name order (see Utils.snapshot_stream) and
+walked side by side, so the diff takes O(N) comparisons after the sort and
+memory bounded by the sort runs, however big the files are.
+"""
+from Utils.snapshot_stream import RUN_SIZE, entry_birthday, sorted_entries
+
+_END = object()
+
+
+def entry_changes(old, new):
+    """Return the per-field differences of two entries of one contact.
+
+    Returns:
+        dict: {"phones": (added, removed)} and/or {"birthday": (old, new)};
+        empty if the contact didn't change (a different order of the same
+        phones is no change).
+    """
+    changes = {}
+    old_phones, new_phones = old.get("phones") or [], new.get("phones") or []
+    added = [phone for phone in new_phones if phone not in old_phones]
+    removed = [phone for phone in old_phones if phone not in new_phones]
+    if added or removed:
+        changes["phones"] = (added, removed)
+    if entry_birthday(old) != entry_birthday(new):
+        changes["birthday"] = (entry_birthday(old), entry_birthday(new))
+    return changes
+
+
+def diff_snapshots(old_file, new_file, run_size=RUN_SIZE, tmp_dir=None):
+    """Yield the contacts added, removed or modified from `old_file` to `new_file`.
+
+    Args:
+        old_file (str): The earlier snapshot (plain, compressed or sharded).
+        new_file (str): The later snapshot.
+        run_size (int): Entries of one file sorted in memory at a time.
+        tmp_dir (str, optional): Where the sorted runs are written.
+
+    Yields:
+        tuple: (kind, name, details) in name order: ("added", name, new entry),
+        ("removed", name, old entry) or ("modified", name, `entry_changes`).
+
+    Raises:
+        FileNotFoundError: If a file doesn't exist.
+        ValueError: If a file is not a valid snapshot.
+    """
+    old_entries = sorted_entries(old_file, run_size, tmp_dir)
+    new_entries = sorted_entries(new_file, run_size, tmp_dir)
+    old = next(old_entries, _END)
+    new = next(new_entries, _END)
+    while old is not _END or new is not _END:
+        if new is _END or (old is not _END and old[0] < new[0]):
+            yield "removed", old[0], old[1]
+            old = next(old_entries, _END)
+        elif old is _END or new[0] < old[0]:
+            yield "added", new[0], new[1]
+            new = next(new_entries, _END)
+        else:
+            changes = entry_changes(old[1], new[1])
+            if changes:
+                yield "modified", new[0], changes
+            old = next(old_entries, _END)
+            new = next(new_entries, _END)
@@ -0,0 +1,130 @@
+"""Merging many address book files into one, streaming.
+
+Every input is sorted by name into a temporary file first (see
+Utils.snapshot_stream), one input at a time. Then the sorted inputs are
+merged with a heap (`heapq.merge`): only one entry per input is in memory,
+and the merged book is written entry by entry as the names come out, so
+the memory doesn't grow with the number of contacts.
+"""
+import heapq
+import json
+import os
+import tempfile
+
+from Utils.blocks import is_blocks
+from Utils.compression import open_snapshot
+from Utils.sharding import is_sharded
+from Utils.snapshot_stream import RUN_SIZE, entry_birthday, sorted_entries
+
+
+def union(name, entries):
+    """The phones of every file (first seen first) and the birthday of the latest file that has one."""
+    phones = []
+    for entry in entries:
+        phones.extend(phone for phone in entry.get("phones") or [] if phone not in phones)
+    birthday = next((entry_birthday(entry) for entry in reversed(entries) if entry_birthday(entry)), None)
+    return {"name": name, "phones": phones, "birthday": birthday}
+
+
+def latest(name, entries):
+    """The entry of the latest file."""
+    return dict(entries[-1], name=name)
+
+
+def first(name, entries):
+    """The entry of the first file."""
+    return dict(entries[0], name=name)
+
+
+# How to combine the entries of a contact found in several files, given oldest file first
+POLICIES = {"union": union, "latest": latest, "first": first}
+
+
+def _spill_sorted(file_name, run_size, tmp_dir):
+    """Write the entries of `file_name` sorted by name to a temporary file, one JSON line each."""
+    f = tempfile.TemporaryFile('w+', encoding="utf-8", dir=tmp_dir)
+    try:
+        for item in sorted_entries(file_name, run_size, tmp_dir):
+            f.write(json.dumps(item, ensure_ascii=False))
+            f.write("\n")
+        f.seek(0)
+    except BaseException:
+        f.close()
+        raise
+    return f
+
+
+def _read_sorted(f, index):
+    for line in f:
+        name, entry = json.loads(line)
+        yield name, index, entry
+
+
+def merge_snapshots(file_names, out_file, policy="union", run_size=RUN_SIZE, tmp_dir=None):
+    """Merge address book files into one.
+
+    Args:
+        file_names (list of str): The books to merge (plain, compressed or
+            sharded), oldest first; "latest" and "first" refer to this order.
+        out_file (str): The merged book; compressed according to its
+            extension. It is written to a temporary file first and then
+            renamed, so it may be one of the inputs.
+        policy (str): One of POLICIES, for contacts found in several files.
+        run_size (int): Entries of one input sorted in memory at a time.
+        tmp_dir (str, optional): Where the sorted inputs are written.
+
+    Returns:
+        tuple: Numbers of (contacts written, contacts found in several files).
+
+    Raises:
+        FileNotFoundError: If an input doesn't exist.
+        ValueError: If an input is not a valid snapshot, the policy is
+            unknown or the output is a sharded or block book.
+    """
+    combine = POLICIES.get(policy)
+    if combine is None:
+        raise ValueError(f"Unknown merge policy '{policy}', use one of: {', '.join(POLICIES)}")
+    if is_sharded(out_file) or is_blocks(out_file):
+        raise ValueError("The merged book must be a JSON file, not a .shards directory or a .blocks file")
+    inputs = []
+    root, extension = os.path.splitext(out_file)
+    # Keep the extension, it selects the compression
+    tmp = f"{root}.tmp{extension}"
+    try:
+        for file_name in file_names:
+            inputs.append(_spill_sorted(file_name, run_size, tmp_dir))
+        written = conflicts = 0
+        with open_snapshot(tmp, 'w') as out:
+            out.write("{")
+            group = []
+            for name, _, entry in heapq.merge(*(_read_sorted(f, i) for i, f in enumerate(inputs))):
+                if group and group[0][0] != name:
+                    conflicts += len(group) > 1
+                    written = _write_entry(out, group, combine, written)
+                    group = []
+                group.append((name, entry))
+            if group:
+                conflicts += len(group) > 1
+                written = _write_entry(out, group, combine, written)
+            out.write("}")
+        os.replace(tmp, out_file)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    finally:
+        for f in inputs:
+            f.close()
+    return written, conflicts
+
+
+def _write_entry(out, group, combine, written):
+    """Write the combined entry of one contact; return the new count of written entries."""
+    name = group[0][0]
+    entry = combine(name, [entry for _, entry in group])
+    if written:
+        out.write(", ")
+    out.write(json.dumps(name, ensure_ascii=False))
+    out.write(": ")
+    out.write(json.dumps(entry, ensure_ascii=False))
+    return written + 1
@@ -0,0 +1,200 @@
+"""Reading address book snapshots record by record, without loading them.
+
+`iter_entries` parses the `{name: entry, ...}` object of a snapshot one
+entry at a time, holding a single read block in memory, so files bigger
+than the memory can be read. `sorted_entries` returns the entries in name
+order with an external sort: runs of `RUN_SIZE` entries are sorted in
+memory and written to temporary files, then merged with a heap.
+"""
+import heapq
+import json
+import os
+import tempfile
+from itertools import islice
+
+from Utils.blocks import is_blocks, iter_blocks
+from Utils.compression import reading_snapshot
+from Utils.sharding import is_sharded, read_manifest, shard_path
+
+# Characters read from the file at a time
+READ_SIZE = 1 << 16
+# Entries sorted in memory at a time; a smaller file is sorted without temporary files
+RUN_SIZE = 100_000
+
+_WHITESPACE = " \t\n\r"
+
+
+class _ObjectReader:
+    """Parses the top-level JSON object of a stream member by member."""
+
+    def __init__(self, stream, file_name):
+        self.stream = stream
+        self.file_name = file_name
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        """Read another block; return False at the end of the stream."""
+        if self.eof:
+            return False
+        block = self.stream.read(READ_SIZE)
+        if not block:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + block
+        self.pos = 0
+        return True
+
+    def _error(self, message):
+        return ValueError(f"{self.file_name} is not an address book snapshot: {message}")
+
+    def next_char(self):
+        """Skip whitespace and return the next character ('' at the end), without consuming it."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer) or not self._fill():
+                return self.buffer[self.pos:self.pos + 1]
+
+    def expect(self, chars):
+        char = self.next_char()
+        if not char or char not in chars:
+            raise self._error(f"expected {' or '.join(map(repr, chars))} at {char or 'the end'!r}")
+        self.pos += 1
+        return char
+
+    def value(self):
+        """Decode the JSON value at the current position, reading more until it is complete."""
+        self.next_char()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError as e:
+                # Most likely the value continues in the next block
+                if self._fill():
+                    continue
+                raise self._error(str(e)) from e
+            self.pos = end
+            return value
+
+    def members(self):
+        """Yield the (key, value) pairs of the object."""
+        self.expect("{")
+        if self.next_char() == "}":
+            self.pos += 1
+        else:
+            while True:
+                key = self.value()
+                if not isinstance(key, str):
+                    raise self._error("a name must be a string")
+                self.expect(":")
+                entry = self.value()
+                if not isinstance(entry, dict):
+                    # Only objects end unambiguously at the end of a block
+                    raise self._error(f"the entry of {key!r} is not an object")
+                yield key, entry
+                if self.expect(",}") == "}":
+                    break
+        if self.next_char():
+            raise self._error("extra data after the address book")
+
+
+def entry_birthday(entry):
+    """Return the birthday of an entry, or None; old files wrote a missing one as the string 'null'."""
+    birthday = entry.get("birthday")
+    return None if birthday in (None, 'null') else birthday
+
+
+def _iter_file(file_name):
+    with reading_snapshot(file_name) as f:
+        yield from _ObjectReader(f, file_name).members()
+
+
+def iter_entries(file_name):
+    """Yield the (name, entry) pairs of a snapshot in file order.
+
+    Args:
+        file_name (str): A plain, gzip or lzma compressed, block or sharded
+            book (a block file is decoded one block at a time).
+
+    Yields:
+        tuple: (name, entry in the save_to_file format).
+
+    Raises:
+        FileNotFoundError: If the file doesn't exist.
+        ValueError: If the file is not a valid snapshot.
+    """
+    if is_blocks(file_name):
+        for block in iter_blocks(file_name):
+            yield from block.items()
+        return
+    if not is_sharded(file_name):
+        yield from _iter_file(file_name)
+        return
+    manifest = read_manifest(file_name)
+    for shard in range(manifest["shards"]):
+        path = shard_path(file_name, shard, manifest["extension"])
+        if os.path.exists(path):
+            yield from _iter_file(path)
+
+
+def _write_run(run, directory):
+    f = tempfile.TemporaryFile('w+', encoding="utf-8", dir=directory)
+    for item in run:
+        f.write(json.dumps(item, ensure_ascii=False))
+        f.write("\n")
+    f.seek(0)
+    return f
+
+
+def _read_run(f):
+    for line in f:
+        yield json.loads(line)
+
+
+def sorted_entries(file_name, run_size=RUN_SIZE, tmp_dir=None):
+    """Yield the (name, entry) pairs of a snapshot in name order.
+
+    At most `run_size` entries are in memory at a time (plus one per run
+    while merging). A name that occurs more than once counts with its last
+    entry, as when the file is loaded.
+
+    Args:
+        file_name (str): See `iter_entries`.
+        run_size (int): Entries sorted in memory at a time.
+        tmp_dir (str, optional): Where the sorted runs are written.
+
+    Yields:
+        tuple: (name, entry), names in ascending order.
+
+    Raises:
+        FileNotFoundError: If the file doesn't exist.
+        ValueError: If the file is not a valid snapshot.
+    """
+    entries = ([name, seq, entry] for seq, (name, entry) in enumerate(iter_entries(file_name)))
+    runs = []
+    try:
+        while True:
+            run = list(islice(entries, run_size))
+            run.sort(key=lambda item: (item[0], item[1]))
+            if len(run) < run_size and not runs:
+                # Everything fits in one run
+                merged = iter(run)
+                break
+            if run:
+                runs.append(_write_run(run, tmp_dir))
+            if len(run) < run_size:
+                merged = heapq.merge(*map(_read_run, runs), key=lambda item: (item[0], item[1]))
+                break
+        previous = None
+        for item in merged:
+            if previous is not None and previous[0] != item[0]:
+                yield previous[0], previous[2]
+            previous = item
+        if previous is not None:
+            yield previous[0], previous[2]
+    finally:
+        for f in runs:
+            f.close()
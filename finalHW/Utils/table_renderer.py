@@ -0,0 +1,83 @@
+import sys
+
+BLUE = "\033[94m"
+RESET = "\033[0m"
+
+
+class TableRenderer:
+    """Renders records as a NAME | PHONES | BIRTHDAY table with few, large writes.
+
+    A page of records is formatted into one string and written with a single
+    `write` call. Column widths are computed once per page; they only ever
+    grow, so consecutive pages stay aligned. When the output is not a
+    terminal (a pipe or a file) the table has no colors, and `interactive`
+    is False so callers can skip their "press Enter" pauses.
+    """
+
+    COLUMNS = ("NAME", "PHONES", "BIRTHDAY")
+    MIN_WIDTH = 15
+    # Records per page when nobody reads the output page by page
+    STREAM_PAGE_SIZE = 2000
+
+    def __init__(self, stream=None, color=None):
+        """
+        Args:
+            stream (file, optional): Where to write, sys.stdout by default.
+            color (bool, optional): Use ANSI colors; by default only on a terminal.
+        """
+        self.stream = stream if stream is not None else sys.stdout
+        tty = self._isatty(self.stream)
+        self.color = tty if color is None else color
+        # Pausing needs someone at the keyboard as well as at the screen
+        self.interactive = tty and self._isatty(sys.stdin)
+        self._widths = [self.MIN_WIDTH] * len(self.COLUMNS)
+
+    @staticmethod
+    def _isatty(stream):
+        try:
+            return stream.isatty()
+        except (AttributeError, ValueError):
+            return False
+
+    @staticmethod
+    def cells(record):
+        """Return the column values of one record."""
+        return (record.name.value,
+                "; ".join([phone.value for phone in record.phones]),
+                str(record.birthday) if record.birthday else "N/A")
+
+    def render(self, records, header=True):
+        """Format a page of records.
+
+        Args:
+            records (list): The records of the page.
+            header (bool): Start with the column titles.
+
+        Returns:
+            str: The page, ending with a newline.
+        """
+        rows = [self.cells(record) for record in records]
+        if rows:
+            self._widths = [max(width, max(map(len, column)))
+                            for width, column in zip(self._widths, zip(*rows))]
+        name_w, phones_w, birthday_w = self._widths
+        if self.color:
+            line = f"{BLUE}{{:<{name_w}}}{RESET} | {BLUE}{{:^{phones_w}}}{RESET} | {BLUE}{{:^{birthday_w}}}{RESET}\n"
+            title = f"{BLUE}{{:^{name_w}}}{RESET} | {BLUE}{{:^{phones_w}}}{RESET} | {BLUE}{{:^{birthday_w}}}{RESET}\n"
+        else:
+            line = f"{{:<{name_w}}} | {{:^{phones_w}}} | {{:^{birthday_w}}}\n"
+            title = f"{{:^{name_w}}} | {{:^{phones_w}}} | {{:^{birthday_w}}}\n"
+        parts = []
+        if header:
+            parts.append(title.format(*self.COLUMNS))
+            parts.append("_" * (name_w + phones_w + birthday_w + 6) + "\n")
+        fmt = line.format
+        parts.extend([fmt(*row) for row in rows])
+        return "".join(parts)
+
+    def write(self, records, header=True):
+        """Render a page of records and write it in one call."""
+        self.stream.write(self.render(records, header))
+
+    def flush(self):
+        self.stream.flush()
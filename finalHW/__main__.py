@@ -1,8 +1,90 @@
-from Classes.CLIBot import Bot
+import sys
 
+from Classes.CLIBot import Bot, ADDRESS_BOOK_FILE
 
-if __name__ == "__main__":
 
-    bot = Bot()
-    bot.run()
+def parse_args(argv=None):
+    # argparse is only needed when options are given; importing it costs
+    # several milliseconds of every interactive start.
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Address book assistant bot.")
+    parser.add_argument("--book", default=ADDRESS_BOOK_FILE,
+                        help=f"address book file (default: {ADDRESS_BOOK_FILE})")
+    parser.add_argument("--tenant", metavar="ID",
+                        help="work on the book of this tenant instead of --book")
+    # The tenant, replication and thread-safe modules are imported only when their options are given
+    parser.add_argument("--tenants-dir",
+                        help="where the tenant books are stored (default: outputs/tenants)")
+    parser.add_argument("--replicate-on", metavar="HOST:PORT",
+                        help="be a primary: ship every change of the book to replicas connecting here")
+    parser.add_argument("--replica-of", metavar="HOST:PORT",
+                        help="be a read-only replica of the primary listening on HOST:PORT")
+    parser.add_argument("--batch", metavar="FILE",
+                        help="run the commands from FILE ('-' for stdin) instead of prompting")
+    parser.add_argument("--profile", metavar="FILE.pstats",
+                        help="profile the batch run and save the stats to FILE.pstats")
+    args = parser.parse_args(argv)
+    if args.profile and not args.batch:
+        parser.error("--profile requires --batch")
+    if args.tenant and args.book != ADDRESS_BOOK_FILE:
+        parser.error("--tenant and --book can't be used together")
+    if sum(map(bool, (args.tenant, args.replicate_on, args.replica_of))) > 1:
+        parser.error("--tenant, --replicate-on and --replica-of can't be used together")
+    for option in ("replicate_on", "replica_of"):
+        if getattr(args, option):
+            from Utils.replication import parse_address
+            try:
+                setattr(args, option, parse_address(getattr(args, option)))
+            except ValueError:
+                parser.error(f"--{option.replace('_', '-')} needs HOST:PORT")
+    return args
+
+
+if __name__ == "__main__":
 
+    if len(sys.argv) > 1:
+        args = parse_args()
+    else:
+        args = None
+    manager = replication = None
+    if args is not None and args.tenant:
+        from Classes.BookManager import BookManager, TENANTS_DIR
+        manager = BookManager(args.tenants_dir or TENANTS_DIR)
+        try:
+            bot = Bot.for_tenant(manager, args.tenant)
+        except ValueError as e:
+            sys.exit(str(e))
+    elif args is not None and args.replicate_on:
+        from Classes.ThreadSafeAddressBook import ThreadSafeAddressBook
+        from Utils.book_registry import get_book
+        from Utils.replication import ReplicationServer
+        # The replicas are served from other threads
+        book = get_book(args.book, ThreadSafeAddressBook)
+        try:
+            replication = ReplicationServer(book, *args.replicate_on).start()
+        except OSError as e:
+            sys.exit(f"Can't listen on {args.replicate_on[0]}:{args.replicate_on[1]}: {e}")
+        bot = Bot(args.book, book, replication=replication)
+    elif args is not None and args.replica_of:
+        from Classes.ThreadSafeAddressBook import ThreadSafeAddressBook
+        from Utils.replication import Replica, PRIMARY_TIMEOUT
+        book = ThreadSafeAddressBook()
+        replication = Replica(book, *args.replica_of).start()
+        if not replication.wait_synced(PRIMARY_TIMEOUT):
+            print(f"No answer from the primary at {args.replica_of[0]}:{args.replica_of[1]} yet, "
+                  f"the book is empty until it comes")
+        bot = Bot(args.book, book, read_only=True, replication=replication)
+    else:
+        bot = Bot(args.book if args else ADDRESS_BOOK_FILE)
+    if args is None or args.batch is None:
+        bot.run()
+    elif args.batch == "-":
+        bot.run_batch(sys.stdin, args.profile)
+    else:
+        with open(args.batch, encoding="utf-8") as f:
+            bot.run_batch(f, args.profile)
+    if manager is not None:
+        manager.close()
+    if replication is not None:
+        replication.close()
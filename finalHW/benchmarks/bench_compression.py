@@ -0,0 +1,75 @@
+"""Size, save time and load time of plain and compressed snapshots.
+
+    python -m benchmarks.bench_compression --sizes 10000 100000
+
+Every format is saved and loaded through `AddressBook.save_to_file` and
+`AddressBook.load_from_file`; results are printed as JSON.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+from Classes.AddressBook import AddressBook
+from benchmarks.generator import generate_book
+
+FORMATS = (".json", ".json.gz", ".json.xz")
+
+
+def best_of(runs, func):
+    """Return the shortest wall time of `runs` calls of `func`, in seconds."""
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run_size(size, seed, runs):
+    """Benchmark every format on a book of `size` contacts.
+
+    Returns:
+        list: One result row per format.
+    """
+    book = generate_book(size, seed)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        plain_bytes = None
+        for extension in FORMATS:
+            file_name = os.path.join(tmp, "book" + extension)
+            save = best_of(runs, lambda: book.save_to_file(file_name))
+            load = best_of(runs, lambda: AddressBook.load_from_file(file_name))
+            size_bytes = os.path.getsize(file_name)
+            if plain_bytes is None:
+                plain_bytes = size_bytes
+            results.append({
+                "format": extension,
+                "size": size,
+                "bytes": size_bytes,
+                "ratio": round(plain_bytes / size_bytes, 2),
+                "save_seconds": round(save, 4),
+                "load_seconds": round(load, 4),
+            })
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark compressed snapshots.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    report = {"seed": args.seed, "results": []}
+    for size in args.sizes:
+        report["results"].extend(run_size(size, args.seed, args.runs))
+    json.dump(report, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
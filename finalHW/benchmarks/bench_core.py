@@ -0,0 +1,226 @@
+"""Benchmarks of the address book hot paths.
+
+Every benchmark runs on a deterministic synthetic book (see
+`benchmarks.generator`) and reports wall time and peak traced memory.
+Results are printed as JSON, one document per run:
+
+    python -m benchmarks.bench_core --sizes 1000 10000 100000 --output results.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from Classes.AddressBook import AddressBook
+from Classes.Record import Record
+from benchmarks.generator import generate_book, generate_records
+
+# How many single-record operations to time per benchmark.
+SAMPLES = 10_000
+
+
+def bench_add_record(size, seed):
+    records = []
+    for name, phones, birthday in generate_records(size, seed):
+        record = Record(name, birthday)
+        for phone in phones:
+            record.add_phone(phone)
+        records.append(record)
+
+    def run():
+        book = AddressBook()
+        for record in records:
+            book.add_record(record)
+        return size
+    return run
+
+
+def bench_find_name(book, rng):
+    names = rng.choices(list(book.data), k=SAMPLES)
+
+    def run():
+        for name in names:
+            book.find_name(name)
+        return len(names)
+    return run
+
+
+def bench_lookup_phone(book, rng):
+    phones = [p.value for r in book.data.values() for p in r.phones]
+    numbers = rng.choices(phones, k=SAMPLES * 10)
+
+    def run():
+        for number in numbers:
+            book.lookup_phone(number)
+        return len(numbers)
+    return run
+
+
+def bench_find(book, rng):
+    queries = ["067", "1234", "Olena", "Koval", "1985-", "-02-"]
+    # Time the searches, not the query cache
+    book.cache_clear()
+
+    def run():
+        for query in queries:
+            book.find(query)
+        return len(queries)
+    return run
+
+
+def _with_phones(book, rng):
+    records = [r for r in book.data.values() if r.phones]
+    return rng.sample(records, k=min(SAMPLES, len(records)))
+
+
+def bench_add_phone(book, rng):
+    records = _with_phones(book, rng)
+
+    def run():
+        for i, record in enumerate(records):
+            record.add_phone(f"{i:010d}")
+        return len(records)
+    return run
+
+
+def bench_edit_phone(book, rng):
+    records = _with_phones(book, rng)
+
+    def run():
+        for record in records:
+            old = next(reversed(record.phones)).value
+            record.edit_phone(old, old[::-1])
+        return len(records)
+    return run
+
+
+def bench_remove_phone(book, rng):
+    records = _with_phones(book, rng)
+
+    def run():
+        for record in records:
+            if record.phones:
+                record.remove_phone(next(reversed(record.phones)).value)
+        return len(records)
+    return run
+
+
+def bench_days_to_birthday(book, rng):
+    records = [r for r in book.data.values() if r.birthday][:SAMPLES]
+
+    def run():
+        for record in records:
+            record.days_to_birthday()
+        return len(records)
+    return run
+
+
+def bench_save_to_file(book, file_name):
+    def run():
+        book.save_to_file(file_name)
+        return len(book)
+    return run
+
+
+def bench_load_from_file(book, file_name):
+    book.save_to_file(file_name)
+
+    def run():
+        return len(AddressBook.load_from_file(file_name))
+    return run
+
+
+def measure(name, size, setup, memory):
+    """Time the run returned by `setup()` and optionally trace its peak memory.
+
+    Memory tracing slows Python down considerably, so the timed run and the
+    traced run are separate calls. `setup` is called again for the traced
+    run, so it does the same work on the same state as the timed one
+    instead of repeating edits that already happened or hitting caches.
+
+    Returns:
+        dict: One result row.
+    """
+    run = setup()
+    start = time.perf_counter()
+    ops = run()
+    seconds = time.perf_counter() - start
+    peak = None
+    if memory:
+        run = setup()
+        tracemalloc.start()
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return {
+        "benchmark": name,
+        "size": size,
+        "ops": ops,
+        "seconds": round(seconds, 6),
+        "ops_per_sec": round(ops / seconds, 1) if seconds else None,
+        "peak_bytes": peak,
+    }
+
+
+def run_size(size, seed, memory, only=None):
+    """Run every benchmark (or those named in `only`) on a book of `size` contacts."""
+    book = generate_book(size, seed)
+    fd, file_name = tempfile.mkstemp(suffix=".json")
+    os.close(fd)
+    try:
+        cases = [
+            ("add_record", lambda: bench_add_record(size, seed)),
+            ("find_name", lambda: bench_find_name(book, random.Random(seed))),
+            ("lookup_phone", lambda: bench_lookup_phone(book, random.Random(seed))),
+            ("find", lambda: bench_find(book, random.Random(seed))),
+            ("days_to_birthday", lambda: bench_days_to_birthday(book, random.Random(seed))),
+            ("save_to_file", lambda: bench_save_to_file(book, file_name)),
+            ("load_from_file", lambda: bench_load_from_file(book, file_name)),
+            # These change the book, so every run gets a book of its own
+            ("add_phone", lambda: bench_add_phone(generate_book(size, seed), random.Random(seed))),
+            ("edit_phone", lambda: bench_edit_phone(generate_book(size, seed), random.Random(seed))),
+            ("remove_phone", lambda: bench_remove_phone(generate_book(size, seed), random.Random(seed))),
+        ]
+        results = []
+        for name, setup in cases:
+            if only and name not in only:
+                continue
+            results.append(measure(name, size, setup, memory))
+        return results
+    finally:
+        os.remove(file_name)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the address book core.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", nargs="+", help="run only these benchmarks")
+    parser.add_argument("--no-memory", action="store_true", help="skip the traced (slow) run")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    report = {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "results": [],
+    }
+    for size in args.sizes:
+        report["results"].extend(run_size(size, args.seed, not args.no_memory, args.only))
+
+    if args.output:
+        with open(args.output, 'w', encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Startup benchmark of the Bot: import time and wall clock to the first prompt.
+
+Run from the finalHW directory:
+
+    python -m benchmarks.bench_startup --sizes 0 10000 100000
+
+The results are printed as JSON and checked against STARTUP_BUDGET (see
+README.md); the exit status is 1 if any budget is exceeded.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.generator import write_snapshot
+
+FINAL_HW_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROMPT = b"... "
+
+# Milliseconds. Keep in sync with the "Startup budget" section of README.md.
+STARTUP_BUDGET = {
+    "import_ms": 50,
+    "first_prompt_ms": {0: 100, 10_000: 300, 100_000: 2_500},
+}
+
+
+def measure_imports(runs=5):
+    """Import Classes.CLIBot in fresh interpreters with -X importtime.
+
+    Returns:
+        dict: Best total import time and the slowest modules of that run.
+    """
+    best = None
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import Classes.CLIBot"],
+            cwd=FINAL_HW_DIR, capture_output=True, text=True, check=True)
+        modules = []
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "self [us]" in line:
+                continue
+            self_us, cumulative_us, name = line[len("import time:"):].split("|")
+            modules.append((name.rstrip(), int(self_us), int(cumulative_us)))
+        total = sum(cumulative for name, _, cumulative in modules if not name.startswith("  "))
+        if best is None or total < best[0]:
+            best = (total, modules)
+    total, modules = best
+    slowest = sorted(modules, key=lambda m: m[1], reverse=True)[:10]
+    return {
+        "import_ms": round(total / 1000, 2),
+        "slowest_modules": [{"module": n.strip(), "self_ms": round(s / 1000, 2)} for n, s, _ in slowest],
+    }
+
+
+def time_to_first_prompt(book_file, runs=3):
+    """Start the Bot on `book_file` and time how long it takes to print its prompt.
+
+    Returns:
+        float: Best wall clock time in milliseconds.
+    """
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, "__main__.py", "--book", book_file],
+            cwd=FINAL_HW_DIR, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        output = b""
+        while PROMPT not in output:
+            chunk = process.stdout.read1(4096)
+            if not chunk:
+                raise RuntimeError(f"Bot exited before prompting: {output!r}")
+            output += chunk
+        elapsed = (time.perf_counter() - start) * 1000
+        process.communicate(b"exit\n")
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best, 2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the start of the Bot.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=sorted(STARTUP_BUDGET["first_prompt_ms"]))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    report = measure_imports()
+    report["budget_ms"] = {"import": STARTUP_BUDGET["import_ms"]}
+    failed = report["import_ms"] > STARTUP_BUDGET["import_ms"]
+    report["first_prompt"] = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            book_file = os.path.join(tmp, f"book_{size}.json")
+            if size:
+                write_snapshot(book_file, size, args.seed)
+            elapsed = time_to_first_prompt(book_file)
+            budget = STARTUP_BUDGET["first_prompt_ms"].get(size)
+            failed = failed or (budget is not None and elapsed > budget)
+            report["first_prompt"].append({"size": size, "ms": elapsed, "budget_ms": budget})
+    report["within_budget"] = not failed
+    json.dump(report, sys.stdout, indent=2)
+    print()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""Multi-threaded benchmark of mixed read/write AddressBook workloads.
+
+Run from the finalHW directory:
+
+    python -m benchmarks.bench_threads --records 10000 --threads 8 --writes 0.1
+"""
+import argparse
+import random
+import threading
+import time
+
+from Classes.AddressBook import AddressBook
+from Classes.Record import Record
+from Classes.ThreadSafeAddressBook import ThreadSafeAddressBook
+from benchmarks.generator import generate_book
+
+
+def worker(book, names, write_ratio, deadline, seed, result):
+    """Run random operations against `book` until `deadline`."""
+    rng = random.Random(seed)
+    ops = errors = 0
+    try:
+        while time.perf_counter() < deadline:
+            name = names[rng.randrange(len(names))]
+            try:
+                if rng.random() < write_ratio:
+                    if rng.random() < 0.5:
+                        book.delete(name)
+                    else:
+                        book.add_record(Record(name))
+                else:
+                    choice = rng.random()
+                    if choice < 0.6:
+                        book.find_name(name)
+                    elif choice < 0.9:
+                        book.find(str(rng.randrange(100, 1000)))
+                    else:
+                        for _ in book.iterator(100):
+                            pass
+            except Exception:
+                # A race of unsynchronised threads: "dictionary changed size during
+                # iteration", a KeyError in AddressBook._publish, ...
+                errors += 1
+            ops += 1
+    finally:
+        # Every thread reports, even one that died
+        result.append((ops, errors))
+
+
+def run(book_cls, records, threads, write_ratio, duration):
+    """Run one workload and return a dict with its throughput figures."""
+    book = generate_book(records, book_cls=book_cls)
+    names = list(book.data)
+    result = []
+    deadline = time.perf_counter() + duration
+    pool = [
+        threading.Thread(target=worker, args=(book, names, write_ratio, deadline, seed, result))
+        for seed in range(threads)
+    ]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    ops = sum(r[0] for r in result)
+    errors = sum(r[1] for r in result)
+    return {
+        "book": book_cls.__name__,
+        "threads": threads,
+        "write_ratio": write_ratio,
+        "ops": ops,
+        "ops_per_sec": round(ops / duration, 1),
+        "errors": errors,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=10_000)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--writes", type=float, nargs="+", default=[0.01, 0.1, 0.5])
+    parser.add_argument("--duration", type=float, default=2.0)
+    args = parser.parse_args(argv)
+
+    print(f"{'BOOK':<22} | {'THREADS':>7} | {'WRITES':>6} | {'OPS/S':>10} | {'ERRORS':>6}")
+    print("_" * 62)
+    for book_cls in (AddressBook, ThreadSafeAddressBook):
+        for threads in args.threads:
+            for write_ratio in args.writes:
+                r = run(book_cls, args.records, threads, write_ratio, args.duration)
+                print(f"{r['book']:<22} | {r['threads']:>7} | {r['write_ratio']:>6} | "
+                      f"{r['ops_per_sec']:>10} | {r['errors']:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Deterministic synthetic address books for benchmarks.
+
+The same (size, seed) pair always produces the same contacts, so numbers
+from different runs and machines are comparable.
+
+    python -m benchmarks.generator 1000000 outputs/synthetic.json --seed 42
+"""
+import argparse
+import calendar
+import json
+import random
+
+from Classes.AddressBook import AddressBook
+from Classes.Record import Record
+from Utils.compression import open_snapshot
+
+FIRST_NAMES = (
+    "Oleksandr", "Andrii", "Serhii", "Dmytro", "Ivan", "Mykola", "Vasyl", "Petro",
+    "Olena", "Iryna", "Natalia", "Tetiana", "Oksana", "Yulia", "Maria", "Anna",
+    "Vlad", "Kostea", "Pietro", "Sergio", "Taras", "Bohdan", "Sofia", "Daryna",
+)
+LAST_NAMES = (
+    "Shevchenko", "Kovalenko", "Bondarenko", "Tkachenko", "Kravchenko", "Melnyk",
+    "Boiko", "Koval", "Oliinyk", "Lysenko", "Moroz", "Savchenko", "Rudenko",
+    "Marchenko", "Petrenko", "Siracenco", "Ponomarenko", "Levchenko",
+)
+# Mobile operator codes; most numbers in a real book share a handful of them.
+OPERATOR_CODES = ("050", "066", "095", "099", "067", "068", "096", "097", "098", "063", "073", "093")
+OPERATOR_WEIGHTS = (14, 8, 8, 6, 18, 8, 10, 10, 8, 4, 3, 3)
+# Share of contacts with 0, 1, 2 and 3 phone numbers.
+PHONE_COUNT_WEIGHTS = (3, 70, 20, 7)
+BIRTHDAY_SHARE = 0.8
+
+
+def _phone(rng):
+    code = rng.choices(OPERATOR_CODES, OPERATOR_WEIGHTS)[0]
+    return f"{code}{rng.randrange(10 ** 7):07d}"
+
+
+def _birthday(rng):
+    year = min(2015, max(1930, int(rng.gauss(1985, 15))))
+    month = rng.randint(1, 12)
+    day = rng.randint(1, calendar.monthrange(year, month)[1])
+    return f"{year:04d}-{month:02d}-{day:02d}"
+
+
+def generate_records(size, seed=0):
+    """Yield `size` synthetic contacts as plain data.
+
+    Names are unique; phone counts, operator codes and birth years follow
+    fixed distributions that resemble a real book.
+
+    Args:
+        size (int): Number of contacts.
+        seed (int): Random seed.
+
+    Yields:
+        tuple: (name, phones, birthday) with `phones` a list of ten digit
+        strings and `birthday` a 'YYYY-MM-DD' string or None.
+    """
+    rng = random.Random(seed)
+    for i in range(size):
+        name = f"{rng.choice(FIRST_NAMES)}_{rng.choice(LAST_NAMES)}_{i}"
+        count = rng.choices(range(len(PHONE_COUNT_WEIGHTS)), PHONE_COUNT_WEIGHTS)[0]
+        phones = [_phone(rng) for _ in range(count)]
+        birthday = _birthday(rng) if rng.random() < BIRTHDAY_SHARE else None
+        yield name, phones, birthday
+
+
+def generate_book(size, seed=0, book_cls=AddressBook):
+    """Build an address book of `size` synthetic contacts.
+
+    Args:
+        size (int): Number of contacts.
+        seed (int): Random seed.
+        book_cls (type): AddressBook class to instantiate.
+
+    Returns:
+        AddressBook: The generated book.
+    """
+    book = book_cls()
+    for name, phones, birthday in generate_records(size, seed):
+        record = Record(name, birthday)
+        for phone in phones:
+            record.add_phone(phone)
+        book.add_record(record)
+    return book
+
+
+def write_snapshot(file_name, size, seed=0):
+    """Write a synthetic book in the `save_to_file` format without building it in memory.
+
+    Args:
+        file_name (str): Output path; `.gz` and `.xz` files are compressed.
+        size (int): Number of contacts.
+        seed (int): Random seed.
+
+    Returns:
+        None
+    """
+    with open_snapshot(file_name, 'w') as f:
+        f.write("{")
+        for i, (name, phones, birthday) in enumerate(generate_records(size, seed)):
+            if i:
+                f.write(", ")
+            entry = {"name": name, "phones": phones, "birthday": birthday}
+            f.write(f"{json.dumps(name)}: {json.dumps(entry)}")
+        f.write("}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic address book snapshot.")
+    parser.add_argument("size", type=int)
+    parser.add_argument("file_name")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    write_snapshot(args.file_name, args.size, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -1 +1,2 @@
 from decorators.input_errors import input_errors
+from decorators.instrumented import instrumented
@@ -0,0 +1,40 @@
+import time
+from functools import wraps
+
+from Utils.metrics import registry
+
+
+def instrumented(command, metrics=registry):
+    """Decorator factory recording call count, errors and latency of a function.
+
+    Put it *under* `input_errors`, so exceptions are counted before
+    `input_errors` turns them into messages:
+
+        @input_errors
+        @instrumented("add")
+        def add_contact(self, name, *phones): ...
+
+    Args:
+        command (str): Name the calls are recorded under.
+        metrics (MetricsRegistry): Where to record them.
+
+    Returns:
+        function: The decorator.
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            error = False
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                error = True
+                raise
+            finally:
+                metrics.observe(command, time.perf_counter() - start, error)
+
+        return wrapper
+
+    return decorator